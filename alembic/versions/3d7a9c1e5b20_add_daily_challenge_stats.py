@@ -0,0 +1,68 @@
+"""add_daily_challenge_stats
+
+Revision ID: 3d7a9c1e5b20
+Revises: 8efe5849ed2b
+Create Date: 2026-10-19 09:12:44.118203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d7a9c1e5b20'
+down_revision: Union[str, None] = '8efe5849ed2b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _table_exists(table_name: str, schema: str = "public") -> bool:
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+    return table_name in insp.get_table_names(schema=schema)
+
+
+def upgrade() -> None:
+    # main.py hace create_all al arrancar: la tabla puede existir antes de migrar
+    if not _table_exists("daily_challenge_stats"):
+        op.create_table(
+            'daily_challenge_stats',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('challenge_id', sa.Integer(), nullable=False),
+            sa.Column('outcome', sa.String(), nullable=False),
+            sa.Column('attempts', sa.Integer(), nullable=False),
+            sa.Column('shard', sa.Integer(), nullable=False),
+            sa.Column('count', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['challenge_id'], ['daily_challenges.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('challenge_id', 'outcome', 'attempts', 'shard', name='uix_daily_stat_shard'),
+        )
+
+    if op.get_bind().dialect.name != "postgresql":
+        return
+
+    # Backfill de los días ya jugados en el shard 0, sólo sobre una tabla vacía: si create_all
+    # la creó antes y ya recibió incrementos, sumar los intentos crudos los contaría dos veces
+    if op.get_bind().execute(sa.text("SELECT 1 FROM daily_challenge_stats LIMIT 1")).first():
+        return
+    op.execute("""
+        INSERT INTO daily_challenge_stats (challenge_id, outcome, attempts, shard, count)
+        SELECT challenge_id, 'started', 0, 0, COUNT(*)
+        FROM daily_attempts
+        GROUP BY challenge_id
+        UNION ALL
+        SELECT challenge_id, 'solved', attempts_used, 0, COUNT(*)
+        FROM daily_attempts WHERE solved
+        GROUP BY challenge_id, attempts_used
+        UNION ALL
+        SELECT challenge_id, 'failed', attempts_used, 0, COUNT(*)
+        FROM daily_attempts WHERE failed AND NOT solved
+        GROUP BY challenge_id, attempts_used
+    """)
+
+
+def downgrade() -> None:
+    if _table_exists("daily_challenge_stats"):
+        op.drop_table('daily_challenge_stats')
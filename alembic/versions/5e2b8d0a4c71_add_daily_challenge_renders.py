@@ -0,0 +1,46 @@
+"""add_daily_challenge_renders
+
+Revision ID: 5e2b8d0a4c71
+Revises: 3d7a9c1e5b20
+Create Date: 2026-10-19 11:03:27.540912
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e2b8d0a4c71'
+down_revision: Union[str, None] = '3d7a9c1e5b20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _table_exists(table_name: str, schema: str = "public") -> bool:
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+    return table_name in insp.get_table_names(schema=schema)
+
+
+def upgrade() -> None:
+    if not _table_exists("daily_challenge_renders"):
+        op.create_table(
+            'daily_challenge_renders',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('challenge_id', sa.Integer(), nullable=False),
+            sa.Column('reveal_level', sa.Integer(), nullable=False),
+            sa.Column('max_level', sa.Integer(), nullable=False),
+            sa.Column('render_version', sa.Integer(), nullable=False),
+            sa.Column('image_bytes', sa.LargeBinary(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['challenge_id'], ['daily_challenges.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('challenge_id', 'reveal_level', 'max_level', 'render_version', name='uix_daily_render_level'),
+        )
+
+
+def downgrade() -> None:
+    if _table_exists("daily_challenge_renders"):
+        op.drop_table('daily_challenge_renders')
@@ -0,0 +1,116 @@
+"""daily_retention_and_guess_partitions
+
+Revision ID: 7b41f0c2d9e8
+Revises: 5e2b8d0a4c71
+Create Date: 2026-10-19 13:40:05.271554
+
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b41f0c2d9e8'
+down_revision: Union[str, None] = '5e2b8d0a4c71'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Particiones mensuales que se crean por adelantado; después las mantiene `manage.py retention`
+MONTHS_AHEAD = 2
+
+
+def _add_months(d: date, months: int) -> date:
+    month_index = d.year * 12 + (d.month - 1) + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def _index_exists(table_name: str, index_name: str, schema: str = "public") -> bool:
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+    return index_name in {i["name"] for i in insp.get_indexes(table_name, schema=schema)}
+
+
+def upgrade() -> None:
+    if not _index_exists("daily_attempts", "ix_daily_attempts_anon_updated_at"):
+        op.create_index(
+            'ix_daily_attempts_anon_updated_at', 'daily_attempts', ['updated_at'],
+            unique=False, postgresql_where=sa.text('user_id IS NULL'),
+        )
+
+    if op.get_bind().dialect.name != "postgresql":
+        if not _index_exists("daily_guesses", "ix_daily_guesses_attempt_id"):
+            op.create_index('ix_daily_guesses_attempt_id', 'daily_guesses', ['attempt_id'], unique=False)
+        return
+
+    # daily_guesses pasa a estar particionada por mes (created_at) para poder soltar meses viejos
+    # con DETACH PARTITION en lugar de DELETE. La PK tiene que incluir la clave de partición.
+    op.execute("ALTER TABLE daily_guesses RENAME TO daily_guesses_legacy")
+    op.execute("ALTER INDEX daily_guesses_pkey RENAME TO daily_guesses_legacy_pkey")
+    op.execute("ALTER SEQUENCE daily_guesses_id_seq OWNED BY NONE")
+    op.execute("""
+        CREATE TABLE daily_guesses (
+            id INTEGER NOT NULL DEFAULT nextval('daily_guesses_id_seq'),
+            attempt_id INTEGER NOT NULL REFERENCES daily_attempts (id),
+            guess_text VARCHAR NOT NULL,
+            is_correct BOOLEAN NOT NULL,
+            attempt_number INTEGER NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute("CREATE TABLE daily_guesses_default PARTITION OF daily_guesses DEFAULT")
+
+    first = op.get_bind().execute(sa.text("SELECT MIN(created_at) FROM daily_guesses_legacy")).scalar()
+    month = (first.date() if first else date.today()).replace(day=1)
+    last = _add_months(date.today().replace(day=1), MONTHS_AHEAD)
+    while month <= last:
+        op.execute(
+            f"CREATE TABLE daily_guesses_y{month.year:04d}m{month.month:02d} PARTITION OF daily_guesses "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+        )
+        month = _add_months(month, 1)
+
+    op.execute("""
+        INSERT INTO daily_guesses (id, attempt_id, guess_text, is_correct, attempt_number, created_at)
+        SELECT id, attempt_id, guess_text, is_correct, attempt_number,
+               COALESCE(created_at, now() AT TIME ZONE 'utc')
+        FROM daily_guesses_legacy
+    """)
+    op.execute("DROP TABLE daily_guesses_legacy")
+    op.execute("ALTER SEQUENCE daily_guesses_id_seq OWNED BY daily_guesses.id")
+    op.create_index('ix_daily_guesses_id', 'daily_guesses', ['id'], unique=False)
+    op.create_index('ix_daily_guesses_attempt_id', 'daily_guesses', ['attempt_id'], unique=False)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("ALTER TABLE daily_guesses RENAME TO daily_guesses_partitioned")
+        op.execute("ALTER INDEX daily_guesses_pkey RENAME TO daily_guesses_partitioned_pkey")
+        op.execute("ALTER SEQUENCE daily_guesses_id_seq OWNED BY NONE")
+        op.execute("""
+            CREATE TABLE daily_guesses (
+                id INTEGER NOT NULL DEFAULT nextval('daily_guesses_id_seq') PRIMARY KEY,
+                attempt_id INTEGER NOT NULL REFERENCES daily_attempts (id),
+                guess_text VARCHAR NOT NULL,
+                is_correct BOOLEAN NOT NULL,
+                attempt_number INTEGER NOT NULL,
+                created_at TIMESTAMP WITHOUT TIME ZONE
+            )
+        """)
+        op.execute("""
+            INSERT INTO daily_guesses (id, attempt_id, guess_text, is_correct, attempt_number, created_at)
+            SELECT id, attempt_id, guess_text, is_correct, attempt_number, created_at
+            FROM daily_guesses_partitioned
+        """)
+        # Borra también todas las particiones
+        op.execute("DROP TABLE daily_guesses_partitioned")
+        op.execute("ALTER SEQUENCE daily_guesses_id_seq OWNED BY daily_guesses.id")
+        op.create_index('ix_daily_guesses_id', 'daily_guesses', ['id'], unique=False)
+    elif _index_exists("daily_guesses", "ix_daily_guesses_attempt_id"):
+        op.drop_index('ix_daily_guesses_attempt_id', table_name='daily_guesses')
+
+    if _index_exists("daily_attempts", "ix_daily_attempts_anon_updated_at"):
+        op.drop_index('ix_daily_attempts_anon_updated_at', table_name='daily_attempts')
@@ -0,0 +1,102 @@
+"""add_daily_streaks
+
+Revision ID: 9c3e5a7f1d42
+Revises: 7b41f0c2d9e8
+Create Date: 2026-10-19 15:22:48.903117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c3e5a7f1d42'
+down_revision: Union[str, None] = '7b41f0c2d9e8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _table_exists(table_name: str, schema: str = "public") -> bool:
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+    return table_name in insp.get_table_names(schema=schema)
+
+
+def upgrade() -> None:
+    if not _table_exists("daily_streaks"):
+        op.create_table(
+            'daily_streaks',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=True),
+            sa.Column('anonymous_id', sa.String(), nullable=True),
+            sa.Column('current_streak', sa.Integer(), nullable=False),
+            sa.Column('best_streak', sa.Integer(), nullable=False),
+            sa.Column('last_solved_date', sa.Date(), nullable=True),
+            sa.Column('last_played_date', sa.Date(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('user_id'),
+            sa.UniqueConstraint('anonymous_id'),
+        )
+
+    if op.get_bind().dialect.name != "postgresql":
+        return
+
+    # Backfill único desde el historial (gaps & islands sobre los días resueltos);
+    # a partir de acá submit_guess mantiene las rachas de forma incremental.
+    op.execute("""
+        WITH played AS (
+            SELECT a.user_id,
+                   CASE WHEN a.user_id IS NULL THEN a.anonymous_id END AS anonymous_id,
+                   c.date,
+                   a.solved
+            FROM daily_attempts a
+            JOIN daily_challenges c ON c.id = a.challenge_id
+            WHERE a.solved OR a.failed
+        ),
+        solved AS (
+            SELECT user_id, anonymous_id, date,
+                   date - (ROW_NUMBER() OVER (PARTITION BY user_id, anonymous_id ORDER BY date))::int AS grp
+            FROM played
+            WHERE solved
+        ),
+        runs AS (
+            SELECT user_id, anonymous_id, COUNT(*) AS len, MAX(date) AS run_end
+            FROM solved
+            GROUP BY user_id, anonymous_id, grp
+        ),
+        summary AS (
+            SELECT user_id, anonymous_id,
+                   MAX(date) AS last_played,
+                   MAX(date) FILTER (WHERE solved) AS last_solved
+            FROM played
+            GROUP BY user_id, anonymous_id
+        )
+        INSERT INTO daily_streaks (user_id, anonymous_id, current_streak, best_streak,
+                                   last_solved_date, last_played_date, updated_at)
+        SELECT s.user_id, s.anonymous_id,
+               COALESCE((
+                   SELECT r.len FROM runs r
+                   WHERE r.user_id IS NOT DISTINCT FROM s.user_id
+                     AND r.anonymous_id IS NOT DISTINCT FROM s.anonymous_id
+                     AND r.run_end = s.last_solved
+                     AND s.last_played = s.last_solved
+               ), 0),
+               COALESCE((
+                   SELECT MAX(r.len) FROM runs r
+                   WHERE r.user_id IS NOT DISTINCT FROM s.user_id
+                     AND r.anonymous_id IS NOT DISTINCT FROM s.anonymous_id
+               ), 0),
+               s.last_solved, s.last_played, now() AT TIME ZONE 'utc'
+        FROM summary s
+        WHERE s.user_id IS NOT NULL OR s.anonymous_id IS NOT NULL
+        ON CONFLICT DO NOTHING
+    """)
+
+
+def downgrade() -> None:
+    if _table_exists("daily_streaks"):
+        op.drop_table('daily_streaks')
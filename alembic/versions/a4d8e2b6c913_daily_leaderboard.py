@@ -0,0 +1,58 @@
+"""daily_leaderboard
+
+Revision ID: a4d8e2b6c913
+Revises: 9c3e5a7f1d42
+Create Date: 2026-10-19 16:05:12.418730
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4d8e2b6c913'
+down_revision: Union[str, None] = '9c3e5a7f1d42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _column_exists(table_name: str, column_name: str, schema: str = "public") -> bool:
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+    return column_name in {c["name"] for c in insp.get_columns(table_name, schema=schema)}
+
+
+def _index_exists(table_name: str, index_name: str, schema: str = "public") -> bool:
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+    return index_name in {i["name"] for i in insp.get_indexes(table_name, schema=schema)}
+
+
+def upgrade() -> None:
+    if not _column_exists("daily_attempts", "solve_seconds"):
+        op.add_column('daily_attempts', sa.Column('solve_seconds', sa.Integer(), nullable=True))
+
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("""
+            UPDATE daily_attempts
+            SET solve_seconds = GREATEST(0, EXTRACT(EPOCH FROM solved_at - created_at))::int
+            WHERE solved AND solved_at IS NOT NULL AND solve_seconds IS NULL
+        """)
+
+    if not _index_exists("daily_attempts", "ix_daily_attempts_leaderboard"):
+        op.create_index(
+            'ix_daily_attempts_leaderboard', 'daily_attempts',
+            ['challenge_id', 'attempts_used', 'solve_seconds', 'id'],
+            unique=False,
+            postgresql_where=sa.text('solved AND user_id IS NOT NULL'),
+            postgresql_include=['user_id'],
+        )
+
+
+def downgrade() -> None:
+    if _index_exists("daily_attempts", "ix_daily_attempts_leaderboard"):
+        op.drop_index('ix_daily_attempts_leaderboard', table_name='daily_attempts')
+    if _column_exists("daily_attempts", "solve_seconds"):
+        op.drop_column('daily_attempts', 'solve_seconds')
@@ -0,0 +1,43 @@
+"""daily_guess_distance_feedback
+
+Revision ID: b7e1c5a9d024
+Revises: a4d8e2b6c913
+Create Date: 2026-10-19 16:48:31.092615
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e1c5a9d024'
+down_revision: Union[str, None] = 'a4d8e2b6c913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = (
+    ('guess_code', sa.String()),
+    ('distance_km', sa.Integer()),
+    ('bearing', sa.Integer()),
+)
+
+
+def _column_exists(table_name: str, column_name: str, schema: str = "public") -> bool:
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+    return column_name in {c["name"] for c in insp.get_columns(table_name, schema=schema)}
+
+
+def upgrade() -> None:
+    # En Postgres daily_guesses está particionada: ADD COLUMN en la tabla padre alcanza a todas las particiones
+    for name, type_ in COLUMNS:
+        if not _column_exists("daily_guesses", name):
+            op.add_column('daily_guesses', sa.Column(name, type_, nullable=True))
+
+
+def downgrade() -> None:
+    for name, _ in reversed(COLUMNS):
+        if _column_exists("daily_guesses", name):
+            op.drop_column('daily_guesses', name)
@@ -0,0 +1,65 @@
+"""ranking_composite_indexes
+
+Revision ID: c2f6a8d1e357
+Revises: b7e1c5a9d024
+Create Date: 2026-10-19 17:32:10.554081
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c2f6a8d1e357'
+down_revision: Union[str, None] = 'b7e1c5a9d024'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _index_exists(table_name: str, index_name: str, schema: str = "public") -> bool:
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+    return index_name in {i["name"] for i in insp.get_indexes(table_name, schema=schema)}
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        # CONCURRENTLY para no bloquear escrituras de scores mientras se construyen
+        with op.get_context().autocommit_block():
+            op.execute("""
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_overall_scores_region_rank
+                ON overall_score_table (region_key, max_score DESC, date_max_score)
+                INCLUDE (user_id, country_code)
+            """)
+            op.execute("""
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_overall_scores_country_rank
+                ON overall_score_table (region_key, country_code, max_score DESC, date_max_score)
+                INCLUDE (user_id)
+            """)
+            # Prefijo de los dos índices nuevos: ya no aporta y cuesta en cada escritura
+            op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_overall_score_table_region_key")
+        return
+
+    if not _index_exists("overall_score_table", "ix_overall_scores_region_rank"):
+        op.create_index(
+            'ix_overall_scores_region_rank', 'overall_score_table',
+            ['region_key', sa.text('max_score DESC'), 'date_max_score'], unique=False,
+        )
+    if not _index_exists("overall_score_table", "ix_overall_scores_country_rank"):
+        op.create_index(
+            'ix_overall_scores_country_rank', 'overall_score_table',
+            ['region_key', 'country_code', sa.text('max_score DESC'), 'date_max_score'], unique=False,
+        )
+    if _index_exists("overall_score_table", "ix_overall_score_table_region_key"):
+        op.drop_index('ix_overall_score_table_region_key', table_name='overall_score_table')
+
+
+def downgrade() -> None:
+    if not _index_exists("overall_score_table", "ix_overall_score_table_region_key"):
+        op.create_index('ix_overall_score_table_region_key', 'overall_score_table', ['region_key'], unique=False)
+    if _index_exists("overall_score_table", "ix_overall_scores_country_rank"):
+        op.drop_index('ix_overall_scores_country_rank', table_name='overall_score_table')
+    if _index_exists("overall_score_table", "ix_overall_scores_region_rank"):
+        op.drop_index('ix_overall_scores_region_rank', table_name='overall_score_table')
@@ -0,0 +1,105 @@
+"""score_events_and_window_bests
+
+Revision ID: d5a1f7c3e82b
+Revises: c2f6a8d1e357
+Create Date: 2026-10-19 18:21:47.903112
+
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5a1f7c3e82b'
+down_revision: Union[str, None] = 'c2f6a8d1e357'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Particiones mensuales que se crean por adelantado; después las mantiene `manage.py retention`
+MONTHS_AHEAD = 2
+
+
+def _add_months(d: date, months: int) -> date:
+    month_index = d.year * 12 + (d.month - 1) + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def _table_exists(table_name: str, schema: str = "public") -> bool:
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+    return table_name in insp.get_table_names(schema=schema)
+
+
+def upgrade() -> None:
+    if not _table_exists("score_events"):
+        if op.get_bind().dialect.name == "postgresql":
+            # Particionada por mes: el historial viejo se suelta con DETACH PARTITION.
+            # La PK tiene que incluir la clave de partición.
+            op.execute("""
+                CREATE TABLE score_events (
+                    id BIGSERIAL NOT NULL,
+                    user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+                    region_key VARCHAR NOT NULL,
+                    country_code VARCHAR,
+                    score INTEGER NOT NULL,
+                    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+                    PRIMARY KEY (id, created_at)
+                ) PARTITION BY RANGE (created_at)
+            """)
+            op.execute("CREATE TABLE score_events_default PARTITION OF score_events DEFAULT")
+            month = date.today().replace(day=1)
+            for offset in range(MONTHS_AHEAD + 1):
+                start = _add_months(month, offset)
+                op.execute(
+                    f"CREATE TABLE score_events_y{start.year:04d}m{start.month:02d} PARTITION OF score_events "
+                    f"FOR VALUES FROM ('{start.isoformat()}') TO ('{_add_months(start, 1).isoformat()}')"
+                )
+        else:
+            op.create_table(
+                'score_events',
+                sa.Column('id', sa.Integer(), nullable=False),
+                sa.Column('user_id', sa.Integer(), nullable=False),
+                sa.Column('region_key', sa.String(), nullable=False),
+                sa.Column('country_code', sa.String(), nullable=True),
+                sa.Column('score', sa.Integer(), nullable=False),
+                sa.Column('created_at', sa.DateTime(), nullable=False),
+                sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+                sa.PrimaryKeyConstraint('id'),
+            )
+        op.create_index('ix_score_events_user_created', 'score_events', ['user_id', 'created_at'], unique=False)
+
+    if not _table_exists("score_window_bests"):
+        # Arranca vacía: overall_score_table no guarda historial del que reconstruir los períodos
+        op.create_table(
+            'score_window_bests',
+            sa.Column('period', sa.String(), nullable=False),
+            sa.Column('period_start', sa.Date(), nullable=False),
+            sa.Column('region_key', sa.String(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('country_code', sa.String(), nullable=True),
+            sa.Column('best_score', sa.Integer(), nullable=False),
+            sa.Column('date_best', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('period', 'period_start', 'region_key', 'user_id'),
+        )
+        op.create_index(
+            'ix_score_window_bests_rank', 'score_window_bests',
+            ['period', 'period_start', 'region_key', sa.text('best_score DESC'), 'date_best'],
+            unique=False, postgresql_include=['user_id', 'country_code'],
+        )
+        op.create_index(
+            'ix_score_window_bests_country_rank', 'score_window_bests',
+            ['period', 'period_start', 'region_key', 'country_code', sa.text('best_score DESC'), 'date_best'],
+            unique=False, postgresql_include=['user_id'],
+        )
+
+
+def downgrade() -> None:
+    if _table_exists("score_window_bests"):
+        op.drop_table('score_window_bests')
+    if _table_exists("score_events"):
+        # En Postgres borra también todas las particiones
+        op.drop_table('score_events')
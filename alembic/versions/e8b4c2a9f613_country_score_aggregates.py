@@ -0,0 +1,69 @@
+"""country_score_aggregates
+
+Revision ID: e8b4c2a9f613
+Revises: d5a1f7c3e82b
+Create Date: 2026-10-19 21:04:12.518330
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8b4c2a9f613'
+down_revision: Union[str, None] = 'd5a1f7c3e82b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Tiene que coincidir con settings.COUNTRY_TOP_K; si no, `manage.py rebuild-aggregates`
+COUNTRY_TOP_K = 10
+
+
+def _table_exists(table_name: str, schema: str = "public") -> bool:
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+    return table_name in insp.get_table_names(schema=schema)
+
+
+def upgrade() -> None:
+    if not _table_exists("country_score_aggregates"):
+        op.create_table(
+            'country_score_aggregates',
+            sa.Column('country_code', sa.String(), nullable=False),
+            sa.Column('shard', sa.Integer(), nullable=False),
+            sa.Column('player_count', sa.Integer(), nullable=False),
+            sa.Column('score_sum', sa.BigInteger(), nullable=False),
+            sa.Column('top_k_sum', sa.BigInteger(), nullable=False),
+            sa.Column('top_k_count', sa.Integer(), nullable=False),
+            sa.Column('top_k_min', sa.Integer(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('country_code', 'shard'),
+        )
+        # Backfill en una pasada al shard 0, igual que scores_repo.rebuild_country_aggregates
+        op.execute(f"""
+            INSERT INTO country_score_aggregates
+                (country_code, shard, player_count, score_sum, top_k_sum, top_k_count, top_k_min, updated_at)
+            SELECT country_code,
+                   0,
+                   COUNT(*),
+                   SUM(max_score),
+                   SUM(CASE WHEN pos <= {COUNTRY_TOP_K} THEN max_score ELSE 0 END),
+                   SUM(CASE WHEN pos <= {COUNTRY_TOP_K} THEN 1 ELSE 0 END),
+                   MIN(CASE WHEN pos <= {COUNTRY_TOP_K} THEN max_score END),
+                   CURRENT_TIMESTAMP
+            FROM (
+                SELECT country_code, max_score,
+                       ROW_NUMBER() OVER (PARTITION BY country_code ORDER BY max_score DESC) AS pos
+                FROM overall_score_table
+                WHERE region_key = 'career' AND country_code IS NOT NULL AND country_code <> ''
+                  AND max_score IS NOT NULL
+            ) ranked
+            GROUP BY country_code
+        """)
+
+
+def downgrade() -> None:
+    if _table_exists("country_score_aggregates"):
+        op.drop_table('country_score_aggregates')
@@ -0,0 +1,53 @@
+"""region_player_counts
+
+Revision ID: f3c9d6b1a472
+Revises: e8b4c2a9f613
+Create Date: 2026-10-19 22:37:05.114208
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3c9d6b1a472'
+down_revision: Union[str, None] = 'e8b4c2a9f613'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _table_exists(table_name: str, schema: str = "public") -> bool:
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+    return table_name in insp.get_table_names(schema=schema)
+
+
+def upgrade() -> None:
+    if not _table_exists("region_player_counts"):
+        op.create_table(
+            'region_player_counts',
+            sa.Column('region_key', sa.String(), nullable=False),
+            sa.Column('country_code', sa.String(), nullable=False),
+            sa.Column('player_count', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('region_key', 'country_code'),
+        )
+        # Backfill igual que scores_repo.rebuild_player_counts; country_code '' = toda la región
+        op.execute("""
+            INSERT INTO region_player_counts (region_key, country_code, player_count)
+            SELECT region_key, '', COUNT(*)
+            FROM overall_score_table
+            WHERE max_score IS NOT NULL
+            GROUP BY region_key
+            UNION ALL
+            SELECT region_key, country_code, COUNT(*)
+            FROM overall_score_table
+            WHERE max_score IS NOT NULL AND country_code IS NOT NULL AND country_code <> ''
+            GROUP BY region_key, country_code
+        """)
+
+
+def downgrade() -> None:
+    if _table_exists("region_player_counts"):
+        op.drop_table('region_player_counts')
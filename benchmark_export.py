@@ -0,0 +1,120 @@
+"""
+Full-leaderboard export: the streaming /admin/exports/scores path (server-side cursor,
+constant memory) against paging through the ranking with OFFSET, as clients did before.
+
+    python benchmark_export.py                      # 1M jugadores, SQLite en memoria
+    python benchmark_export.py --url postgresql+psycopg2://... --players 1000000
+
+The database at --url is seeded with throwaway tables: don't point it at a real one.
+Paging the whole ranking is quadratic, so it only runs for the first --paged-rows rows;
+the deepest page is timed on its own to show what the last calls of a full crawl cost.
+`--trace-memory` adds a tracemalloc pass per format to show the export's flat memory.
+"""
+import argparse
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from db import database, models
+from repository import scores_repo
+from schemas.score import ExportFormat
+
+COUNTRIES = ["URY", "ARG", "BRA", "CHL", "ESP", "MEX", "COL", "PER"]
+
+
+def seed(engine, players: int):
+    database.Base.metadata.drop_all(bind=engine)
+    database.Base.metadata.create_all(bind=engine)
+    rng = random.Random(42)
+    t0 = datetime(2026, 1, 1)
+    with engine.begin() as conn:
+        for start in range(0, players, 20000):
+            ids = range(start + 1, min(start + 20000, players) + 1)
+            countries = {i: rng.choice(COUNTRIES) for i in ids}
+            conn.execute(insert(models.User), [
+                {"id": i, "username": f"player{i:07d}", "email": f"player{i}@example.com",
+                 "country": countries[i], "onboarding_completed": True}
+                for i in ids
+            ])
+            conn.execute(insert(models.OverallScoreTable), [
+                {"user_id": i, "max_score": rng.randint(0, 5000), "last_score": 0,
+                 "date_max_score": t0 + timedelta(minutes=rng.randint(0, 400000)),
+                 "region_key": "career", "country_code": countries[i]}
+                for i in ids
+            ])
+
+
+def stream(db, fmt: ExportFormat, batch_size: int, trace_memory: bool = False) -> tuple[int, int, float, int | None]:
+    """(rows, bytes, seconds, peak traced memory) for a full export."""
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    rows = size = 0
+    for chunk in scores_repo.export_ranking(db, "career", None, fmt, batch_size):
+        rows += chunk.count("\n")
+        size += len(chunk.encode("utf-8"))
+    elapsed = time.perf_counter() - start
+    peak = None
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    if fmt == ExportFormat.csv:
+        rows -= 1  # cabecera
+    return rows, size, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="sqlite://")
+    parser.add_argument("--players", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--paged-rows", type=int, default=20000)
+    parser.add_argument("--trace-memory", action="store_true", help="Extra pass per format under tracemalloc (several times slower)")
+    args = parser.parse_args()
+
+    if args.url.startswith("sqlite"):
+        engine = create_engine(args.url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    else:
+        engine = create_engine(args.url)
+    start = time.perf_counter()
+    seed(engine, args.players)
+    print(f"seeded {args.players} players in {time.perf_counter() - start:.1f}s")
+
+    db = sessionmaker(bind=engine)()
+    try:
+        for fmt in ExportFormat:
+            rows, size, elapsed, _ = stream(db, fmt, args.batch_size)
+            assert rows == args.players, f"exported {rows} rows"
+            print(
+                f"{'stream ' + fmt.value:>14}: {rows} rows  {size / 2**20:.1f} MiB  {elapsed:.2f}s  "
+                f"{rows / elapsed:,.0f} rows/s"
+            )
+            if args.trace_memory:
+                *_, peak = stream(db, fmt, args.batch_size, trace_memory=True)
+                print(f"{'':>14}  peak traced memory {peak / 2**20:.1f} MiB")
+
+        start = time.perf_counter()
+        for offset in range(0, min(args.paged_rows, args.players), args.page_size):
+            scores_repo.get_public_ranking(db, limit=args.page_size, offset=offset)
+        elapsed = time.perf_counter() - start
+        pages = -(-min(args.paged_rows, args.players) // args.page_size)
+        print(f"{'offset paging':>14}: first {pages} pages in {elapsed:.2f}s ({elapsed / pages * 1000:.1f}ms/page)")
+
+        start = time.perf_counter()
+        scores_repo.get_public_ranking(db, limit=args.page_size, offset=max(args.players - args.page_size, 0))
+        deepest = time.perf_counter() - start
+        total_pages = -(-args.players // args.page_size)
+        print(f"{'last page':>14}: {deepest * 1000:.1f}ms (a full crawl needs {total_pages} calls)")
+    finally:
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
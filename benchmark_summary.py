@@ -0,0 +1,133 @@
+"""
+Latency of /scores/summary: the previous sequential composition (top lists, two rank
+lookups and the best score, ~8 queries) against the single-statement `get_summary`.
+
+    python benchmark_summary.py                      # SQLite en memoria
+    python benchmark_summary.py --url postgresql+psycopg2://... --players 50000
+
+The database at --url is seeded with throwaway tables: don't point it at a real one.
+Round-trip latency is what the rewrite saves, so numbers against a remote Postgres are the
+meaningful ones; `--latency-ms` simulates it locally by sleeping before each statement.
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from config import settings
+from db import database, models
+from repository import scores_repo
+from schemas.score import ScoreScope
+
+COUNTRIES = ["URY", "ARG", "BRA", "CHL", "ESP", "MEX", "USA", "FRA"]
+
+
+def sequential_summary(db, current_user):
+    """The pre-rewrite implementation, kept here only as the baseline."""
+    global_top = scores_repo.get_region_scores(db, "career", limit=10)
+    country_top = scores_repo.get_country_scores(db, current_user.country, limit=10) if current_user.country else []
+    user_positions = {
+        "global": scores_repo.get_user_rank(db, current_user.id, ScoreScope.global_scope),
+        "country": scores_repo.get_user_rank(db, current_user.id, ScoreScope.country, current_user.country)
+        if current_user.country else None,
+    }
+    user_best = scores_repo.get_user_best_score(db, current_user.id, "career")
+    return {
+        "global_top": global_top,
+        "country_top": country_top,
+        "user_positions": user_positions,
+        "user_best": {
+            "max_score": user_best.max_score if user_best else 0,
+            "rank": user_positions["global"]["rank"] if user_positions["global"] else None,
+        },
+    }
+
+
+def seed(engine, players: int):
+    database.Base.metadata.drop_all(bind=engine)
+    database.Base.metadata.create_all(bind=engine)
+    rng = random.Random(42)
+    t0 = datetime(2026, 1, 1)
+    with engine.begin() as conn:
+        for start in range(0, players, 5000):
+            ids = range(start + 1, min(start + 5000, players) + 1)
+            countries = {i: rng.choice(COUNTRIES) for i in ids}
+            conn.execute(insert(models.User), [
+                {"id": i, "username": f"player{i:06d}", "email": f"player{i}@example.com",
+                 "country": countries[i], "onboarding_completed": True}
+                for i in ids
+            ])
+            conn.execute(insert(models.OverallScoreTable), [
+                {"user_id": i, "max_score": rng.randint(0, 5000), "last_score": 0,
+                 "date_max_score": t0 + timedelta(minutes=rng.randint(0, 400000)),
+                 "region_key": "career", "country_code": countries[i]}
+                for i in ids
+            ])
+    # Los totales salen de region_player_counts
+    db = sessionmaker(bind=engine)()
+    try:
+        scores_repo.rebuild_player_counts(db)
+    finally:
+        db.close()
+
+
+def measure(fn, runs: int) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="sqlite://")
+    parser.add_argument("--players", type=int, default=20000)
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Simulated network round trip per statement")
+    args = parser.parse_args()
+
+    if args.url.startswith("sqlite"):
+        engine = create_engine(args.url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    else:
+        engine = create_engine(args.url)
+    seed(engine, args.players)
+
+    statements = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def round_trip(*_):
+        statements.append(1)
+        if args.latency_ms:
+            time.sleep(args.latency_ms / 1000)
+
+    # Medimos el camino SQL: con el índice en memoria los conteos ni siquiera llegan a la base
+    settings.RANK_INDEX_ENABLED = False
+    db = sessionmaker(bind=engine)()
+    try:
+        user = db.get(models.User, args.players // 2)
+        assert sequential_summary(db, user) == scores_repo.get_summary(db, user), "results differ"
+
+        for name, fn in (("sequential", sequential_summary), ("single query", scores_repo.get_summary)):
+            statements.clear()
+            fn(db, user)
+            queries = len(statements)
+            timings = measure(lambda: fn(db, user), args.runs)
+            print(
+                f"{name:>12}: {queries} queries  "
+                f"p50={statistics.median(timings):.2f}ms  "
+                f"p95={statistics.quantiles(timings, n=20)[18]:.2f}ms"
+            )
+    finally:
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
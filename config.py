@@ -33,6 +33,39 @@ class Settings(BaseSettings):
 
     # Daily Challenge
     DAILY_MAX_ATTEMPTS: int = 4
+    DAILY_STATS_SHARDS: int = 8  # filas contador por (reto, resultado) para evitar contención
+    FLAG_RENDER_CACHE_SIZE: int = 64  # renders de bandera en memoria (fecha, nivel)
+    SHARE_CARD_CACHE_SIZE: int = 128  # renders de share card en memoria (fecha, patrón)
+    DAILY_LEADERBOARD_SIZE: int = 50  # tamaño de la página top que se cachea por reto
+    DAILY_LEADERBOARD_CACHE_TTL: int = 30  # segundos; acota lo desfasados que quedan otros workers
+
+    # Ranking en memoria (utils/rank_index.py); con varios workers cada uno se reconstruye cada N segundos
+    RANK_INDEX_ENABLED: bool = True
+    RANK_INDEX_REFRESH_SECONDS: int = 300
+    SCORE_HISTOGRAM_MAX: int = 2000  # dominio del histograma de /scores/distribution (tope de career)
+    RANKING_CACHE_SIZE: int = 512  # páginas de /scores/ y /overall-scores ya serializadas
+    RANKING_CACHE_TTL: int = 30  # segundos; save_score invalida sólo en su worker
+    RANK_BATCH_MAX_USERS: int = 100  # user_ids por llamada a POST /scores/ranks
+    COUNTRY_TOP_K: int = 10  # mejores récords por país que suma /scores/countries
+    COUNTRY_AGGREGATE_SHARDS: int = 8  # filas por país en country_score_aggregates (contención en submits)
+    COUNTRY_LEADERBOARD_CACHE_TTL: int = 60
+
+    # Write-behind de POST /scores/: se encola, se fusiona por (usuario, región) y se escribe en lotes
+    SCORE_WRITE_BEHIND: bool = False
+    SCORE_FLUSH_INTERVAL_SECONDS: float = 1.0
+    SCORE_FLUSH_BATCH_SIZE: int = 500
+    SCORE_SPOOL_PATH: str = "logs/score_spool.jsonl"  # lo que no se pudo escribir al apagar
+
+    # Endpoints /admin: header X-Admin-Key; sin clave configurada quedan deshabilitados
+    ADMIN_API_KEY: SecretStr | None = None
+    EXPORT_BATCH_SIZE: int = 5000  # filas por fetch del cursor de servidor en /admin/exports
+
+    # Retención (python manage.py retention)
+    DAILY_ANON_RETENTION_DAYS: int = 30
+    RETENTION_BATCH_SIZE: int = 1000
+    DAILY_GUESSES_RETENTION_MONTHS: int | None = None  # None = no borrar particiones de guesses
+    SCORE_EVENTS_RETENTION_MONTHS: int | None = None  # None = historial de partidas completo
+    SCORE_WINDOW_RETENTION_DAYS: int | None = 400  # filas de score_window_bests de períodos viejos
 
     @field_validator("DATABASE_URL")
     @classmethod
@@ -1,9 +1,22 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, LargeBinary, Date, DateTime, Float, UniqueConstraint
-from sqlalchemy.orm import relationship
+from sqlalchemy import BigInteger, Boolean, Column, ForeignKey, Integer, String, LargeBinary, Date, DateTime, Float, UniqueConstraint, Index, Sequence, and_
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import relationship, deferred
+from sqlalchemy.schema import PrimaryKeyConstraint
 from datetime import datetime
 
 from db import database
 
+
+@compiles(PrimaryKeyConstraint, "sqlite")
+def _sqlite_rowid_primary_key(constraint, compiler, **kw):
+    # Las tablas particionadas tienen PK (id, created_at), pero SQLite sólo autoincrementa
+    # una INTEGER PRIMARY KEY sola: en los tests `id` es el rowid, único por sí mismo
+    rowid = constraint.table.info.get("sqlite_rowid")
+    if rowid:
+        return f"PRIMARY KEY ({rowid})"
+    return compiler.visit_primary_key_constraint(constraint, **kw)
+
+
 class User(database.Base):
     __tablename__ = "users"
 
@@ -29,16 +42,109 @@ class OverallScoreTable(database.Base):
     date_max_score = Column(DateTime)
     date_last_score = Column(Date)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
-    region_key = Column(String, default="career", index=True, nullable=False)
+    region_key = Column(String, default="career", nullable=False)
     country_code = Column(String, index=True, nullable=True)
 
     __table_args__ = (
         UniqueConstraint('user_id', 'region_key', name='uix_user_region'),
+        # Rankings y conteos de rank: filtro por scope + orden del leaderboard, sin sort.
+        # (region_key solo queda cubierto como prefijo de ambos)
+        Index(
+            "ix_overall_scores_region_rank",
+            region_key, max_score.desc(), date_max_score,
+            postgresql_include=["user_id", "country_code"],
+        ),
+        Index(
+            "ix_overall_scores_country_rank",
+            region_key, country_code, max_score.desc(), date_max_score,
+            postgresql_include=["user_id"],
+        ),
     )
 
     user = relationship("User", back_populates='overall_score')
 
 
+class RegionPlayerCount(database.Base):
+    """
+    Players with a best score per (region_key, country_code), country_code "" being the whole
+    region. Moves only when a player gets their first score in a region or changes country.
+    """
+    __tablename__ = "region_player_counts"
+
+    region_key = Column(String, primary_key=True)
+    country_code = Column(String, primary_key=True, default="")
+    player_count = Column(Integer, nullable=False, default=0)
+
+
+class CountryScoreAggregate(database.Base):
+    """
+    Career totals per country for the country-vs-country leaderboard, sharded like
+    daily_challenge_stats: writers add player_count/score_sum deltas to a random shard,
+    readers SUM over the shards. The top-k columns live on shard 0 only and are re-read
+    from ix_overall_scores_country_rank (k rows) when a write can change the country's top k.
+    """
+    __tablename__ = "country_score_aggregates"
+
+    country_code = Column(String, primary_key=True)
+    shard = Column(Integer, primary_key=True, default=0)
+    player_count = Column(Integer, nullable=False, default=0)
+    score_sum = Column(BigInteger, nullable=False, default=0)
+    top_k_sum = Column(BigInteger, nullable=False, default=0)
+    top_k_count = Column(Integer, nullable=False, default=0)
+    top_k_min = Column(Integer, nullable=True)  # el k-ésimo mejor; por debajo un récord no entra al top
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class ScoreEvent(database.Base):
+    """
+    Append-only log of finished games. On Postgres it is partitioned by month (created_at),
+    so the PK is (id, created_at), see migration d5a1f7c3e82b.
+    """
+    __tablename__ = "score_events"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), Sequence("score_events_id_seq"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    region_key = Column(String, nullable=False)
+    country_code = Column(String, nullable=True)
+    score = Column(Integer, nullable=False)
+    created_at = Column(DateTime, primary_key=True, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_score_events_user_created", "user_id", "created_at"),
+        {"info": {"sqlite_rowid": "id"}},
+    )
+
+
+class ScoreWindowBest(database.Base):
+    """
+    Best score per player, region and calendar period (day, ISO week, month), kept
+    alongside score_events so the windowed leaderboards never read the event log.
+    """
+    __tablename__ = "score_window_bests"
+
+    period = Column(String, primary_key=True)  # day | week | month
+    period_start = Column(Date, primary_key=True)
+    region_key = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    country_code = Column(String, nullable=True)
+    best_score = Column(Integer, nullable=False)
+    date_best = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        # Mismo orden que los rankings de overall_score_table, por período
+        Index(
+            "ix_score_window_bests_rank",
+            period, period_start, region_key, best_score.desc(), date_best,
+            postgresql_include=["user_id", "country_code"],
+        ),
+        Index(
+            "ix_score_window_bests_country_rank",
+            period, period_start, region_key, country_code, best_score.desc(), date_best,
+            postgresql_include=["user_id"],
+        ),
+    )
+
+
 class DailyChallenge(database.Base):
     __tablename__ = "daily_challenges"
 
@@ -46,7 +152,8 @@ class DailyChallenge(database.Base):
     date = Column(Date, unique=True, index=True, nullable=False)
     country_name = Column(String, nullable=False)
     country_code = Column(String, nullable=False)  # cca3
-    flag_image_bytes = Column(LargeBinary, nullable=False)
+    # Diferida: sólo se carga al renderizar, no en cada consulta de estado/guess
+    flag_image_bytes = deferred(Column(LargeBinary, nullable=False))
     
     # Educational & Hint Data
     region = Column(String, nullable=True)
@@ -71,22 +178,94 @@ class DailyAttempt(database.Base):
     solved = Column(Boolean, default=False)
     failed = Column(Boolean, default=False)
     solved_at = Column(DateTime, nullable=True)
+    solve_seconds = Column(Integer, nullable=True)  # solved_at - created_at, para el leaderboard
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     challenge = relationship("DailyChallenge")
     guesses = relationship("DailyGuess", back_populates="attempt", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Retención: intentos anónimos sin actividad reciente
+        Index("ix_daily_attempts_anon_updated_at", "updated_at", postgresql_where=user_id.is_(None)),
+        # Leaderboard del día: top-N y "mi posición" se leen en orden del índice, sin ordenar el día entero
+        Index(
+            "ix_daily_attempts_leaderboard",
+            "challenge_id", "attempts_used", "solve_seconds", "id",
+            postgresql_where=and_(solved, user_id.isnot(None)),
+            postgresql_include=["user_id"],
+        ),
+    )
+
 
 class DailyGuess(database.Base):
+    """Partitioned by month (created_at) on Postgres, PK (id, created_at), see migration 7b41f0c2d9e8."""
     __tablename__ = "daily_guesses"
+    __table_args__ = ({"info": {"sqlite_rowid": "id"}},)
 
-    id = Column(Integer, primary_key=True, index=True)
-    attempt_id = Column(Integer, ForeignKey("daily_attempts.id"), nullable=False)
+    id = Column(Integer, Sequence("daily_guesses_id_seq"), primary_key=True, index=True)
+    attempt_id = Column(Integer, ForeignKey("daily_attempts.id"), nullable=False, index=True)
     guess_text = Column(String, nullable=False)
     is_correct = Column(Boolean, nullable=False)
     attempt_number = Column(Integer, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    # Pista de distancia/rumbo hacia la respuesta (None si la guess no es un país conocido)
+    guess_code = Column(String, nullable=True)
+    distance_km = Column(Integer, nullable=True)
+    bearing = Column(Integer, nullable=True)
+    created_at = Column(DateTime, primary_key=True, default=datetime.utcnow)
 
     attempt = relationship("DailyAttempt", back_populates="guesses")
 
+
+
+class DailyStreak(database.Base):
+    """
+    Consecutive solved days per player (user or anonymous id), updated together with the attempt.
+    current_streak is only meaningful while last_solved_date is today or yesterday.
+    """
+    __tablename__ = "daily_streaks"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True, unique=True)
+    anonymous_id = Column(String, nullable=True, unique=True)
+    current_streak = Column(Integer, nullable=False, default=0)
+    best_streak = Column(Integer, nullable=False, default=0)
+    last_solved_date = Column(Date, nullable=True)
+    last_played_date = Column(Date, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class DailyChallengeStat(database.Base):
+    """
+    Sharded counters per challenge: one row per (outcome, attempts, shard).
+    Writers bump a random shard; readers SUM over the shards.
+    """
+    __tablename__ = "daily_challenge_stats"
+
+    id = Column(Integer, primary_key=True)
+    challenge_id = Column(Integer, ForeignKey("daily_challenges.id", ondelete="CASCADE"), nullable=False)
+    outcome = Column(String, nullable=False)  # "started", "solved", "failed"
+    attempts = Column(Integer, nullable=False, default=0)  # intentos usados al resolver/fallar, 0 en "started"
+    shard = Column(Integer, nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint('challenge_id', 'outcome', 'attempts', 'shard', name='uix_daily_stat_shard'),
+    )
+
+
+class DailyChallengeRender(database.Base):
+    """Pre-rendered flag images per (challenge, reveal_level, max_level, render_version). Renders are deterministic."""
+    __tablename__ = "daily_challenge_renders"
+
+    id = Column(Integer, primary_key=True)
+    challenge_id = Column(Integer, ForeignKey("daily_challenges.id", ondelete="CASCADE"), nullable=False)
+    reveal_level = Column(Integer, nullable=False)
+    max_level = Column(Integer, nullable=False)
+    render_version = Column(Integer, nullable=False, default=1)
+    image_bytes = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint('challenge_id', 'reveal_level', 'max_level', 'render_version', name='uix_daily_render_level'),
+    )
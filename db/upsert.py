@@ -0,0 +1,12 @@
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+
+def insert_for(db: Session, table):
+    """
+    Returns the dialect-specific INSERT for `table`, which exposes on_conflict_do_update/do_nothing.
+    PostgreSQL in production; SQLite only matters for local tests.
+    """
+    if db.get_bind().dialect.name == "sqlite":
+        return sqlite.insert(table)
+    return postgresql.insert(table)
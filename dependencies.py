@@ -1,5 +1,7 @@
-from typing import Annotated
-from fastapi import Depends, HTTPException, status
+import re
+import secrets
+from typing import Annotated, Optional
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from jwt.exceptions import InvalidTokenError
@@ -16,6 +18,8 @@ oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="token", auto_error=False
 SECRET_KEY = settings.SECRET_KEY.get_secret_value()
 ALGORITHM = settings.ALGORITHM
 
+ANONYMOUS_ID_PATTERN = re.compile(r"^[a-zA-Z0-9-]+$")
+
 
 def get_db():
     db = database.SessionLocal()
@@ -84,4 +88,21 @@ async def get_current_user_optional(
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if not user:
         return None
-    return user
\ No newline at end of file
+    return user
+
+
+def get_anonymous_id(
+    x_anonymous_id: Optional[str] = Header(None, alias="X-Anonymous-Id")
+) -> Optional[str]:
+    """Validated X-Anonymous-Id header (None if absent)."""
+    if x_anonymous_id:
+        if len(x_anonymous_id) > 64 or not ANONYMOUS_ID_PATTERN.match(x_anonymous_id):
+            raise HTTPException(status_code=400, detail="Invalid anonymous ID format")
+    return x_anonymous_id
+
+
+def require_admin(x_admin_key: Optional[str] = Header(None, alias="X-Admin-Key")):
+    """Guards /admin endpoints with the shared ADMIN_API_KEY (403 while none is configured)."""
+    expected = settings.ADMIN_API_KEY.get_secret_value() if settings.ADMIN_API_KEY else None
+    if not expected or not x_admin_key or not secrets.compare_digest(x_admin_key.encode(), expected.encode()):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin key required")
@@ -26,10 +26,12 @@ from email.mime.text import MIMEText
 from PIL import Image
 from io import BytesIO
 
-from repository import register_login, scores_repo
+from repository import register_login, scores_repo, daily_challenge_repo
 from schemas import user_schema, token
-from routers import scores, users, daily_challenge, health
+from routers import scores, users, daily_challenge, health, countries, admin
 from db import database, models
+from utils import country_catalog, rank_index
+from dependencies import get_anonymous_id
 
 import jwt
 import os
@@ -117,7 +119,7 @@ app.add_middleware(
     allow_credentials=False,  # True solo si vas a usar cookies/sesiones cross-site
     allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
     allow_headers=["*"],
-    expose_headers=["Content-Length", "Content-Type"],
+    expose_headers=["Content-Length", "Content-Type", "X-Next-Cursor"],
     max_age=600,
 )
 
@@ -125,6 +127,34 @@ app.include_router(scores.router)
 app.include_router(users.user_router)
 app.include_router(daily_challenge.router)
 app.include_router(health.router)
+app.include_router(countries.router)
+app.include_router(admin.router)
+
+
+@app.on_event("startup")
+def warm_caches():
+    # Precarga el catálogo de países (índice de autocompletado y selección diaria).
+    # Si REST Countries no responde, se reintenta en el primer uso.
+    try:
+        country_catalog.get_catalog()
+    except ValueError:
+        logger.warning("Country catalog could not be loaded at startup")
+
+    # Ranking en memoria; hasta que termine la primera carga get_user_rank usa SQL
+    if settings.RANK_INDEX_ENABLED:
+        rank_index.start_refresher(
+            database.SessionLocal, settings.RANK_INDEX_REFRESH_SECONDS, settings.SCORE_HISTOGRAM_MAX
+        )
+
+    if settings.SCORE_WRITE_BEHIND:
+        scores_repo.score_queue.start()
+
+
+@app.on_event("shutdown")
+def flush_scores():
+    # Lo que no llegue a la base queda en SCORE_SPOOL_PATH y se reprocesa al arrancar
+    if settings.SCORE_WRITE_BEHIND:
+        scores_repo.score_queue.stop()
 
 # === Handlers de error coherentes ===
 @app.exception_handler(StarletteHTTPException)
@@ -353,6 +383,17 @@ def authenticate_user(username: str, password: str, db: Session):
     return user
 
 
+def merge_anonymous_progress(db: Session, user_id: int, anonymous_id: str | None):
+    # El login no debe fallar por el merge del reto diario
+    if not anonymous_id:
+        return
+    try:
+        daily_challenge_repo.merge_anonymous_attempts(db, user_id, anonymous_id)
+    except Exception:
+        db.rollback()
+        logger.exception(f"No se pudo fusionar el progreso anónimo del usuario {user_id}")
+
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=15))
@@ -400,7 +441,8 @@ async def get_current_active_user(current_user: Annotated[user_schema.User, Depe
 async def login_for_access_token(
     request: Request,
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    x_anonymous_id: Optional[str] = Depends(get_anonymous_id)
 ):
     user = authenticate_user(form_data.username, form_data.password, db)
     if not user:
@@ -414,6 +456,7 @@ async def login_for_access_token(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail={"message": "Usuario no verificado", "email": user.email},
                             headers={"WWW-Authenticate": "Bearer"})
+    merge_anonymous_progress(db, user.id, x_anonymous_id)
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(data={"sub": user.id}, expires_delta=access_token_expires)
     full_name = user.full_name if user.full_name else user.username
@@ -446,7 +489,8 @@ async def login_for_access_token(
 async def issue_token(
     request: Request,
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    x_anonymous_id: Optional[str] = Depends(get_anonymous_id)
 ):
     user = authenticate_user(form_data.username, form_data.password, db)
     if not user:
@@ -462,6 +506,7 @@ async def issue_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    merge_anonymous_progress(db, user.id, x_anonymous_id)
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.id},
@@ -536,9 +581,25 @@ async def save_overall_score(
 def overall_scores_public(
     limit: int = Query(50, ge=1, le=500),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor de la página anterior; ignora offset"),
     db: Session = Depends(get_db),
 ):
-    return scores_repo.get_public_ranking(db, limit, offset)
+    try:
+        return scores.ranking_response(db, "career", None, limit, offset, cursor, render_overall_scores, view="overall")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def render_overall_scores(rows: list[dict]) -> bytes:
+    # date_max_score es datetime en la tabla y date en OverallScorePublic
+    return scores.render_json([
+        OverallScorePublic(
+            username=r["username"],
+            max_score=r["max_score"],
+            date_max_score=r["date_max_score"].date() if r["date_max_score"] else None,
+        )
+        for r in rows
+    ])
 
 
 @app.put("/user/profile", response_model=user_schema.UserRegisterResponse)
@@ -0,0 +1,86 @@
+"""
+Tareas de mantenimiento (cron / jobs del deploy).
+
+    python manage.py pregenerate --days 14
+    python manage.py retention
+    python manage.py rebuild-aggregates
+"""
+import argparse
+import logging
+import sys
+from datetime import date
+
+from config import settings
+from db import database
+from repository import daily_challenge_repo, retention_repo, scores_repo
+
+logger = logging.getLogger("manage")
+
+
+def pregenerate(args):
+    start = date.fromisoformat(args.start) if args.start else daily_challenge_repo.utc_today()
+    db = database.SessionLocal()
+    try:
+        created = daily_challenge_repo.pregenerate_challenges(db, start, args.days)
+    finally:
+        db.close()
+
+    if created:
+        logger.info(f"Created {len(created)} challenges: {created[0]} .. {created[-1]}")
+    else:
+        logger.info("Nothing to create, all challenges already exist")
+
+
+def retention(args):
+    db = database.SessionLocal()
+    try:
+        retention_repo.run_retention(
+            db,
+            daily_challenge_repo.utc_today(),
+            anonymous_retention_days=args.anonymous_days,
+            batch_size=args.batch_size,
+            guesses_retention_months=args.guesses_months,
+            score_events_retention_months=args.score_events_months,
+            window_retention_days=args.window_days,
+        )
+    finally:
+        db.close()
+
+
+def rebuild_aggregates(args):
+    db = database.SessionLocal()
+    try:
+        countries = scores_repo.rebuild_country_aggregates(db)
+        scopes = scores_repo.rebuild_player_counts(db)
+    finally:
+        db.close()
+    logger.info(f"Rebuilt aggregates for {countries} countries and player counts for {scopes} scopes")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banderas maintenance tasks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("pregenerate", help="Create the next N daily challenges ahead of time")
+    p.add_argument("--days", type=int, default=7)
+    p.add_argument("--start", help="First date (YYYY-MM-DD), defaults to today")
+    p.set_defaults(func=pregenerate)
+
+    p = subparsers.add_parser("retention", help="Purge stale anonymous attempts, compact stats, rotate guess and score event partitions")
+    p.add_argument("--anonymous-days", type=int, default=settings.DAILY_ANON_RETENTION_DAYS)
+    p.add_argument("--batch-size", type=int, default=settings.RETENTION_BATCH_SIZE)
+    p.add_argument("--guesses-months", type=int, default=settings.DAILY_GUESSES_RETENTION_MONTHS)
+    p.add_argument("--score-events-months", type=int, default=settings.SCORE_EVENTS_RETENTION_MONTHS)
+    p.add_argument("--window-days", type=int, default=settings.SCORE_WINDOW_RETENTION_DAYS)
+    p.set_defaults(func=retention)
+
+    p = subparsers.add_parser("rebuild-aggregates", help="Recompute country_score_aggregates and region_player_counts from overall_score_table")
+    p.set_defaults(func=rebuild_aggregates)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
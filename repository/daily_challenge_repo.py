@@ -1,45 +1,55 @@
+import base64
 import hashlib
-from datetime import date, datetime
+import hmac
+import logging
+import random
+from datetime import date, datetime, time, timedelta, timezone
 from typing import Optional
 
 import requests
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import and_, case, func, or_, select, tuple_
 
 from db import models
+from db.upsert import insert_for
 from schemas import daily_challenge_schema
 
 
 from config import settings
+from utils import country_catalog
+from utils.cache import LRUCache
+from utils.geo import compass_point
+from utils.image_processing import pixelate_image
+from utils import share_card
 
-REST_COUNTRIES_URL = "https://restcountries.com/v3.1/all?fields=name,flags,cca2,cca3,region,subregion,capital,latlng,population,languages"
+logger = logging.getLogger(__name__)
+
+STAT_STARTED = "started"
+STAT_SOLVED = "solved"
+STAT_FAILED = "failed"
+
+# Subir si cambia pixelate_image: invalida ETags y renders guardados
+RENDER_VERSION = 1
+
+_flag_renders = LRUCache("flag_renders", maxsize=settings.FLAG_RENDER_CACHE_SIZE)
+# Share cards por (fecha, patrón, con bandera): deterministas, no hace falta invalidarlas
+_share_cards = LRUCache("share_cards", maxsize=settings.SHARE_CARD_CACHE_SIZE)
+# Top del leaderboard por reto; se invalida con cada resolución (el TTL cubre a los demás workers)
+_leaderboard_top = LRUCache("daily_leaderboard", maxsize=32, ttl=settings.DAILY_LEADERBOARD_CACHE_TTL)
+
+
+def utc_today() -> date:
+    """The challenge's calendar day. UTC, like every timestamp stored for attempts and guesses."""
+    return datetime.utcnow().date()
 
 
 def get_deterministic_country(date_obj: date):
     """
     Selects a country deterministically based on the date.
-    Fetches from REST Countries, filters, sorts, and picks one.
+    Uses the in-memory country catalog (valid countries sorted by cca3) and picks one.
     Returns the country dict (name, flags, cca2, cca3).
     """
-    try:
-        response = requests.get(REST_COUNTRIES_URL)
-        response.raise_for_status()
-        data = response.json()
-    except requests.RequestException as e:
-        print(f"Error fetching countries: {e}")
-        raise ValueError("Could not fetch countries")
-
-    # Filter invalid countries
-    valid_countries = [
-        c for c in data 
-        if c.get("flags", {}).get("png") and c.get("cca3") and c.get("name", {}).get("common")
-    ]
-
-    if not valid_countries:
-        raise ValueError("No valid countries found")
-
-    # Sort stably by cca3
-    valid_countries.sort(key=lambda x: x["cca3"])
+    valid_countries = country_catalog.get_catalog().countries
 
     # Deterministic selection using date hash
     date_str = date_obj.isoformat()
@@ -52,28 +62,21 @@ def get_deterministic_country(date_obj: date):
     return valid_countries[index]
 
 
-def ensure_today_challenge(db: Session, today: date) -> models.DailyChallenge:
-    """
-    Ensures a challenge exists for the given date.
-    If not, creates it by selecting a country and downloading the flag.
-    """
-    existing = db.query(models.DailyChallenge).filter(models.DailyChallenge.date == today).first()
-    if existing:
-        return existing
-
-    # Create new challenge
-    country_data = get_deterministic_country(today)
-    flag_url = country_data["flags"]["png"]
-    
+def download_flag(flag_url: str, http: requests.Session | None = None) -> bytes:
     try:
-        flag_response = requests.get(flag_url)
+        flag_response = (http or requests).get(flag_url, timeout=country_catalog.REQUEST_TIMEOUT_SECONDS)
         flag_response.raise_for_status()
-        flag_bytes = flag_response.content
+        return flag_response.content
     except requests.RequestException as e:
-        print(f"Error downloading flag: {e}")
+        logger.warning(f"Error downloading flag {flag_url}: {e}")
         # In production, we might want a fallback or retry, but for now we fail hard as requested
         raise ValueError(f"Could not download flag from {flag_url}")
 
+
+def build_challenge(challenge_date: date, country_data: dict, flag_bytes: bytes) -> models.DailyChallenge:
+    """
+    Builds (without adding to the session) the DailyChallenge row for a date.
+    """
     # Prepare languages string
     langs = country_data.get("languages", {})
     languages_str = ",".join(langs.values()) if langs else None
@@ -85,8 +88,8 @@ def ensure_today_challenge(db: Session, today: date) -> models.DailyChallenge:
     lat_val = latlng[0] if len(latlng) > 0 else None
     lng_val = latlng[1] if len(latlng) > 1 else None
 
-    new_challenge = models.DailyChallenge(
-        date=today,
+    return models.DailyChallenge(
+        date=challenge_date,
         country_name=country_data["name"]["common"],
         country_code=country_data["cca3"],
         flag_image_bytes=flag_bytes,
@@ -99,36 +102,140 @@ def ensure_today_challenge(db: Session, today: date) -> models.DailyChallenge:
         languages=languages_str,
         created_at=datetime.utcnow()
     )
+
+
+def ensure_today_challenge(db: Session, today: date) -> models.DailyChallenge:
+    """
+    Ensures a challenge exists for the given date.
+    If not, creates it by selecting a country and downloading the flag.
+    With `manage.py pregenerate` running ahead of time this is a plain read.
+    """
+    existing = db.query(models.DailyChallenge).filter(models.DailyChallenge.date == today).first()
+    if existing:
+        return existing
+
+    # Create new challenge
+    country_data = get_deterministic_country(today)
+    flag_bytes = download_flag(country_data["flags"]["png"])
+
+    new_challenge = build_challenge(today, country_data, flag_bytes)
     db.add(new_challenge)
     db.commit()
     db.refresh(new_challenge)
     return new_challenge
 
 
-def get_or_create_attempt(
-    db: Session, 
-    challenge: models.DailyChallenge, 
-    user_id: Optional[int], 
-    anonymous_id: Optional[str]
-) -> models.DailyAttempt:
+def pregenerate_challenges(db: Session, start: date, days: int, max_level: int | None = None) -> list[date]:
     """
-    Retrieves or creates an attempt for the user/anon on the given challenge.
+    Creates the challenges for [start, start + days) that don't exist yet, including the
+    downloaded flag and every reveal level render, in a single transaction.
+    Returns the dates that were created.
+    """
+    max_level = max_level or settings.DAILY_MAX_ATTEMPTS
+    dates = [start + timedelta(days=i) for i in range(days)]
+    existing = {
+        r[0] for r in db.query(models.DailyChallenge.date).filter(models.DailyChallenge.date.in_(dates)).all()
+    }
+    missing = [d for d in dates if d not in existing]
+    if not missing:
+        return []
+
+    challenges = []
+    with requests.Session() as http:
+        for challenge_date in missing:
+            country_data = get_deterministic_country(challenge_date)
+            flag_bytes = download_flag(country_data["flags"]["png"], http)
+            challenges.append(build_challenge(challenge_date, country_data, flag_bytes))
+
+    try:
+        db.add_all(challenges)
+        db.flush()  # asigna ids para los renders
+
+        render_rows = [
+            {
+                "challenge_id": challenge.id,
+                "reveal_level": level,
+                "max_level": max_level,
+                "render_version": RENDER_VERSION,
+                "image_bytes": pixelate_image(
+                    challenge.flag_image_bytes, level, seed_date=challenge.date, max_level=max_level
+                ),
+                "created_at": datetime.utcnow(),
+            }
+            for challenge in challenges
+            for level in range(max_level + 1)
+        ]
+        db.execute(models.DailyChallengeRender.__table__.insert(), render_rows)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return missing
+
+
+def get_challenge_by_date(db: Session, challenge_date: date) -> Optional[models.DailyChallenge]:
+    return db.query(models.DailyChallenge).filter(models.DailyChallenge.date == challenge_date).first()
+
+
+def get_playable_challenge(db: Session, challenge_date: date, today: date) -> Optional[models.DailyChallenge]:
+    """
+    Today's challenge (created on demand) or an already existing past one.
+    Returns None for future dates and for past dates that were never generated.
+    """
+    if challenge_date > today:
+        return None
+    if challenge_date == today:
+        return ensure_today_challenge(db, today)
+    return get_challenge_by_date(db, challenge_date)
+
+
+def list_archive(db: Session, before: date, limit: int):
+    """
+    Keyset page of past challenge dates, newest first.
+    Returns (dates, next_before); next_before is None on the last page.
     """
+    rows = (
+        db.query(models.DailyChallenge.date)
+        .filter(models.DailyChallenge.date < before)
+        .order_by(models.DailyChallenge.date.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    dates = [r[0] for r in rows]
+    next_before = dates[limit - 1] if len(dates) > limit else None
+    return dates[:limit], next_before
+
+
+def get_attempt(
+    db: Session,
+    challenge: models.DailyChallenge,
+    user_id: Optional[int],
+    anonymous_id: Optional[str]
+) -> Optional[models.DailyAttempt]:
+    """The user's (or else the anonymous id's) attempt on the challenge, if they have one."""
     query = db.query(models.DailyAttempt).filter(models.DailyAttempt.challenge_id == challenge.id)
-    
+
     if user_id:
         query = query.filter(models.DailyAttempt.user_id == user_id)
     elif anonymous_id:
         query = query.filter(models.DailyAttempt.anonymous_id == anonymous_id)
     else:
         raise ValueError("Must provide user_id or anonymous_id")
-        
-    attempt = query.first()
-    if attempt:
-        return attempt
 
-    # Create new attempt
-    new_attempt = models.DailyAttempt(
+    return query.first()
+
+
+def unsaved_attempt(
+    challenge: models.DailyChallenge,
+    user_id: Optional[int],
+    anonymous_id: Optional[str]
+) -> models.DailyAttempt:
+    """
+    A fresh attempt that is not in the session: viewing an archive day renders from it,
+    and it is only stored (and counted as started) on the first guess.
+    """
+    return models.DailyAttempt(
         challenge_id=challenge.id,
         user_id=user_id,
         anonymous_id=anonymous_id,
@@ -137,12 +244,546 @@ def get_or_create_attempt(
         failed=False,
         created_at=datetime.utcnow()
     )
+
+
+def get_or_create_attempt(
+    db: Session, 
+    challenge: models.DailyChallenge, 
+    user_id: Optional[int], 
+    anonymous_id: Optional[str]
+) -> models.DailyAttempt:
+    """
+    Retrieves or creates an attempt for the user/anon on the given challenge.
+    """
+    attempt = get_attempt(db, challenge, user_id, anonymous_id)
+    if attempt:
+        return attempt
+
+    # Create new attempt
+    new_attempt = unsaved_attempt(challenge, user_id, anonymous_id)
     db.add(new_attempt)
+    record_stat(db, challenge.id, STAT_STARTED)
     db.commit()
     db.refresh(new_attempt)
     return new_attempt
 
 
+def _streak_filter(user_id: Optional[int], anonymous_id: Optional[str]):
+    if user_id:
+        return models.DailyStreak.user_id == user_id
+    return models.DailyStreak.anonymous_id == anonymous_id
+
+
+def _lock_streak(db: Session, user_id: Optional[int], anonymous_id: Optional[str]) -> models.DailyStreak:
+    """
+    Returns the player's streak row locked for update, creating it if needed (no commit).
+    """
+    table = models.DailyStreak.__table__
+    if user_id:
+        values, conflict = {"user_id": user_id}, [table.c.user_id]
+    else:
+        values, conflict = {"anonymous_id": anonymous_id}, [table.c.anonymous_id]
+    db.execute(
+        insert_for(db, table)
+        .values(current_streak=0, best_streak=0, updated_at=datetime.utcnow(), **values)
+        .on_conflict_do_nothing(index_elements=conflict)
+    )
+    return (
+        db.query(models.DailyStreak)
+        .filter(_streak_filter(user_id, anonymous_id))
+        .with_for_update()
+        .one()
+    )
+
+
+def apply_streak_result(streak: models.DailyStreak, day: date, solved: bool):
+    """
+    Folds one finished day into the streak. Days at or before the last one played are ignored.
+    """
+    if streak.last_played_date and day <= streak.last_played_date:
+        return
+    if solved:
+        if streak.last_solved_date == day - timedelta(days=1):
+            streak.current_streak = (streak.current_streak or 0) + 1
+        else:
+            streak.current_streak = 1
+        streak.best_streak = max(streak.best_streak or 0, streak.current_streak)
+        streak.last_solved_date = day
+    else:
+        streak.current_streak = 0
+    streak.last_played_date = day
+
+
+def streak_payload(streak: Optional[models.DailyStreak], today: date) -> dict:
+    if not streak:
+        return {"current": 0, "best": 0}
+    alive = streak.last_solved_date is not None and streak.last_solved_date >= today - timedelta(days=1)
+    return {
+        "current": streak.current_streak if alive else 0,
+        "best": streak.best_streak or 0,
+    }
+
+
+def get_streak(db: Session, user_id: Optional[int], anonymous_id: Optional[str], today: date) -> dict:
+    """Current/best streak with a single unique-key lookup."""
+    streak = db.query(models.DailyStreak).filter(_streak_filter(user_id, anonymous_id)).first()
+    return streak_payload(streak, today)
+
+
+def _merge_streaks(db: Session, user_id: int, anonymous_id: str):
+    anon_streak = db.query(models.DailyStreak).filter(models.DailyStreak.anonymous_id == anonymous_id).first()
+    if not anon_streak:
+        return
+    user_streak = db.query(models.DailyStreak).filter(models.DailyStreak.user_id == user_id).with_for_update().first()
+    if not user_streak:
+        anon_streak.user_id = user_id
+        anon_streak.anonymous_id = None
+        return
+
+    # Manda el que jugó por última vez (un fallo posterior corta la racha del otro);
+    # si jugaron el mismo día, el que resolvió. El récord es el mejor de los dos
+    def last_state(streak: models.DailyStreak):
+        return (streak.last_played_date or date.min, streak.last_solved_date or date.min)
+
+    if last_state(anon_streak) > last_state(user_streak):
+        user_streak.current_streak = anon_streak.current_streak
+        user_streak.last_solved_date = anon_streak.last_solved_date
+    user_streak.best_streak = max(user_streak.best_streak or 0, anon_streak.best_streak or 0)
+    user_streak.last_played_date = max(
+        user_streak.last_played_date or date.min, anon_streak.last_played_date or date.min
+    )
+    db.delete(anon_streak)
+
+
+def merge_anonymous_attempts(db: Session, user_id: int, anonymous_id: str) -> dict:
+    """
+    Moves the daily progress of an anonymous player to a user (e.g. right after login).
+    - Days only played anonymously: the attempt is reassigned to the user.
+    - Days played both ways: the more advanced attempt wins (finished > more attempts used);
+      on a tie the user's attempt is kept. Guesses follow the winning attempt.
+    Everything runs as a fixed number of set-based statements in one transaction.
+    """
+    attempts = models.DailyAttempt.__table__
+    guesses = models.DailyGuess.__table__
+    mine = attempts.alias("mine")
+    anon = attempts.alias("anon")
+    max_attempts = settings.DAILY_MAX_ATTEMPTS
+
+    def progress(t):
+        return case((or_(t.c.solved, t.c.failed), max_attempts + 1), else_=t.c.attempts_used)
+
+    anon_filter = and_(attempts.c.anonymous_id == anonymous_id, attempts.c.user_id.is_(None))
+
+    conflicts = db.execute(
+        select(
+            anon.c.id,
+            mine.c.id,
+            anon.c.challenge_id,
+            progress(anon) > progress(mine),
+            anon.c.solved,
+            anon.c.failed,
+            anon.c.attempts_used,
+        )
+        .join_from(anon, mine, and_(mine.c.challenge_id == anon.c.challenge_id, mine.c.user_id == user_id))
+        .where(anon.c.anonymous_id == anonymous_id, anon.c.user_id.is_(None))
+    ).all()
+
+    anon_wins = [row for row in conflicts if row[3]]
+    anon_winner_ids = [row[0] for row in anon_wins]
+    user_loser_ids = [row[1] for row in anon_wins]
+    conflicting_anon_ids = [row[0] for row in conflicts]
+
+    if anon_winner_ids:
+        # El intento del usuario adopta el estado y las guesses del anónimo
+        db.execute(guesses.delete().where(guesses.c.attempt_id.in_(user_loser_ids)))
+        db.execute(
+            guesses.update()
+            .where(guesses.c.attempt_id.in_(anon_winner_ids))
+            .values(
+                attempt_id=select(mine.c.id)
+                .join(anon, anon.c.challenge_id == mine.c.challenge_id)
+                .where(mine.c.user_id == user_id, anon.c.id == guesses.c.attempt_id)
+                .scalar_subquery()
+            )
+        )
+
+        def from_anon(column):
+            return (
+                select(anon.c[column])
+                .where(
+                    anon.c.anonymous_id == anonymous_id,
+                    anon.c.user_id.is_(None),
+                    anon.c.challenge_id == attempts.c.challenge_id,
+                )
+                .scalar_subquery()
+            )
+
+        db.execute(
+            attempts.update()
+            .where(attempts.c.id.in_(user_loser_ids))
+            .values(
+                attempts_used=from_anon("attempts_used"),
+                solved=from_anon("solved"),
+                failed=from_anon("failed"),
+                solved_at=from_anon("solved_at"),
+                solve_seconds=from_anon("solve_seconds"),
+                created_at=from_anon("created_at"),
+                updated_at=datetime.utcnow(),
+            )
+        )
+
+    if conflicting_anon_ids:
+        db.execute(guesses.delete().where(guesses.c.attempt_id.in_(conflicting_anon_ids)))
+        db.execute(attempts.delete().where(attempts.c.id.in_(conflicting_anon_ids)))
+
+        # Contadores: queda un solo intento por día, y el perdedor terminado deja de contar
+        for row in conflicts:
+            challenge_id, anon_won, solved, failed, attempts_used = row[2], row[3], row[4], row[5], row[6]
+            record_stat(db, challenge_id, STAT_STARTED, delta=-1)
+            if not anon_won and (solved or failed):
+                record_stat(db, challenge_id, STAT_SOLVED if solved else STAT_FAILED, attempts_used, delta=-1)
+
+    # Resoluciones anónimas que pasan a contar en el leaderboard: las reasignadas y
+    # las que ganaron el conflicto (el intento del usuario pasa a estar resuelto)
+    leaderboard_changed = {row[2] for row in anon_wins if row[4]}
+    leaderboard_changed.update(db.execute(
+        select(attempts.c.challenge_id).where(anon_filter, attempts.c.solved)
+    ).scalars().all())
+
+    reassigned = db.execute(
+        attempts.update()
+        .where(anon_filter)
+        .values(user_id=user_id, updated_at=datetime.utcnow())
+    ).rowcount
+
+    _merge_streaks(db, user_id, anonymous_id)
+
+    db.commit()
+    for challenge_id in leaderboard_changed:
+        _leaderboard_top.invalidate(challenge_id)
+    return {"reassigned": reassigned, "merged": len(conflicts)}
+
+
+def record_stat(db: Session, challenge_id: int, outcome: str, attempts: int = 0, delta: int = 1):
+    """
+    Bumps a challenge counter inside the caller's transaction (no commit).
+    Picks a random shard so concurrent solves don't serialize on a single row.
+    """
+    table = models.DailyChallengeStat.__table__
+    stmt = insert_for(db, table).values(
+        challenge_id=challenge_id,
+        outcome=outcome,
+        attempts=attempts,
+        shard=random.randrange(max(1, settings.DAILY_STATS_SHARDS)),
+        count=delta,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.challenge_id, table.c.outcome, table.c.attempts, table.c.shard],
+        set_={"count": table.c.count + stmt.excluded.count},
+    )
+    db.execute(stmt)
+
+
+def get_challenge_stats(db: Session, challenge: models.DailyChallenge, max_attempts: int) -> daily_challenge_schema.DailyChallengeStats:
+    """
+    Results page for a challenge, summed over the counter shards (a few dozen rows at most).
+    """
+    rows = (
+        db.query(
+            models.DailyChallengeStat.outcome,
+            models.DailyChallengeStat.attempts,
+            func.sum(models.DailyChallengeStat.count),
+        )
+        .filter(models.DailyChallengeStat.challenge_id == challenge.id)
+        .group_by(models.DailyChallengeStat.outcome, models.DailyChallengeStat.attempts)
+        .all()
+    )
+
+    players = solved = failed = 0
+    distribution = {n: 0 for n in range(1, max_attempts + 1)}
+    for outcome, attempts, total in rows:
+        total = int(total or 0)
+        if outcome == STAT_STARTED:
+            players += total
+        elif outcome == STAT_SOLVED:
+            solved += total
+            distribution[attempts] = distribution.get(attempts, 0) + total
+        elif outcome == STAT_FAILED:
+            failed += total
+
+    return daily_challenge_schema.DailyChallengeStats(
+        date=challenge.date,
+        players=players,
+        solved=solved,
+        failed=failed,
+        solve_rate=round(solved / players, 4) if players else 0.0,
+        failure_rate=round(failed / players, 4) if players else 0.0,
+        attempts_distribution=[
+            daily_challenge_schema.AttemptsBucket(attempts=n, count=c)
+            for n, c in sorted(distribution.items())
+        ],
+    )
+
+
+def _leaderboard_filter(challenge_id: int):
+    # Mismo predicado que el índice parcial ix_daily_attempts_leaderboard
+    attempt = models.DailyAttempt
+    return and_(attempt.challenge_id == challenge_id, attempt.solved, attempt.user_id.isnot(None))
+
+
+def _leaderboard_order():
+    attempt = models.DailyAttempt
+    return attempt.attempts_used, attempt.solve_seconds, attempt.id
+
+
+def get_leaderboard_top(db: Session, challenge: models.DailyChallenge) -> dict:
+    """
+    Top page of the day (fewest attempts, then fastest solve) plus the total of solvers.
+    Only registered users are ranked. Served from `_leaderboard_top` while no new solve arrives.
+    """
+    cached = _leaderboard_top.get(challenge.id)
+    if cached is not None:
+        return cached
+
+    attempt = models.DailyAttempt
+    rows = (
+        db.query(models.User.username, attempt.attempts_used, attempt.solve_seconds)
+        .join(models.User, models.User.id == attempt.user_id)
+        .filter(_leaderboard_filter(challenge.id))
+        .order_by(*_leaderboard_order())
+        .limit(settings.DAILY_LEADERBOARD_SIZE)
+        .all()
+    )
+    total = (
+        db.query(func.count(attempt.id))
+        .filter(_leaderboard_filter(challenge.id))
+        .scalar()
+    )
+    page = {
+        "total": total,
+        "entries": [
+            {"rank": i + 1, "username": username, "attempts_used": attempts_used, "solve_seconds": solve_seconds}
+            for i, (username, attempts_used, solve_seconds) in enumerate(rows)
+        ],
+    }
+    _leaderboard_top.set(challenge.id, page)
+    return page
+
+
+def get_leaderboard_rank(db: Session, challenge: models.DailyChallenge, user: models.User) -> Optional[dict]:
+    """
+    The user's own leaderboard entry, or None if they haven't solved the challenge.
+    The rank is a range count over the index prefix that sorts ahead of them.
+    """
+    attempt = models.DailyAttempt
+    mine = (
+        db.query(attempt.id, attempt.attempts_used, attempt.solve_seconds)
+        .filter(_leaderboard_filter(challenge.id), attempt.user_id == user.id)
+        .first()
+    )
+    if not mine:
+        return None
+
+    ahead = (
+        db.query(func.count(attempt.id))
+        .filter(
+            _leaderboard_filter(challenge.id),
+            tuple_(*_leaderboard_order()) < tuple_(mine.attempts_used, mine.solve_seconds, mine.id),
+        )
+        .scalar()
+    )
+    return {
+        "rank": ahead + 1,
+        "username": user.username,
+        "attempts_used": mine.attempts_used,
+        "solve_seconds": mine.solve_seconds,
+    }
+
+
+def reveal_level_for(attempt: models.DailyAttempt, max_attempts: int) -> int:
+    return max_attempts if (attempt.solved or attempt.failed) else min(attempt.attempts_used, max_attempts)
+
+
+def flag_etag(challenge: models.DailyChallenge, reveal_level: int, max_level: int) -> str:
+    # Determinístico: la misma fecha y nivel siempre producen la misma imagen
+    return f'"flag-{challenge.date.isoformat()}-{reveal_level}-{max_level}-v{RENDER_VERSION}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    If-None-Match check with weak comparison: accepts `*`, comma-separated lists and
+    W/ prefixes (proxies that compress the body weaken the validator).
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def _flag_signature(challenge_date: date, reveal_level: int, max_level: int, expires: Optional[int] = None) -> str:
+    message = f"{challenge_date.isoformat()}:{reveal_level}:{max_level}:v{RENDER_VERSION}"
+    if expires is not None:
+        message += f":exp{expires}"
+    key = settings.SECRET_KEY.get_secret_value().encode()
+    return hmac.new(key, message.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def flag_url_expiry(challenge_date: date) -> Optional[int]:
+    """
+    Epoch at which a signed flag URL for this day stops working: the next UTC midnight
+    while the challenge is still being played, None once it's an archive day.
+    """
+    if challenge_date < utc_today():
+        return None
+    next_day = datetime.combine(challenge_date + timedelta(days=1), time.min, tzinfo=timezone.utc)
+    return int(next_day.timestamp())
+
+
+def signed_flag_path(challenge: models.DailyChallenge, reveal_level: int, max_level: int) -> str:
+    """
+    URL of one flag render. Signed so clients can't ask for a level they haven't reached.
+    Archive days are content-addressed and never expire; today's URL carries an expiry
+    so a shared full-reveal link stops working when the day ends.
+    """
+    expires = flag_url_expiry(challenge.date)
+    signature = _flag_signature(challenge.date, reveal_level, max_level, expires)
+    path = f"/daily-challenge/flags/{challenge.date.isoformat()}/{reveal_level}/{signature}.png"
+    return path if expires is None else f"{path}?expires={expires}"
+
+
+def verify_flag_signature(
+    challenge_date: date,
+    reveal_level: int,
+    max_level: int,
+    signature: str,
+    expires: Optional[int] = None,
+) -> bool:
+    if expires is None:
+        # Una firma sin vencimiento sólo vale para días del archivo
+        if challenge_date >= utc_today():
+            return False
+    elif expires <= datetime.now(timezone.utc).timestamp():
+        return False
+    return hmac.compare_digest(_flag_signature(challenge_date, reveal_level, max_level, expires), signature)
+
+
+def build_bootstrap(
+    db: Session,
+    attempt: models.DailyAttempt,
+    challenge: models.DailyChallenge,
+    max_attempts: int,
+    streak: Optional[dict] = None,
+    inline_flag: bool = False,
+) -> dict:
+    """
+    Status plus a reference to the flag at the player's reveal level, so the page
+    can render with one request (or two, the second one cacheable by the browser).
+    """
+    payload = build_status(attempt, challenge, max_attempts, streak)
+    level = payload["reveal_level"]
+    flag = {
+        "url": signed_flag_path(challenge, level, max_attempts),
+        "etag": flag_etag(challenge, level, max_attempts),
+        "data_url": None,
+    }
+    if inline_flag:
+        image_bytes = get_flag_render(db, challenge, level, max_attempts)
+        flag["data_url"] = "data:image/png;base64," + base64.b64encode(image_bytes).decode("ascii")
+    payload["flag"] = flag
+    return payload
+
+
+def get_flag_render(db: Session, challenge: models.DailyChallenge, reveal_level: int, max_level: int) -> bytes:
+    """
+    Returns the processed flag for a reveal level.
+    Looks in the process cache, then in daily_challenge_renders, and only renders on a miss
+    (storing the result so other workers and later days reuse it).
+    """
+    key = (challenge.date, reveal_level, max_level, RENDER_VERSION)
+    cached = _flag_renders.get(key)
+    if cached is not None:
+        return cached
+
+    row = (
+        db.query(models.DailyChallengeRender.image_bytes)
+        .filter(
+            models.DailyChallengeRender.challenge_id == challenge.id,
+            models.DailyChallengeRender.reveal_level == reveal_level,
+            models.DailyChallengeRender.max_level == max_level,
+            models.DailyChallengeRender.render_version == RENDER_VERSION,
+        )
+        .first()
+    )
+    if row:
+        image_bytes = row[0]
+    else:
+        image_bytes = pixelate_image(
+            challenge.flag_image_bytes,
+            reveal_level,
+            seed_date=challenge.date,
+            max_level=max_level,
+        )
+        table = models.DailyChallengeRender.__table__
+        stmt = insert_for(db, table).values(
+            challenge_id=challenge.id,
+            reveal_level=reveal_level,
+            max_level=max_level,
+            render_version=RENDER_VERSION,
+            image_bytes=image_bytes,
+            created_at=datetime.utcnow(),
+        ).on_conflict_do_nothing(
+            index_elements=[table.c.challenge_id, table.c.reveal_level, table.c.max_level, table.c.render_version]
+        )
+        db.execute(stmt)
+        db.commit()
+
+    _flag_renders.set(key, image_bytes)
+    return image_bytes
+
+
+def build_status(
+    attempt: models.DailyAttempt,
+    challenge: models.DailyChallenge,
+    max_attempts: int,
+    streak: Optional[dict] = None,
+) -> dict:
+    """
+    Status payload for GET /daily-challenge/today and the archive equivalent.
+    """
+    status_str = "solved" if attempt.solved else ("failed" if attempt.failed else "in_progress")
+
+    hints_unlocked = build_hints(challenge, attempt.attempts_used, max_attempts)
+    share_text, share_url = build_share_payload(attempt, challenge, max_attempts, settings.BASE_URL)
+
+    correct_answer = None
+    if attempt.solved or attempt.failed:
+        correct_answer = daily_challenge_schema.GuessAnswer(
+            name=challenge.country_name,
+            code=challenge.country_code
+        )
+
+    return {
+        "date": challenge.date,
+        "max_attempts": max_attempts,
+        "attempts_used": attempt.attempts_used,
+        "status": status_str,
+        "reveal_level": reveal_level_for(attempt, max_attempts),
+        "can_play": not (attempt.solved or attempt.failed),
+        "hints_unlocked": hints_unlocked,
+        "hints_total": 3 if max_attempts >= 4 else 2,
+        "share_text": share_text,
+        "share_url": share_url,
+        "share_image_url": share_image_path(attempt, challenge),
+        "correct_answer": correct_answer,
+        "guesses": [
+            guess_feedback_payload(g) for g in sorted(attempt.guesses, key=lambda g: g.attempt_number)
+        ],
+        "streak": streak or {"current": 0, "best": 0},
+    }
+
+
 def build_hints(challenge: models.DailyChallenge, attempts_used: int, max_attempts: int):
     """
     Returns a list of unlocked hints based on attempts used and max attempts.
@@ -174,6 +815,27 @@ def build_hints(challenge: models.DailyChallenge, attempts_used: int, max_attemp
     return hints_unlocked
 
 
+def guess_feedback(challenge: models.DailyChallenge, guess_text: str) -> Optional[dict]:
+    """
+    Distance/bearing from the guessed country to the answer: a lookup in the catalog's
+    precomputed matrix. Best effort: None if the catalog isn't loaded or the guess is unknown.
+    """
+    catalog = country_catalog.peek_catalog()
+    if catalog is None:
+        return None
+    return catalog.feedback(guess_text, challenge.country_code)
+
+
+def guess_feedback_payload(guess: models.DailyGuess) -> dict:
+    return {
+        "guess": guess.guess_text,
+        "code": guess.guess_code,
+        "distance_km": guess.distance_km,
+        "bearing": guess.bearing,
+        "direction": compass_point(guess.bearing) if guess.bearing is not None else None,
+    }
+
+
 def build_share_payload(attempt: models.DailyAttempt, challenge: models.DailyChallenge, max_attempts: int, base_url: str):
     """
     Returns (share_text, share_url) if finished, else (None, None).
@@ -200,6 +862,35 @@ def build_share_payload(attempt: models.DailyAttempt, challenge: models.DailyCha
     return share_text, share_url
 
 
+def share_image_path(attempt: models.DailyAttempt, challenge: models.DailyChallenge) -> Optional[str]:
+    """Path of the share card for a finished attempt (same URL for everyone with the same result)."""
+    if not (attempt.solved or attempt.failed):
+        return None
+    guesses = sorted(attempt.guesses, key=lambda g: g.attempt_number)
+    pattern = share_card.share_pattern([g.is_correct for g in guesses])
+    return f"/daily-challenge/{challenge.date.isoformat()}/share-card/{pattern}.png"
+
+
+def share_card_etag(challenge: models.DailyChallenge, pattern: str, with_flag: bool) -> str:
+    return f'"card-{challenge.date.isoformat()}-{pattern}-{int(with_flag)}-v{share_card.CARD_VERSION}"'
+
+
+def get_share_card(challenge: models.DailyChallenge, pattern: str, max_attempts: int, with_flag: bool) -> bytes:
+    """
+    Share card PNG for (date, pattern). There are only max_attempts + 1 valid patterns per day,
+    so renders are cached in memory by that key.
+    """
+    key = (challenge.date, pattern, with_flag, max_attempts, share_card.CARD_VERSION)
+    image_bytes = _share_cards.get(key)
+    if image_bytes is None:
+        image_bytes = share_card.render_share_card(
+            challenge.date, pattern, max_attempts,
+            flag_bytes=challenge.flag_image_bytes if with_flag else None,
+        )
+        _share_cards.set(key, image_bytes)
+    return image_bytes
+
+
 def submit_guess(db: Session, attempt: models.DailyAttempt, guess_text: str) -> daily_challenge_schema.GuessResponse:
     """
     Processes a guess. detailed logic in implementation plan.
@@ -221,11 +912,13 @@ def submit_guess(db: Session, attempt: models.DailyAttempt, guess_text: str) ->
         # Should have been marked failed, but ensure sync
         if not attempt.failed:
             attempt.failed = True
+            record_stat(db, challenge.id, STAT_FAILED, attempt.attempts_used)
             db.commit()
         return _build_response(attempt, challenge, max_attempts, message="No attempts left")
 
     # Process new guess
     is_correct = (normalized_guess == target_name)
+    feedback = guess_feedback(challenge, guess_text) or {}
     
     # Record guess in DB
     new_guess = models.DailyGuess(
@@ -233,9 +926,13 @@ def submit_guess(db: Session, attempt: models.DailyAttempt, guess_text: str) ->
         guess_text=guess_text, # store original text
         is_correct=is_correct,
         attempt_number=attempt.attempts_used + 1,
+        guess_code=feedback.get("code"),
+        distance_km=feedback.get("distance_km"),
+        bearing=feedback.get("bearing"),
         created_at=datetime.utcnow()
     )
     db.add(new_guess)
+    feedback_payload = guess_feedback_payload(new_guess)
 
     # Update attempt
     attempt.attempts_used += 1
@@ -243,13 +940,33 @@ def submit_guess(db: Session, attempt: models.DailyAttempt, guess_text: str) ->
     if is_correct:
         attempt.solved = True
         attempt.solved_at = datetime.utcnow()
+        attempt.solve_seconds = max(0, int((attempt.solved_at - attempt.created_at).total_seconds()))
+        record_stat(db, challenge.id, STAT_SOLVED, attempt.attempts_used)
     elif attempt.attempts_used >= max_attempts:
         attempt.failed = True
+        record_stat(db, challenge.id, STAT_FAILED, attempt.attempts_used)
+
+    # Sólo el reto del día cuenta para la racha (el archivo no la rellena)
+    streak = None
+    today = utc_today()
+    if (attempt.solved or attempt.failed) and challenge.date == today:
+        streak = _lock_streak(db, attempt.user_id, attempt.anonymous_id)
+        apply_streak_result(streak, challenge.date, attempt.solved)
     
+    # Guess, attempt, contadores y racha se confirman en la misma transacción
     db.commit()
     db.refresh(attempt)
+
+    if is_correct and attempt.user_id:
+        _leaderboard_top.invalidate(challenge.id)
     
-    return _build_response(attempt, challenge, max_attempts, is_just_solved=is_correct, is_just_failed=attempt.failed)
+    return _build_response(
+        attempt, challenge, max_attempts,
+        is_just_solved=is_correct,
+        is_just_failed=attempt.failed,
+        streak=streak_payload(streak, today) if streak else None,
+        feedback=feedback_payload,
+    )
 
 
 def _build_response(
@@ -258,7 +975,9 @@ def _build_response(
     max_attempts: int,
     message: str = None,
     is_just_solved: bool = False,
-    is_just_failed: bool = False
+    is_just_failed: bool = False,
+    streak: Optional[dict] = None,
+    feedback: Optional[dict] = None
 ) -> daily_challenge_schema.GuessResponse:
     
     status_str = "in_progress"
@@ -268,7 +987,7 @@ def _build_response(
         status_str = "failed"
         
     hints_unlocked = build_hints(challenge, attempt.attempts_used, max_attempts)
-    reveal_level = max_attempts if (attempt.solved or attempt.failed) else min(attempt.attempts_used, max_attempts)
+    reveal_level = reveal_level_for(attempt, max_attempts)
     
     share_text, share_url = build_share_payload(attempt, challenge, max_attempts, settings.BASE_URL)
     
@@ -289,5 +1008,8 @@ def _build_response(
         hints_unlocked=hints_unlocked,
         share_text=share_text,
         share_url=share_url,
-        correct_answer=correct_answer
+        share_image_url=share_image_path(attempt, challenge),
+        correct_answer=correct_answer,
+        feedback=feedback,
+        streak=streak
     )
@@ -1,6 +1,7 @@
 from sqlalchemy.orm import Session
 
 from db import models
+from repository import scores_repo
 from schemas import user_schema
 
 
@@ -28,12 +29,20 @@ def update_user_profile(db: Session, user_id: int, user_profile_update: user_sch
         else:
             update_profile_image = db_user.profile_image
         
+        # Los rankings cacheados muestran username y si tiene foto
+        ranking_changed = (
+            db_user.username != user_profile_update.username
+            or (db_user.profile_image is None) != (update_profile_image is None)
+        )
+
         db_user.username = user_profile_update.username
         db_user.full_name = user_profile_update.full_name
         db_user.country = user_profile_update.country
         db_user.profile_image = update_profile_image
         db.commit()
         db.refresh(db_user)
+        if ranking_changed:
+            scores_repo.ranking_pages.clear()
         return db_user
     else:
         raise ValueError("Usuario no encontrado")
@@ -0,0 +1,251 @@
+import logging
+import re
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import or_, select, text
+from sqlalchemy.orm import Session
+
+from db import models
+from db.upsert import insert_for
+
+logger = logging.getLogger(__name__)
+
+PARTITION_PATTERN = re.compile(r"^(\w+)_y(\d{4})m(\d{2})$")
+PARTITIONED_TABLES = ("daily_guesses", "score_events")
+
+
+def purge_anonymous_attempts(db: Session, older_than: datetime, batch_size: int = 1000) -> int:
+    """
+    Deletes abandoned anonymous attempts (neither solved nor failed, with their guesses) not
+    touched since `older_than`. Finished ones stay: reopening that day in the archive must
+    show the result, not start a new attempt. Works in batches of `batch_size`, committing
+    each one, so locks stay short.
+    """
+    attempts = models.DailyAttempt.__table__
+    guesses = models.DailyGuess.__table__
+    deleted = 0
+
+    while True:
+        ids = db.execute(
+            select(attempts.c.id)
+            .where(
+                attempts.c.user_id.is_(None),
+                attempts.c.updated_at < older_than,
+                attempts.c.solved.isnot(True),
+                attempts.c.failed.isnot(True),
+            )
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+
+        db.execute(guesses.delete().where(guesses.c.attempt_id.in_(ids)))
+        db.execute(attempts.delete().where(attempts.c.id.in_(ids)))
+        db.commit()
+        deleted += len(ids)
+
+        if len(ids) < batch_size:
+            break
+
+    return deleted
+
+
+def purge_anonymous_streaks(db: Session, older_than: date) -> int:
+    """Deletes streak rows of anonymous players that haven't finished a challenge since `older_than`."""
+    streaks = models.DailyStreak.__table__
+    deleted = db.execute(
+        streaks.delete().where(
+            streaks.c.user_id.is_(None),
+            or_(streaks.c.last_played_date.is_(None), streaks.c.last_played_date < older_than),
+        )
+    ).rowcount
+    db.commit()
+    return deleted
+
+
+def compact_daily_stats(db: Session, before: date) -> int:
+    """
+    Folds the counter shards of past days (date < before) into shard 0. Archive play still
+    bumps those shards, so the fold adds exactly what the DELETE ... RETURNING removed:
+    an increment that lands after the DELETE simply stays in its shard for the next run.
+    Returns the number of challenges compacted.
+    """
+    stats = models.DailyChallengeStat.__table__
+    challenges = models.DailyChallenge.__table__
+
+    moved = db.execute(
+        stats.delete()
+        .where(
+            stats.c.shard != 0,
+            stats.c.challenge_id.in_(select(challenges.c.id).where(challenges.c.date < before)),
+        )
+        .returning(stats.c.challenge_id, stats.c.outcome, stats.c.attempts, stats.c.count)
+    ).all()
+    if not moved:
+        db.commit()
+        return 0
+
+    totals: dict[tuple[int, str, int], int] = {}
+    for challenge_id, outcome, attempts, count in moved:
+        key = (challenge_id, outcome, attempts)
+        totals[key] = totals.get(key, 0) + count
+
+    stmt = insert_for(db, stats).values([
+        {"challenge_id": challenge_id, "outcome": outcome, "attempts": attempts, "shard": 0, "count": count}
+        for (challenge_id, outcome, attempts), count in sorted(totals.items())
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[stats.c.challenge_id, stats.c.outcome, stats.c.attempts, stats.c.shard],
+        set_={"count": stats.c.count + stmt.excluded.count},
+    )
+    db.execute(stmt)
+    db.commit()
+    return len({challenge_id for challenge_id, *_ in totals})
+
+
+def _month_start(d: date) -> date:
+    return d.replace(day=1)
+
+
+def _add_months(d: date, months: int) -> date:
+    month_index = d.year * 12 + (d.month - 1) + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def is_partitioned(db: Session, table: str) -> bool:
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    return db.execute(text("""
+        SELECT 1 FROM pg_partitioned_table pt
+        JOIN pg_class c ON c.oid = pt.partrelid
+        WHERE c.relname = :table
+    """), {"table": table}).first() is not None
+
+
+def list_partitions(db: Session, table: str) -> list[tuple[date, str]]:
+    rows = db.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits i
+        JOIN pg_class parent ON parent.oid = i.inhparent
+        JOIN pg_class child ON child.oid = i.inhrelid
+        WHERE parent.relname = :table
+    """), {"table": table}).scalars().all()
+
+    partitions = []
+    for name in rows:
+        match = PARTITION_PATTERN.match(name)
+        if match and match.group(1) == table:
+            partitions.append((date(int(match.group(2)), int(match.group(3)), 1), name))
+    return sorted(partitions)
+
+
+def default_partition(db: Session, table: str) -> str | None:
+    return db.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits i
+        JOIN pg_class parent ON parent.oid = i.inhparent
+        JOIN pg_class child ON child.oid = i.inhrelid
+        WHERE parent.relname = :table AND pg_get_expr(child.relpartbound, child.oid) = 'DEFAULT'
+    """), {"table": table}).scalar()
+
+
+def ensure_partitions(db: Session, table: str, today: date, months_ahead: int = 2) -> list[str]:
+    """
+    Creates the monthly partitions of `table` (daily_guesses, score_events) up to `months_ahead`
+    months from now, before any row can land in the default partition for those ranges.
+    """
+    if not is_partitioned(db, table):
+        return []
+
+    existing = {month for month, _ in list_partitions(db, table)}
+    default = default_partition(db, table)
+    created = []
+    for offset in range(months_ahead + 1):
+        month = _add_months(_month_start(today), offset)
+        if month in existing:
+            continue
+        name = f"{table}_y{month.year:04d}m{month.month:02d}"
+        start, end = month.isoformat(), _add_months(month, 1).isoformat()
+        in_range = f"created_at >= '{start}' AND created_at < '{end}'"
+        # Con filas del mes en DEFAULT el CREATE falla: se saca DEFAULT, se mudan y se vuelve a colgar
+        stranded = default and db.execute(text(f"SELECT 1 FROM {default} WHERE {in_range} LIMIT 1")).first()
+        if stranded:
+            db.execute(text(f"ALTER TABLE {table} DETACH PARTITION {default}"))
+        db.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} FOR VALUES FROM ('{start}') TO ('{end}')"
+        ))
+        if stranded:
+            db.execute(text(f"INSERT INTO {name} SELECT * FROM {default} WHERE {in_range}"))
+            db.execute(text(f"DELETE FROM {default} WHERE {in_range}"))
+            db.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT"))
+            logger.warning(f"Moved rows of {name} out of {default}")
+        created.append(name)
+    db.commit()
+    return created
+
+
+def drop_old_partitions(db: Session, table: str, today: date, keep_months: int) -> list[str]:
+    """
+    Detaches and drops the monthly partitions of `table` older than `keep_months`.
+    Much cheaper than DELETE: no row scan, no index bloat, no vacuum debt.
+    """
+    if not is_partitioned(db, table):
+        return []
+
+    cutoff = _add_months(_month_start(today), -keep_months)
+    dropped = []
+    for month, name in list_partitions(db, table):
+        if month >= cutoff:
+            break
+        db.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+        db.execute(text(f"DROP TABLE {name}"))
+        dropped.append(name)
+    db.commit()
+    return dropped
+
+
+def purge_window_bests(db: Session, before: date) -> int:
+    """Deletes score_window_bests rows of periods that started before `before`."""
+    bests = models.ScoreWindowBest.__table__
+    deleted = db.execute(bests.delete().where(bests.c.period_start < before)).rowcount
+    db.commit()
+    return deleted
+
+
+def run_retention(
+    db: Session,
+    today: date,
+    anonymous_retention_days: int,
+    batch_size: int,
+    guesses_retention_months: int | None = None,
+    score_events_retention_months: int | None = None,
+    window_retention_days: int | None = None,
+) -> dict:
+    """Full retention pass, meant for a daily cron (`python manage.py retention`)."""
+    cutoff = today - timedelta(days=anonymous_retention_days)
+    purged = purge_anonymous_attempts(db, datetime.combine(cutoff, datetime.min.time()), batch_size)
+    purged_streaks = purge_anonymous_streaks(db, cutoff)
+    compacted = compact_daily_stats(db, today)
+    created = [name for table in PARTITIONED_TABLES for name in ensure_partitions(db, table, today)]
+    dropped = []
+    if guesses_retention_months:
+        dropped += drop_old_partitions(db, "daily_guesses", today, guesses_retention_months)
+    if score_events_retention_months:
+        dropped += drop_old_partitions(db, "score_events", today, score_events_retention_months)
+    purged_windows = (
+        purge_window_bests(db, today - timedelta(days=window_retention_days))
+        if window_retention_days
+        else 0
+    )
+    logger.info(
+        f"Retention: purged={purged} purged_streaks={purged_streaks} compacted={compacted} "
+        f"partitions_created={created} partitions_dropped={dropped} purged_windows={purged_windows}"
+    )
+    return {
+        "purged_attempts": purged,
+        "purged_streaks": purged_streaks,
+        "compacted_challenges": compacted,
+        "partitions_created": created,
+        "partitions_dropped": dropped,
+        "purged_window_bests": purged_windows,
+    }
@@ -1,83 +1,602 @@
-from sqlalchemy.orm import Session
-from sqlalchemy.exc import IntegrityError
-from sqlalchemy import func, desc
-from datetime import datetime, date
-from db.models import User, OverallScoreTable
-from schemas.score import RegionEnum, ScoreScope
+import csv
+import io
+import json
+import random
+from dataclasses import dataclass
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import (
+    Integer, and_, case, cast, column, func, desc, insert, literal, literal_column, null, or_, select, tuple_,
+    union_all, values as values_clause,
+)
+from datetime import datetime, date, timedelta
+from typing import Callable
+from config import settings
+from db.database import SessionLocal
+from db.models import User, OverallScoreTable, CountryScoreAggregate, RegionPlayerCount, ScoreEvent, ScoreWindowBest
+from db.upsert import insert_for
+from schemas.score import CountryOrder, ExportFormat, RegionEnum, ScoreScope, ScoreWindow
+from utils import rank_index
+from utils.cache import LRUCache
+from utils.rank_index import rank_key
+from utils.ranking_cache import VersionedPageCache
+from utils.score_queue import PendingScore, ScoreQueue
+from utils.cursor import decode_cursor, encode_cursor
 
 
-def save_score(db: Session, score: int, current_user: User, region_key: str = "career", country_code: str | None = None):
-    # Intentá leer la fila del usuario para esa region
-    query = db.query(OverallScoreTable).filter(
-        OverallScoreTable.user_id == current_user.id,
-        OverallScoreTable.region_key == region_key
+# Páginas de ranking serializadas; el TTL acota lo desfasados que quedan otros workers
+ranking_pages = VersionedPageCache(
+    "ranking_pages", maxsize=settings.RANKING_CACHE_SIZE, ttl=settings.RANKING_CACHE_TTL
+)
+# Tabla de países por (orden, limit); sólo expira por TTL, cambia con cada récord de cualquiera
+country_leaderboard = LRUCache("country_leaderboard", maxsize=32, ttl=settings.COUNTRY_LEADERBOARD_CACHE_TTL)
+
+
+@dataclass(frozen=True)
+class ScoreChange:
+    """An upserted row and the max_score/country_code it replaced (None on a first score)."""
+    row: OverallScoreTable
+    prev_max_score: int | None
+    prev_country_code: str | None
+
+    @property
+    def improved(self) -> bool:
+        return self.row.max_score is not None and (
+            self.prev_max_score is None or self.row.max_score > self.prev_max_score
+        )
+
+    @property
+    def moved(self) -> bool:
+        return self.prev_country_code is not None and self.prev_country_code != self.row.country_code
+
+
+def _score_written(change: ScoreChange, username: str):
+    """After a commit: moves the player in the rank index and bumps the cached pages it lands in."""
+    row = change.row
+    if settings.RANK_INDEX_ENABLED:
+        rank_index.get_index().update(
+            row.user_id, username, row.region_key, row.country_code, row.max_score, row.date_max_score
+        )
+
+    if not change.improved and not change.moved and not row.country_code:
+        return  # sólo cambió last_score, que no sale en los rankings
+
+    # El récord sólo sube: si la clave vieja estaba en una ventana cacheada, la nueva también
+    key = rank_key(row.max_score, row.date_max_score, username)
+    if change.improved:
+        ranking_pages.touch((row.region_key, None), key)
+    if row.country_code:
+        ranking_pages.touch((row.region_key, row.country_code), key)
+    if change.moved:
+        ranking_pages.touch((row.region_key, change.prev_country_code), key)
+
+
+def _greatest(db: Session, a, b):
+    # SQLite no tiene GREATEST; su max() escalar hace lo mismo
+    if db.get_bind().dialect.name == "sqlite":
+        return func.max(a, b)
+    return func.greatest(a, b)
+
+
+def _upsert_scores(db: Session, values: list[dict]) -> list[ScoreChange]:
+    """
+    INSERT ... ON CONFLICT (user_id, region_key) DO UPDATE ... RETURNING for one or more
+    (user_id, region_key) rows, which must be distinct. max_score only goes up (GREATEST),
+    date_max_score moves with it, last_score always takes the new value. Each row comes back
+    with the max_score/country_code it replaced, which every delta is computed from.
+
+    On Postgres it is a single statement: a CTE locks and reads the existing rows (FOR UPDATE)
+    before the upsert touches them. If a concurrent first insert of the same key lands between
+    the lock and the upsert, what it replaced is unknown: each attempt runs in a savepoint, and
+    only that savepoint is rolled back before retrying, so the caller's earlier work in the
+    transaction stays. Elsewhere (SQLite in tests, a single writer) the old rows are read
+    first, in a separate SELECT.
+    """
+    table = OverallScoreTable.__table__
+    previous = (
+        select(table.c.user_id, table.c.region_key, table.c.max_score, table.c.country_code)
+        .where(tuple_(table.c.user_id, table.c.region_key).in_([(v["user_id"], v["region_key"]) for v in values]))
     )
-    try:
-        user_score = query.with_for_update(read=True).first()
-    except Exception:
-        user_score = query.first()
-
-    if user_score:
-        if user_score.max_score is None or score > user_score.max_score:
-            user_score.max_score = score
-            user_score.date_max_score = datetime.utcnow()
-        user_score.last_score = score
-        user_score.date_last_score = date.today()
-        # Update country if provided and not present, or just always update? 
-        # Better to keep the latest one or the one from user profile.
-        if country_code:
-            user_score.country_code = country_code
-        db.add(user_score)
+    postgres = db.get_bind().dialect.name == "postgresql"
+    names = list(values[0])
+
+    for _ in range(3):
+        if postgres:
+            savepoint = db.begin_nested()
+            old = previous.with_for_update().cte("old")
+            source = values_clause(*(column(name, table.c[name].type) for name in names), name="new").data(
+                [tuple(v[name] for name in names) for v in values]
+            )
+            # La condición obliga a leer (y bloquear) `old` antes de que el INSERT toque las filas
+            stmt = insert_for(db, OverallScoreTable).from_select(
+                names, select(source).where(select(func.count()).select_from(old).scalar_subquery() >= 0)
+            )
+        else:
+            known = {(r.user_id, r.region_key): (r.max_score, r.country_code) for r in db.execute(previous)}
+            stmt = insert_for(db, OverallScoreTable).values(values)
+
+        new = stmt.excluded
+        improved = or_(table.c.max_score.is_(None), new.max_score > table.c.max_score)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.region_key],
+            set_={
+                "max_score": _greatest(db, func.coalesce(table.c.max_score, new.max_score), new.max_score),
+                "date_max_score": case((improved, new.date_max_score), else_=table.c.date_max_score),
+                "last_score": new.last_score,
+                "date_last_score": new.date_last_score,
+                # Sin país nuevo se conserva el que tenía
+                "country_code": func.coalesce(new.country_code, table.c.country_code),
+            },
+        )
+
+        if postgres:
+            upserted = stmt.returning(*table.c, literal_column("xmax = 0").label("inserted")).cte("upserted")
+            row_alias = aliased(OverallScoreTable, upserted)
+            result = db.execute(
+                select(row_alias, old.c.max_score, old.c.country_code, old.c.user_id.isnot(None), upserted.c.inserted)
+                .outerjoin_from(
+                    upserted, old,
+                    and_(old.c.user_id == upserted.c.user_id, old.c.region_key == upserted.c.region_key),
+                ),
+                execution_options={"populate_existing": True},
+            ).all()
+            if any(not seen and not inserted for *_, seen, inserted in result):
+                savepoint.rollback()
+                continue
+            savepoint.commit()
+            changes = [ScoreChange(row, prev_max, prev_country) for row, prev_max, prev_country, *_ in result]
+        else:
+            rows = db.scalars(stmt.returning(OverallScoreTable), execution_options={"populate_existing": True}).all()
+            changes = [ScoreChange(row, *known.get((row.user_id, row.region_key), (None, None))) for row in rows]
+
+        # Fuera de la sesión el commit no las expira: el caller las usa sin otro SELECT
+        for change in changes:
+            db.expunge(change.row)
+        return changes
+
+    raise RuntimeError("overall_score_table upsert kept racing concurrent first inserts")
+
+
+def period_start(period: str, day: date) -> date:
+    """First day of the calendar period (day, ISO week starting Monday, month) containing `day`."""
+    if period == ScoreWindow.week:
+        return day - timedelta(days=day.weekday())
+    if period == ScoreWindow.month:
+        return day.replace(day=1)
+    return day
+
+
+def _record_events(db: Session, events: list[dict]):
+    """
+    Appends games to score_events (one multi-row INSERT) and folds them into score_window_bests,
+    one row per (period, period_start, region, user), with the same only-goes-up rule as max_score.
+    On Postgres the score_events INSERT rides along as a CTE of the window-bests upsert.
+    """
+    if not events:
+        return
+    log = insert(ScoreEvent).values(events)
+
+    bests: dict[tuple, dict] = {}
+    for event in events:
+        for period in ScoreWindow:
+            key = (period.value, period_start(period, event["created_at"].date()), event["region_key"], event["user_id"])
+            current = bests.get(key)
+            if current is None or event["score"] > current["best_score"]:
+                bests[key] = {
+                    "period": key[0],
+                    "period_start": key[1],
+                    "region_key": key[2],
+                    "user_id": key[3],
+                    "country_code": event["country_code"],
+                    "best_score": event["score"],
+                    "date_best": event["created_at"],
+                }
+
+    table = ScoreWindowBest.__table__
+    stmt = insert_for(db, ScoreWindowBest).values(list(bests.values()))
+    new = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.period, table.c.period_start, table.c.region_key, table.c.user_id],
+        set_={
+            "best_score": _greatest(db, table.c.best_score, new.best_score),
+            "date_best": case((new.best_score > table.c.best_score, new.date_best), else_=table.c.date_best),
+            "country_code": func.coalesce(new.country_code, table.c.country_code),
+        },
+    )
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(stmt.add_cte(log.cte("logged")))
     else:
-        user_score = OverallScoreTable(
-            user_id=current_user.id,
-            max_score=score,
-            last_score=score,
-            date_max_score=datetime.utcnow(),
-            date_last_score=date.today(),
-            region_key=region_key,
-            country_code=country_code
+        db.execute(log)
+        db.execute(stmt)
+
+
+def _refresh_country_top(db: Session, countries):
+    """
+    Re-reads top_k_sum/top_k_count/top_k_min on shard 0 of `countries` from the first
+    COUNTRY_TOP_K rows of each in the country index. Shard 0 is locked first, in its own
+    statement, so the re-read sees every refresh committed before it.
+    """
+    countries = sorted(countries)
+    agg = CountryScoreAggregate.__table__
+    lock = insert_for(db, CountryScoreAggregate).values([
+        {"country_code": country, "shard": 0, "player_count": 0, "score_sum": 0, "top_k_sum": 0, "top_k_count": 0}
+        for country in countries
+    ])
+    db.execute(lock.on_conflict_do_update(
+        index_elements=[agg.c.country_code, agg.c.shard],
+        set_={"updated_at": datetime.utcnow()},
+    ))
+
+    scores = OverallScoreTable.__table__.alias("s")
+    top = (
+        select(scores.c.max_score.label("max_score"))
+        .where(
+            scores.c.region_key == "career",
+            scores.c.country_code == agg.c.country_code,
+            scores.c.max_score.isnot(None),
+        )
+        .order_by(scores.c.max_score.desc())
+        .limit(settings.COUNTRY_TOP_K)
+        .correlate(agg)
+        .subquery()
+    )
+    db.execute(
+        agg.update()
+        .where(agg.c.country_code.in_(countries), agg.c.shard == 0)
+        .values(
+            top_k_sum=select(func.coalesce(func.sum(top.c.max_score), 0)).scalar_subquery(),
+            top_k_count=select(func.count()).select_from(top).scalar_subquery(),
+            top_k_min=select(func.min(top.c.max_score)).scalar_subquery(),
+            updated_at=datetime.utcnow(),
         )
-        db.add(user_score)
+    )
+
+
+def _apply_country_deltas(db: Session, changes: list[ScoreChange]):
+    """
+    Folds career best-score changes into country_score_aggregates inside the caller's
+    transaction: one multi-row upsert adding (+players, +score) per country on a random
+    shard, where a player who moved country leaves their old best behind as a negative delta.
+    The top k is only re-read for countries where one of those bests reaches top_k_min
+    (or the top isn't full yet), which the same statement returns from shard 0.
+    """
+    deltas: dict[str, list[int]] = {}
+    candidates: dict[str, int] = {}
+    for change in changes:
+        row = change.row
+        if row.region_key != "career":
+            continue
+        old = (change.prev_country_code, change.prev_max_score)
+        new = (row.country_code, row.max_score)
+        if old == new:
+            continue
+        for (country, best), sign in ((old, -1), (new, 1)):
+            if country and best is not None:
+                delta = deltas.setdefault(country, [0, 0])
+                delta[0] += sign
+                delta[1] += sign * best
+                candidates[country] = max(candidates.get(country, best), best)
+    if not deltas:
+        return
+
+    table = CountryScoreAggregate.__table__
+    shard = random.randrange(max(1, settings.COUNTRY_AGGREGATE_SHARDS))
+    top = table.alias("top")
+
+    def on_top(col):
+        # RETURNING compila las columnas sin tabla: la correlación va con nombres explícitos
+        return (
+            select(literal_column(f"top.{col}"))
+            .select_from(top)
+            .where(
+                literal_column("top.country_code") == literal_column(f"{table.name}.country_code"),
+                literal_column("top.shard") == 0,
+            )
+            .scalar_subquery()
+        )
+
+    stmt = insert_for(db, CountryScoreAggregate).values([
+        {
+            "country_code": country, "shard": shard, "player_count": players, "score_sum": total,
+            "top_k_sum": 0, "top_k_count": 0,
+        }
+        for country, (players, total) in sorted(deltas.items())  # mismo orden de locks en todos los workers
+    ])
+    new = stmt.excluded
+    returned = db.execute(stmt.on_conflict_do_update(
+        index_elements=[table.c.country_code, table.c.shard],
+        set_={
+            "player_count": table.c.player_count + new.player_count,
+            "score_sum": table.c.score_sum + new.score_sum,
+        },
+    ).returning(table.c.country_code, on_top("top_k_count"), on_top("top_k_min"))).all()
+
+    stale = [
+        country
+        for country, top_count, top_min in returned
+        if top_count is None or top_count < settings.COUNTRY_TOP_K or top_min is None or candidates[country] >= top_min
+    ]
+    if stale:
+        _refresh_country_top(db, stale)
+
+
+def _apply_player_counts(db: Session, changes: list[ScoreChange]):
+    """
+    Keeps region_player_counts in step with the upserted rows, in the caller's transaction.
+    A row counts once it has a max_score; only first scores and country changes move a counter,
+    so most writes issue nothing.
+    """
+    def scopes(region_key, country_code):
+        return [(region_key, "")] + ([(region_key, country_code)] if country_code else [])
+
+    deltas: dict[tuple[str, str], int] = {}
+    for change in changes:
+        row = change.row
+        if change.prev_max_score is not None:
+            for scope in scopes(row.region_key, change.prev_country_code):
+                deltas[scope] = deltas.get(scope, 0) - 1
+        if row.max_score is not None:
+            for scope in scopes(row.region_key, row.country_code):
+                deltas[scope] = deltas.get(scope, 0) + 1
+    deltas = {scope: delta for scope, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    table = RegionPlayerCount.__table__
+    stmt = insert_for(db, RegionPlayerCount).values([
+        {"region_key": region_key, "country_code": country_code, "player_count": delta}
+        for (region_key, country_code), delta in sorted(deltas.items())
+    ])
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[table.c.region_key, table.c.country_code],
+        set_={"player_count": table.c.player_count + stmt.excluded.player_count},
+    ))
+
+
+def get_player_count(db: Session, region_key: str, country_code: str | None = None) -> int:
+    """Players with a score in the scope, from region_player_counts (a primary key lookup)."""
+    count = db.query(RegionPlayerCount.player_count).filter(
+        RegionPlayerCount.region_key == region_key,
+        RegionPlayerCount.country_code == (country_code or ""),
+    ).scalar()
+    return count or 0
+
+
+def rebuild_player_counts(db: Session) -> int:
+    """Recomputes region_player_counts with two GROUP BYs. Returns the number of scopes."""
+    scored = OverallScoreTable.max_score.isnot(None)
+    rows = db.execute(union_all(
+        select(OverallScoreTable.region_key, literal("").label("country_code"), func.count())
+        .where(scored)
+        .group_by(OverallScoreTable.region_key),
+        select(OverallScoreTable.region_key, OverallScoreTable.country_code, func.count())
+        .where(scored, OverallScoreTable.country_code.isnot(None), OverallScoreTable.country_code != "")
+        .group_by(OverallScoreTable.region_key, OverallScoreTable.country_code),
+    )).all()
+
+    db.query(RegionPlayerCount).delete(synchronize_session=False)
+    if rows:
+        db.execute(insert(RegionPlayerCount).values([
+            {"region_key": region_key, "country_code": country_code, "player_count": count}
+            for region_key, country_code, count in rows
+        ]))
+    db.commit()
+    return len(rows)
+
 
+def rebuild_country_aggregates(db: Session) -> int:
+    """
+    Recomputes country_score_aggregates from overall_score_table in one pass (GROUP BY plus
+    ROW_NUMBER per country for the top k), folding every country into shard 0.
+    Fixes any drift; returns the number of countries.
+    """
+    ranked = (
+        select(
+            OverallScoreTable.country_code,
+            OverallScoreTable.max_score,
+            func.row_number().over(
+                partition_by=OverallScoreTable.country_code,
+                order_by=OverallScoreTable.max_score.desc(),
+            ).label("pos"),
+        )
+        .where(
+            OverallScoreTable.region_key == "career",
+            OverallScoreTable.country_code.isnot(None),
+            OverallScoreTable.country_code != "",
+            OverallScoreTable.max_score.isnot(None),
+        )
+        .subquery()
+    )
+    in_top = ranked.c.pos <= settings.COUNTRY_TOP_K
+    rows = db.execute(
+        select(
+            ranked.c.country_code,
+            func.count(),
+            func.sum(ranked.c.max_score),
+            func.sum(case((in_top, ranked.c.max_score), else_=0)),
+            func.sum(case((in_top, 1), else_=0)),
+            func.min(case((in_top, ranked.c.max_score))),
+        ).group_by(ranked.c.country_code)
+    ).all()
+
+    db.query(CountryScoreAggregate).delete(synchronize_session=False)
+    if rows:
+        now = datetime.utcnow()
+        db.execute(insert(CountryScoreAggregate).values([
+            {
+                "country_code": country,
+                "shard": 0,
+                "player_count": players,
+                "score_sum": total,
+                "top_k_sum": top_sum,
+                "top_k_count": top_count,
+                "top_k_min": top_min,
+                "updated_at": now,
+            }
+            for country, players, total, top_sum, top_count, top_min in rows
+        ]))
+    db.commit()
+    country_leaderboard.clear()
+    return len(rows)
+
+
+def save_score(db: Session, score: int, current_user: User, region_key: str = "career", country_code: str | None = None):
+    """
+    Records a finished game in one transaction. On Postgres a typical submit is two statements:
+    the overall_score_table upsert, which also returns the previous best (see _upsert_scores;
+    it runs between SAVEPOINT and RELEASE), and the score_events/score_window_bests write. Only a new best or a change of country adds
+    the country delta, only a best that can enter the country's top k adds its re-read (two
+    statements), and only a first score or a change of country touches region_player_counts.
+    Every row is locked in the same order, so concurrent submits serialize instead of deadlocking.
+    """
+    now = datetime.utcnow()
+    user_id, username = current_user.id, current_user.username  # el commit expira current_user
+
+    [change] = _upsert_scores(db, [{
+        "user_id": user_id,
+        "max_score": score,
+        "last_score": score,
+        "date_max_score": now,
+        "date_last_score": date.today(),
+        "region_key": region_key,
+        "country_code": country_code,
+    }])
+    _record_events(db, [{
+        "user_id": user_id,
+        "region_key": region_key,
+        "country_code": change.row.country_code,
+        "score": score,
+        "created_at": now,
+    }])
+    _apply_country_deltas(db, [change])
+    _apply_player_counts(db, [change])
+    db.commit()
+
+    _score_written(change, username)
+    return change.row
+
+
+def save_scores_batch(db: Session, entries: list[PendingScore]) -> list[OverallScoreTable]:
+    """
+    Writes merged write-behind entries (one per user and region) in a single upsert,
+    plus their individual games to score_events.
+    """
+    if not entries:
+        return []
+    changes = _upsert_scores(db, [
+        {
+            "user_id": e.user_id,
+            "max_score": e.max_score,
+            "last_score": e.last_score,
+            "date_max_score": e.date_max_score,
+            "date_last_score": e.date_last_score,
+            "region_key": e.region_key,
+            "country_code": e.country_code,
+        }
+        for e in entries
+    ])
+    rows = [change.row for change in changes]
+    countries = {(row.user_id, row.region_key): row.country_code for row in rows}
+    _record_events(db, [
+        {
+            "user_id": e.user_id,
+            "region_key": e.region_key,
+            "country_code": countries[e.key],
+            "score": score,
+            "created_at": created_at,
+        }
+        for e in entries
+        for score, created_at in e.events
+    ])
+    _apply_country_deltas(db, changes)
+    _apply_player_counts(db, changes)
+    db.commit()
+
+    usernames = {e.key: e.username for e in entries}
+    for change in changes:
+        _score_written(change, usernames[(change.row.user_id, change.row.region_key)])
+    return rows
+
+
+def _flush_pending(entries: list[PendingScore]):
+    db = SessionLocal()
     try:
-        db.commit()
-        db.refresh(user_score)
-        return user_score
-    except IntegrityError:
-        db.rollback()
-        # Re-fetch en caso de race condition
-        existing = db.query(OverallScoreTable).filter(
-            OverallScoreTable.user_id == current_user.id,
-            OverallScoreTable.region_key == region_key
-        ).first()
-        
-        if existing:
-            if existing.max_score is None or score > existing.max_score:
-                existing.max_score = score
-                existing.date_max_score = datetime.utcnow()
-            existing.last_score = score
-            existing.date_last_score = date.today()
-            if country_code:
-                existing.country_code = country_code
-            db.add(existing)
-            db.commit()
-            db.refresh(existing)
-            return existing
-        else:
-            # This should technically not happen if IntegrityError was due to duplicate key
-            # But if it does, we can retry adding? Or just return None/Log error.
-            # Retry add
-            db.add(user_score)
-            db.commit()
-            db.refresh(user_score)
-            return user_score
+        save_scores_batch(db, entries)
+    finally:
+        db.close()
+
+
+# Modo write-behind (SCORE_WRITE_BEHIND): el flusher se arranca en el startup de main.py
+score_queue = ScoreQueue(
+    _flush_pending,
+    interval=settings.SCORE_FLUSH_INTERVAL_SECONDS,
+    batch_size=settings.SCORE_FLUSH_BATCH_SIZE,
+    spool_path=settings.SCORE_SPOOL_PATH,
+)
+
+
+def queue_score(
+    score: int,
+    current_user: User,
+    region_key: str = "career",
+    country_code: str | None = None,
+    stored: OverallScoreTable | None = None,
+) -> dict:
+    """
+    Queues a validated score for the next batched write and returns the provisional
+    record: the merged pending entry combined with the stored row (`stored`), if any.
+    """
+    now = datetime.utcnow()
+    merged = score_queue.submit(PendingScore(
+        user_id=current_user.id,
+        username=current_user.username,
+        region_key=region_key,
+        country_code=country_code,
+        max_score=score,
+        date_max_score=now,
+        last_score=score,
+        date_last_score=date.today(),
+        events=[(score, now)],
+    ))
+    return _provisional(merged, stored)
+
+
+def _provisional(pending: PendingScore, stored: OverallScoreTable | None) -> dict:
+    best_stored = stored is not None and stored.max_score is not None and stored.max_score >= pending.max_score
+    return {
+        "user_id": pending.user_id,
+        "region_key": pending.region_key,
+        "country_code": pending.country_code or (stored.country_code if stored else None),
+        "max_score": stored.max_score if best_stored else pending.max_score,
+        "date_max_score": stored.date_max_score if best_stored else pending.date_max_score,
+        "last_score": pending.last_score,
+        "date_last_score": pending.date_last_score,
+        "provisional": True,
+    }
+
+
+def provisional_history(stored: OverallScoreTable | None, user_id: int, region_key: str = "career") -> OverallScoreTable | None:
+    """
+    The stored row with the player's queued results merged in, as a transient row (never
+    added to the session): what validate_score_legitimacy compares against in write-behind mode.
+    """
+    pending = score_queue.pending(user_id, region_key)
+    if not pending:
+        return stored
+    values = _provisional(pending, stored)
+    del values["provisional"]
+    return OverallScoreTable(**values)
+
+
+def get_provisional_best(db: Session, user_id: int, region_key: str = "career") -> int | None:
+    """Best score including results still in the write-behind queue; None if there is none."""
+    history = provisional_history(get_user_best_score(db, user_id, region_key), user_id, region_key)
+    return history.max_score if history else None
 
 def get_ranking_query(db: Session, region_key: str | None = None, country_code: str | None = None):
     q = db.query(
         User.id,
         User.username,
-        User.profile_image,
+        User.profile_image.isnot(None),  # sólo el flag, no el blob
         OverallScoreTable.max_score,
         OverallScoreTable.date_max_score,
         OverallScoreTable.country_code,
@@ -93,11 +612,106 @@ def get_ranking_query(db: Session, region_key: str | None = None, country_code:
     # Always order by score desc, date asc (earliest best score wins)
     q = q.order_by(
         OverallScoreTable.max_score.desc(),
-        OverallScoreTable.date_max_score.asc(),
+        OverallScoreTable.date_max_score.asc().nulls_last(),
         User.username.asc(),
     )
     return q
 
+
+_RANK_COLUMNS = (OverallScoreTable.max_score, OverallScoreTable.date_max_score)
+_WINDOW_RANK_COLUMNS = (ScoreWindowBest.best_score, ScoreWindowBest.date_best)
+
+
+def _after_key(max_score: int, date_max_score: datetime | None, username: str, columns=_RANK_COLUMNS):
+    """
+    Seek predicate: rows strictly after (max_score, date_max_score, username) in get_ranking_query's
+    order. `columns` are the (score, date) columns ranked, _WINDOW_RANK_COLUMNS for windowed rankings.
+    """
+    score_col, date_col = columns
+
+    if date_max_score is None:
+        # La clave está en la cola sin fecha de su puntaje (NULLS LAST)
+        same_score = and_(date_col.is_(None), User.username > username)
+    else:
+        same_score = or_(
+            date_col > date_max_score,
+            date_col.is_(None),
+            and_(date_col == date_max_score, User.username > username),
+        )
+    # `score <= key` redundante: acota el rango del índice, el OR sólo filtra el empate
+    return and_(score_col <= max_score, or_(score_col < max_score, and_(score_col == max_score, same_score)))
+
+
+def _before_key(max_score: int, date_max_score: datetime | None, username: str):
+    """Mirror of _after_key: rows strictly before the key."""
+    score_col, date_col = OverallScoreTable.max_score, OverallScoreTable.date_max_score
+
+    if date_max_score is None:
+        same_score = or_(date_col.isnot(None), User.username < username)
+    else:
+        same_score = or_(
+            date_col < date_max_score,
+            and_(date_col == date_max_score, User.username < username),
+        )
+    return and_(score_col >= max_score, or_(score_col > max_score, and_(score_col == max_score, same_score)))
+
+
+def _after_cursor(cursor: str, columns=_RANK_COLUMNS):
+    """Raises ValueError if the cursor is malformed."""
+    return _after_key(*decode_cursor(cursor), columns=columns)
+
+
+def _page(q, limit: int, offset: int, cursor: str | None, columns=_RANK_COLUMNS):
+    # Con cursor se busca directo en el índice; offset queda por compatibilidad
+    if cursor:
+        return q.filter(_after_cursor(cursor, columns)).limit(limit).all()
+    return q.limit(limit).offset(offset).all()
+
+
+def next_cursor(rows: list[dict], limit: int) -> str | None:
+    """Cursor for the page after `rows` (formatted ranking rows), or None on the last page."""
+    if len(rows) < limit or not rows:
+        return None
+    last = rows[-1]
+    return encode_cursor(last["max_score"], last["date_max_score"], last["username"])
+
+EXPORT_COLUMNS = ("rank", "user_id", "username", "country_code", "region", "max_score", "date_max_score")
+
+
+def export_ranking(
+    db: Session,
+    region_key: str = "career",
+    country_code: str | None = None,
+    fmt: ExportFormat = ExportFormat.ndjson,
+    batch_size: int = settings.EXPORT_BATCH_SIZE,
+):
+    """
+    The whole leaderboard of a scope as NDJSON or CSV text, one chunk per fetched batch.
+    Rows come from a server-side cursor (yield_per) in ranking order, so memory stays flat
+    however many players there are. `rank` is get_user_rank's: ties on score and date share it.
+    """
+    query = get_ranking_query(db, region_key, country_code).filter(OverallScoreTable.max_score.isnot(None))
+    result = db.execute(query.statement, execution_options={"yield_per": batch_size})
+
+    if fmt == ExportFormat.csv:
+        yield ",".join(EXPORT_COLUMNS) + "\r\n"
+    position, rank, previous = 0, 0, None
+    for batch in result.partitions():
+        out = io.StringIO()
+        writer = csv.writer(out) if fmt == ExportFormat.csv else None
+        for user_id, username, _, max_score, date_max_score, country, region in batch:
+            position += 1
+            if (max_score, date_max_score) != previous:
+                rank, previous = position, (max_score, date_max_score)
+            when = date_max_score.isoformat() if date_max_score else None
+            if writer:
+                writer.writerow((rank, user_id, username, country or "", region, max_score, when or ""))
+            else:
+                out.write(json.dumps(dict(zip(EXPORT_COLUMNS, (rank, user_id, username, country, region, max_score, when)))))
+                out.write("\n")
+        yield out.getvalue()
+
+
 def format_ranking_result(rows):
     return [
         {
@@ -112,7 +726,7 @@ def format_ranking_result(rows):
         for r in rows
     ]
 
-def get_public_ranking(db: Session, limit: int = 10, offset: int = 0):
+def get_public_ranking(db: Session, limit: int = 10, offset: int = 0, cursor: str | None = None):
     # Global ranking (mixes all regions or just career? Usually "Global" implies "Career" mode or "Best of all"? 
     # Requirement: "global / país / región / mis scores"
     # Assuming Global means "Career" mode global leaderboard for now, or aggregation? 
@@ -121,19 +735,141 @@ def get_public_ranking(db: Session, limit: int = 10, offset: int = 0):
     # Let's filter by region_key='career' for the main global leaderboard to match "classic" ranking.
     # Or should we show the absolute best score across any region? 
     # Let's stick to 'career' as the default "Global" ranking context.
-    return get_region_scores(db, "career", limit, offset)
+    return get_region_scores(db, "career", limit, offset, cursor)
 
-def get_region_scores(db: Session, region_key: str, limit: int = 10, offset: int = 0):
-    rows = get_ranking_query(db, region_key=region_key).limit(limit).offset(offset).all()
+def get_region_scores(db: Session, region_key: str, limit: int = 10, offset: int = 0, cursor: str | None = None):
+    rows = _page(get_ranking_query(db, region_key=region_key), limit, offset, cursor)
     return format_ranking_result(rows)
 
-def get_country_scores(db: Session, country_code: str, limit: int = 10, offset: int = 0):
+def get_country_scores(db: Session, country_code: str, limit: int = 10, offset: int = 0, cursor: str | None = None):
     # Ranking within a country, usually for 'career' mode unless specified? 
     # The requirement isn't explicit if country ranking aggregates all regions. 
     # Let's assume 'career' mode for country ranking too for now.
-    rows = get_ranking_query(db, region_key="career", country_code=country_code).limit(limit).offset(offset).all()
+    rows = _page(get_ranking_query(db, region_key="career", country_code=country_code), limit, offset, cursor)
     return format_ranking_result(rows)
 
+def get_ranking_page(
+    db: Session,
+    region_key: str,
+    country_code: str | None,
+    limit: int,
+    offset: int,
+    cursor: str | None,
+    render: Callable[[list[dict]], bytes],
+    view: str = "scores",
+) -> tuple[bytes, str | None]:
+    """
+    (body, next cursor) for a ranking page, served from `ranking_pages` when possible.
+    Country pages are career-only, like get_country_scores, so their scope is ("career", country).
+    `render` serializes the rows; `view` separates the cache entries of different renderings.
+    Raises ValueError if the cursor is malformed.
+    """
+    scope = (region_key, country_code)
+    page = (view, limit, 0 if cursor else offset, cursor)
+    cached = ranking_pages.get_page(scope, page)
+    if cached is not None:
+        return cached
+
+    version = ranking_pages.version(scope)
+    if country_code:
+        rows = get_country_scores(db, country_code, limit, offset, cursor)
+    else:
+        rows = get_region_scores(db, region_key, limit, offset, cursor)
+    value = (render(rows), next_cursor(rows, limit))
+    last_key = None
+    if len(rows) == limit:
+        last = rows[-1]
+        last_key = rank_key(last["max_score"], last["date_max_score"], last["username"])
+    ranking_pages.set_page(scope, page, version, value, last_key)
+    return value
+
+
+def get_window_scores(
+    db: Session,
+    period: ScoreWindow,
+    region_key: str,
+    country_code: str | None = None,
+    limit: int = 10,
+    offset: int = 0,
+    cursor: str | None = None,
+    today: date | None = None,
+):
+    """
+    Ranking of the best scores within the current day / week / month, read from
+    score_window_bests. Same row shape and cursor as the all-time rankings, where
+    max_score is the period's best and date_max_score when it was set.
+    """
+    start = period_start(period, today or datetime.utcnow().date())
+    q = db.query(
+        User.id,
+        User.username,
+        User.profile_image.isnot(None),
+        ScoreWindowBest.best_score,
+        ScoreWindowBest.date_best,
+        ScoreWindowBest.country_code,
+        ScoreWindowBest.region_key,
+    ).join(User, User.id == ScoreWindowBest.user_id).filter(
+        ScoreWindowBest.period == ScoreWindow(period).value,
+        ScoreWindowBest.period_start == start,
+        ScoreWindowBest.region_key == region_key,
+    )
+    if country_code:
+        q = q.filter(ScoreWindowBest.country_code == country_code)
+    q = q.order_by(ScoreWindowBest.best_score.desc(), ScoreWindowBest.date_best.asc(), User.username.asc())
+    return format_ranking_result(_page(q, limit, offset, cursor, _WINDOW_RANK_COLUMNS))
+
+
+def get_country_leaderboard(db: Session, order: CountryOrder = CountryOrder.top, limit: int = 50) -> list[dict]:
+    """
+    Countries by career best scores: players, average best and the sum of their top
+    COUNTRY_TOP_K bests. Reads country_score_aggregates (a few rows per country), never the players.
+    """
+    cache_key = (order.value, limit)
+    cached = country_leaderboard.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # Suma sobre los shards; el top k sólo está en el shard 0 (los demás suman 0)
+    agg = CountryScoreAggregate
+    players = func.sum(agg.player_count)
+    score_sum = func.sum(agg.score_sum)
+    top_k_sum = func.sum(agg.top_k_sum)
+    average = score_sum * 1.0 / players
+    ordering = {
+        CountryOrder.top: (top_k_sum.desc(), players.desc()),
+        CountryOrder.average: (average.desc(), players.desc()),
+        CountryOrder.players: (players.desc(), top_k_sum.desc()),
+    }[order]
+    rows = (
+        db.query(
+            agg.country_code,
+            players.label("player_count"),
+            score_sum.label("score_sum"),
+            top_k_sum.label("top_k_sum"),
+            func.sum(agg.top_k_count).label("top_k_count"),
+        )
+        .group_by(agg.country_code)
+        .having(players > 0)
+        .order_by(*ordering, agg.country_code.asc())
+        .limit(limit)
+        .all()
+    )
+    # En Postgres SUM de BIGINT es numeric: se pasa a int antes de cachear/serializar
+    board = [
+        {
+            "rank": i,
+            "country_code": row.country_code,
+            "players": int(row.player_count),
+            "average_score": round(int(row.score_sum) / int(row.player_count), 1),
+            "top_k_sum": int(row.top_k_sum),
+            "top_k_count": int(row.top_k_count),
+        }
+        for i, row in enumerate(rows, start=1)
+    ]
+    country_leaderboard.set(cache_key, board)
+    return board
+
+
 def get_user_scores_history(db: Session, user_id: int, limit: int = 10, offset: int = 0):
     # Returns all scores for a user (different regions)
     q = db.query(OverallScoreTable).filter(OverallScoreTable.user_id == user_id).order_by(OverallScoreTable.date_last_score.desc())
@@ -160,13 +896,23 @@ def get_user_rank(db: Session, user_id: int, scope: ScoreScope, scope_value: str
         target_country = scope_value
         # If scope is country, we still need to know WHICH region we are ranking? 
         # Or is country ranking for "career"? Assume career.
+
+    # Índice en memoria: O(log n) sin tocar la DB. Frío (arrancando o desactualizado) -> SQL.
+    # Sin entrada también va a SQL: puede no haber jugado, o el índice va detrás de una
+    # escritura de otro worker
+    index = rank_index.get_index()
+    if settings.RANK_INDEX_ENABLED and index.ready:
+        ranked = index.rank(user_id, target_region, target_country)
+        if ranked:
+            return {**ranked, "region": target_region, "scope": scope}
     
     my_record = db.query(OverallScoreTable).filter(
         OverallScoreTable.user_id == user_id,
         OverallScoreTable.region_key == target_region
     ).first()
 
-    if not my_record:
+    # Fuera del ranking de un país en el que no está, igual que el índice
+    if not my_record or (scope == ScoreScope.country and my_record.country_code != target_country):
         return None
 
     # 2. Count how many better scores exist
@@ -179,14 +925,16 @@ def get_user_rank(db: Session, user_id: int, scope: ScoreScope, scope_value: str
     # Logic for "better":
     # (s.max_score > my.max_score) OR (s.max_score == my.max_score AND s.date_max_score < my.date_max_score)
     
-    q = db.query(func.count(OverallScoreTable.id)).filter(*filters)
+    q = db.query(func.count()).filter(*filters)
     
-    better_scores_count = q.filter(
-        (OverallScoreTable.max_score > my_record.max_score) |
-        ((OverallScoreTable.max_score == my_record.max_score) & (OverallScoreTable.date_max_score < my_record.date_max_score))
-    ).scalar()
+    better = OverallScoreTable.max_score > my_record.max_score
+    if my_record.date_max_score is not None:  # sin fecha propia sólo cuentan los puntajes más altos
+        better = better | (
+            (OverallScoreTable.max_score == my_record.max_score) & (OverallScoreTable.date_max_score < my_record.date_max_score)
+        )
+    better_scores_count = q.filter(better).scalar()
 
-    total_players = db.query(func.count(OverallScoreTable.id)).filter(*filters).scalar()
+    total_players = get_player_count(db, target_region, target_country)
 
     return {
         "rank": better_scores_count + 1,
@@ -196,45 +944,406 @@ def get_user_rank(db: Session, user_id: int, scope: ScoreScope, scope_value: str
         "scope": scope
     }
 
-def get_summary(db: Session, current_user: User):
-    # Parallelize or just sequential queries
-    # 1. Global (Career) Top
-    global_top = get_region_scores(db, "career", limit=10)
-    
-    # 2. Country Top (User's country, Career)
-    country_top = []
-    if current_user.country:
-        country_top = get_country_scores(db, current_user.country, limit=10)
-    
-    # 3. Region Top (Maybe "Americas" if user is from there? Or just omit/send career?)
-    # Requirement: "region_top". We can guess region from user country or just skip. 
-    # Or maybe "Europe" top? 
-    # Let's leave it empty or generic for now, user might have played multiple.
-    # Maybe return the leaderboard of the region the user LAST played or best performed?
-    # For now, let's return 'career' as global and maybe nothing for specific region unless asked.
-    # User requirement: "global_top, country_top, region_top"
-    # Let's try to infer user's "home region" from country code map (not implemented yet) or just skip.
-    
-    # 4. User Positions
-    user_positions = {
-        "global": get_user_rank(db, current_user.id, ScoreScope.global_scope),
-        "country": get_user_rank(db, current_user.id, ScoreScope.country, current_user.country) if current_user.country else None
-        # "region": ...
-    }
+def get_users_ranks(db: Session, user_ids: list[int], scope: ScoreScope, scope_value: str | None = None) -> list[dict]:
+    """
+    Rank, best score and scope total for several users at once (a friends list), in the
+    order given; users without a score in the scope come back with rank None. One index
+    lookup under a single lock (plus one query for ids it doesn't have), or one query
+    with RANK() over the scope while it is cold.
+    """
+    target_region, target_country = _scope_target(scope, scope_value)
 
-    # 5. User Best (Career)
-    user_best = get_user_best_score(db, current_user.id, "career")
-    
+    index = rank_index.get_index()
+    if settings.RANK_INDEX_ENABLED and index.ready:
+        found = index.ranks(user_ids, target_region, target_country)
+        missing = set(user_ids) - found.keys()
+        if missing:
+            found.update(_ranks_by_count(db, missing, target_region, target_country))
+    else:
+        filters = [OverallScoreTable.region_key == target_region, OverallScoreTable.max_score.isnot(None)]
+        if target_country:
+            filters.append(OverallScoreTable.country_code == target_country)
+        # Mismo criterio que get_user_rank: empates de puntaje y fecha comparten posición
+        ranked = (
+            select(
+                OverallScoreTable.user_id,
+                OverallScoreTable.max_score,
+                func.rank().over(order_by=(
+                    OverallScoreTable.max_score.desc(),
+                    OverallScoreTable.date_max_score.asc().nulls_last(),
+                )).label("rank"),
+                func.count().over().label("total_players"),
+            )
+            .where(*filters)
+            .subquery()
+        )
+        rows = db.execute(
+            select(ranked, User.username)
+            .join(User, User.id == ranked.c.user_id)
+            .where(ranked.c.user_id.in_(set(user_ids)))
+        ).all()
+        found = {
+            row.user_id: {
+                "username": row.username,
+                "rank": row.rank,
+                "max_score": row.max_score,
+                "total_players": row.total_players,
+            }
+            for row in rows
+        }
+
+    return [
+        {"user_id": user_id, **found.get(user_id, {"username": None, "rank": None, "max_score": None, "total_players": None})}
+        for user_id in user_ids
+    ]
+
+
+def _ranks_by_count(db: Session, user_ids, region_key: str, country_code: str | None) -> dict[int, dict]:
+    """
+    get_users_ranks for the ids the index has no entry for (never played, or a write the
+    index hasn't seen yet): get_user_rank's COUNT of better scores, per user, in one query.
+    """
+    me = OverallScoreTable.__table__.alias("me")
+    other = OverallScoreTable.__table__.alias("other")
+    mine = [me.c.user_id.in_(user_ids), me.c.region_key == region_key, me.c.max_score.isnot(None)]
+    scope = [other.c.region_key == region_key]
+    if country_code:
+        mine.append(me.c.country_code == country_code)
+        scope.append(other.c.country_code == country_code)
+    better = (
+        select(func.count())
+        .select_from(other)
+        .where(
+            *scope,
+            or_(
+                other.c.max_score > me.c.max_score,
+                and_(other.c.max_score == me.c.max_score, other.c.date_max_score < me.c.date_max_score),
+            ),
+        )
+        .scalar_subquery()
+    )
+    rows = db.execute(
+        select(me.c.user_id, User.username, me.c.max_score, better.label("better"))
+        .join(User, User.id == me.c.user_id)
+        .where(*mine)
+    ).all()
+    if not rows:
+        return {}
+    total = get_player_count(db, region_key, country_code)
     return {
-        "global_top": global_top,
-        "country_top": country_top,
-        "user_positions": user_positions,
-        "user_best": {
-             "max_score": user_best.max_score if user_best else 0,
-             "rank": user_positions["global"]["rank"] if user_positions["global"] else None
+        row.user_id: {
+            "username": row.username,
+            "rank": row.better + 1,
+            "max_score": row.max_score,
+            "total_players": total,
         }
+        for row in rows
+    }
+
+
+def _scope_target(scope: ScoreScope, scope_value: str | None) -> tuple[str, str | None]:
+    if scope == ScoreScope.region:
+        return scope_value, None
+    if scope == ScoreScope.country:
+        return "career", scope_value
+    return "career", None
+
+
+def _least(db: Session, a, b):
+    if db.get_bind().dialect.name == "sqlite":
+        return func.min(a, b)
+    return func.least(a, b)
+
+
+def get_score_distribution(db: Session, scope: ScoreScope, scope_value: str | None = None, buckets: int = 20) -> dict:
+    """
+    Histogram of best scores in the scope, `buckets` equal ranges over 0..SCORE_HISTOGRAM_MAX
+    (higher scores fall in the last one). Served from the rank index's Fenwick trees;
+    a single GROUP BY while the index is cold.
+    """
+    target_region, target_country = _scope_target(scope, scope_value)
+    cap = settings.SCORE_HISTOGRAM_MAX
+    width = -(-(cap + 1) // buckets)
+
+    index = rank_index.get_index()
+    if settings.RANK_INDEX_ENABLED and index.ready:
+        dist = index.distribution(target_region, target_country, width)
+    else:
+        filters = [OverallScoreTable.region_key == target_region, OverallScoreTable.max_score.isnot(None)]
+        if target_country:
+            filters.append(OverallScoreTable.country_code == target_country)
+        bucket = _least(db, _greatest(db, OverallScoreTable.max_score, 0), cap) // width
+        counts = dict(db.query(bucket, func.count()).filter(*filters).group_by(bucket).all())
+        dist = {
+            "total_players": sum(counts.values()),
+            "buckets": [
+                {"from": start, "to": min(start + width - 1, cap), "count": counts.get(start // width, 0)}
+                for start in range(0, cap + 1, width)
+            ],
+        }
+    return {**dist, "region": target_region, "country_code": target_country, "bucket_width": width, "scope": scope}
+
+
+def get_user_percentile(db: Session, user_id: int, scope: ScoreScope, scope_value: str | None = None) -> dict | None:
+    """
+    Share of players below the user's best score (`percentile`) and at or above it
+    (`top_percent`, the "top 3%" figure). O(log S) from the index; two COUNTs while it is cold.
+    """
+    target_region, target_country = _scope_target(scope, scope_value)
+
+    index = rank_index.get_index()
+    if settings.RANK_INDEX_ENABLED and index.ready:
+        standing = index.percentile(user_id, target_region, target_country)
+        if standing:
+            return {**standing, "region": target_region, "scope": scope}
+
+    mine = [OverallScoreTable.user_id == user_id, OverallScoreTable.region_key == target_region]
+    if target_country:
+        mine.append(OverallScoreTable.country_code == target_country)
+    my_score = db.query(OverallScoreTable.max_score).filter(*mine).scalar()
+    if my_score is None:
+        return None
+
+    filters = [OverallScoreTable.region_key == target_region, OverallScoreTable.max_score.isnot(None)]
+    if target_country:
+        filters.append(OverallScoreTable.country_code == target_country)
+    total = get_player_count(db, target_region, target_country)
+    if not total:
+        return None
+    # Mismo recorte que el histograma, para que frío y caliente den igual
+    cap = settings.SCORE_HISTOGRAM_MAX
+    below = db.query(func.count()).filter(
+        *filters,
+        _least(db, _greatest(db, OverallScoreTable.max_score, 0), cap + 1) < min(max(my_score, 0), cap + 1),
+    ).scalar()
+    return {
+        "max_score": my_score,
+        "total_players": total,
+        "percentile": round(100 * below / total, 1),
+        "top_percent": round(100 * (total - below) / total, 1),
+        "region": target_region,
+        "scope": scope,
     }
 
 
+def get_user_neighbours(db: Session, user_id: int, scope: ScoreScope, scope_value: str | None = None, k: int = 5):
+    """
+    The user's rank plus up to k players right above and right below in the scope.
+    Neighbours come from index seeks in both directions starting at the user's key
+    (or from the in-memory rank index), never from the ranking up to the user.
+    `position` is the 1-based row in the leaderboard order (offset + 1); it only
+    differs from `rank` on exact ties.
+    """
+    ranked = get_user_rank(db, user_id, scope, scope_value)
+    if not ranked:
+        return None
+    target_region, target_country = _scope_target(scope, scope_value)
+
+    index = rank_index.get_index()
+    if settings.RANK_INDEX_ENABLED and index.ready:
+        found = index.neighbours(user_id, target_region, target_country, k)
+        if found:
+            position, above_keys, below_keys = found
+            names = [key[2] for key in above_keys + below_keys]
+            rows = get_ranking_query(db, target_region, target_country).filter(User.username.in_(names)).all()
+            by_name = {row["username"]: row for row in format_ranking_result(rows)}
+            above = [by_name[key[2]] for key in above_keys if key[2] in by_name]
+            below = [by_name[key[2]] for key in below_keys if key[2] in by_name]
+            return _neighbours_payload(ranked, position, above, below)
+
+    mine = [OverallScoreTable.user_id == user_id, OverallScoreTable.region_key == target_region]
+    if target_country:
+        mine.append(OverallScoreTable.country_code == target_country)
+    me = (
+        db.query(OverallScoreTable.max_score, OverallScoreTable.date_max_score, User.username)
+        .join(User, User.id == OverallScoreTable.user_id)
+        .filter(*mine)
+        .first()
+    )
+    if not me:
+        # Tiene puntaje, pero no en ese país: no hay vecinos que mostrar
+        return None
+    key = (me.max_score, me.date_max_score, me.username)
+
+    below = format_ranking_result(
+        get_ranking_query(db, target_region, target_country).filter(_after_key(*key)).limit(k).all()
+    )
+    # Hacia arriba: el mismo índice recorrido al revés
+    above_query = get_ranking_query(db, target_region, target_country).filter(_before_key(*key)).order_by(None).order_by(
+        OverallScoreTable.max_score.asc(),
+        OverallScoreTable.date_max_score.desc().nulls_first(),
+        User.username.desc(),
+    )
+    above = format_ranking_result(above_query.limit(k).all())[::-1]
+
+    # Empates exactos de puntaje y fecha que van antes por username
+    filters = [
+        OverallScoreTable.region_key == target_region,
+        OverallScoreTable.max_score == me.max_score,
+        User.username < me.username,
+    ]
+    if target_country:
+        filters.append(OverallScoreTable.country_code == target_country)
+    if me.date_max_score is None:
+        filters.append(OverallScoreTable.date_max_score.is_(None))
+    else:
+        filters.append(OverallScoreTable.date_max_score == me.date_max_score)
+    ties_before = (
+        db.query(func.count())
+        .select_from(OverallScoreTable)
+        .join(User, User.id == OverallScoreTable.user_id)
+        .filter(*filters)
+        .scalar()
+    )
+
+    return _neighbours_payload(ranked, ranked["rank"] + ties_before, above, below)
+
+
+def _neighbours_payload(ranked: dict, position: int, above: list[dict], below: list[dict]) -> dict:
+    for i, row in enumerate(above):
+        row["position"] = position - len(above) + i
+    for i, row in enumerate(below):
+        row["position"] = position + 1 + i
+    return {**ranked, "position": position, "above": above, "below": below}
+
+
+def _no_count():
+    # NULL tipado: en Postgres un NULL sin tipo dentro de una subquery queda como text y rompe el UNION
+    return cast(null(), Integer)
+
+
+def _summary_top(section: str, limit: int, country_code: str | None = None):
+    filters = [OverallScoreTable.region_key == "career"]
+    if country_code:
+        filters.append(OverallScoreTable.country_code == country_code)
+    order = (
+        OverallScoreTable.max_score.desc(),
+        OverallScoreTable.date_max_score.asc().nulls_last(),
+        User.username.asc(),
+    )
+    return (
+        select(
+            literal(section).label("section"),
+            func.row_number().over(order_by=order).label("pos"),
+            User.id.label("user_id"),
+            User.username,
+            User.profile_image.isnot(None).label("has_profile_image"),
+            OverallScoreTable.max_score,
+            OverallScoreTable.date_max_score,
+            OverallScoreTable.country_code,
+            OverallScoreTable.region_key,
+            _no_count().label("better_global"),
+            _no_count().label("total_global"),
+            _no_count().label("better_country"),
+            _no_count().label("total_country"),
+        )
+        .join(User, User.id == OverallScoreTable.user_id)
+        .where(*filters)
+        .order_by(*order)
+        .limit(limit)
+    )
+
+
+def _summary_me(current_user: User, with_counts: bool):
+    me = OverallScoreTable.__table__.alias("me")
+    other = OverallScoreTable.__table__.alias("other")
+
+    def count(*filters):
+        if not with_counts:
+            return _no_count()
+        return select(func.count()).select_from(other).where(other.c.region_key == "career", *filters).scalar_subquery()
 
+    def total(country_code: str):
+        if not with_counts:
+            return _no_count()
+        counts = RegionPlayerCount.__table__
+        return func.coalesce(
+            select(counts.c.player_count)
+            .where(counts.c.region_key == "career", counts.c.country_code == country_code)
+            .scalar_subquery(),
+            0,
+        )
+
+    better = or_(
+        other.c.max_score > me.c.max_score,
+        and_(other.c.max_score == me.c.max_score, other.c.date_max_score < me.c.date_max_score),
+    )
+    same_country = other.c.country_code == current_user.country
+
+    return (
+        select(
+            literal("me").label("section"),
+            literal(0).label("pos"),
+            me.c.user_id,
+            literal(current_user.username).label("username"),
+            literal(current_user.profile_image is not None).label("has_profile_image"),
+            me.c.max_score,
+            me.c.date_max_score,
+            me.c.country_code,
+            me.c.region_key,
+            count(better).label("better_global"),
+            total("").label("total_global"),
+            (count(better, same_country) if current_user.country else _no_count()).label("better_country"),
+            (total(current_user.country) if current_user.country else _no_count()).label("total_country"),
+        )
+        .where(me.c.user_id == current_user.id, me.c.region_key == "career")
+    )
 
+
+def get_summary(db: Session, current_user: User, limit: int = 10):
+    """
+    Profile summary in a single round trip: global top, country top, the user's career
+    record and both rank counts come from one UNION ALL statement, split by `section`.
+    With a warm rank index the counts are left out of the SQL and read from memory.
+    """
+    index = rank_index.get_index()
+    use_index = settings.RANK_INDEX_ENABLED and index.ready
+
+    parts = [_summary_top("global", limit), _summary_me(current_user, with_counts=not use_index)]
+    if current_user.country:
+        parts.append(_summary_top("country", limit, current_user.country))
+    stmt = union_all(*(select(part.subquery()) for part in parts))
+
+    sections = {"global": [], "country": [], "me": []}
+    for row in sorted(db.execute(stmt).all(), key=lambda r: r.pos):
+        sections[row.section].append(row)
+
+    def ranking(rows):
+        return format_ranking_result([
+            (r.user_id, r.username, r.has_profile_image, r.max_score, r.date_max_score, r.country_code, r.region_key)
+            for r in rows
+        ])
+
+    me = sections["me"][0] if sections["me"] else None
+    user_positions = {"global": None, "country": None}
+    if me and use_index:
+        # get_user_rank lee del índice y, si le falta la entrada (escritura de otro worker), de SQL
+        user_positions["global"] = get_user_rank(db, current_user.id, ScoreScope.global_scope)
+        if current_user.country:
+            user_positions["country"] = get_user_rank(db, current_user.id, ScoreScope.country, current_user.country)
+    elif me:
+        user_positions["global"] = {
+            "rank": me.better_global + 1,
+            "max_score": me.max_score,
+            "total_players": me.total_global,
+            "region": "career",
+            "scope": ScoreScope.global_scope,
+        }
+        if current_user.country:
+            user_positions["country"] = {
+                "rank": me.better_country + 1,
+                "max_score": me.max_score,
+                "total_players": me.total_country,
+                "region": "career",
+                "scope": ScoreScope.country,
+            }
+
+    return {
+        "global_top": ranking(sections["global"]),
+        "country_top": ranking(sections["country"]),
+        "user_positions": user_positions,
+        "user_best": {
+             "max_score": me.max_score if me else 0,
+             "rank": user_positions["global"]["rank"] if user_positions["global"] else None
+        }
+    }
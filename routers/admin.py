@@ -0,0 +1,49 @@
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from typing import Optional
+
+from db.database import SessionLocal
+from dependencies import require_admin
+from repository import scores_repo
+from routers.scores import normalize_region
+from schemas.score import ExportFormat
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    dependencies=[Depends(require_admin)],
+)
+
+MEDIA_TYPES = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv; charset=utf-8",
+}
+
+
+def _stream_export(region_key: str, country_code: str | None, fmt: ExportFormat):
+    # Sesión propia: vive lo que dure el stream, no lo que dura el handler
+    db = SessionLocal()
+    try:
+        yield from scores_repo.export_ranking(db, region_key, country_code, fmt)
+    finally:
+        db.close()
+
+
+@router.get("/exports/scores")
+def export_scores(
+    format: ExportFormat = Query(default=ExportFormat.ndjson),
+    region: Optional[str] = None,
+    country_code: Optional[str] = None,
+):
+    """
+    Ranking completo de un scope (region, opcionalmente country_code) en NDJSON o CSV.
+    Se envía a medida que se lee, con memoria constante: para analytics y moderación.
+    """
+    region_key = normalize_region(region)
+    suffix = "".join(c for c in country_code if c.isalnum()) if country_code else ""
+    filename = f"scores-{region_key}{'-' + suffix if suffix else ''}.{format.value}"
+    return StreamingResponse(
+        _stream_export(region_key, country_code, format),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -0,0 +1,38 @@
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status
+
+from schemas import country_schema
+from utils import country_catalog
+from utils.limiter import limiter
+
+router = APIRouter(
+    prefix="/countries",
+    tags=["countries"]
+)
+
+# El catálogo sólo cambia al reiniciar el proceso; los navegadores/CDN pueden cachear un día.
+SUGGEST_CACHE_CONTROL = "public, max-age=86400"
+
+
+@router.get("/suggest", response_model=list[country_schema.CountrySuggestion])
+@limiter.limit("120/minute")
+def suggest_countries(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=60),
+    limit: int = Query(default=8, ge=1, le=20),
+    lang: str = Query(default="spa", min_length=3, max_length=3),
+):
+    """
+    Autocompletado de nombres de países (typeahead).
+    Resuelve contra el índice de prefijos en memoria, sin tocar la DB.
+    """
+    try:
+        catalog = country_catalog.get_catalog()
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Country catalog unavailable"
+        )
+
+    response.headers["Cache-Control"] = SUGGEST_CACHE_CONTROL
+    return catalog.suggest(q, limit=limit, lang=lang.lower())
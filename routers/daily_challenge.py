@@ -1,12 +1,15 @@
-import re
-from datetime import date
+import hashlib
+import json
+from datetime import date, datetime, timezone
 from typing import Annotated, Optional
 
-from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import RedirectResponse
 from sqlalchemy.orm import Session
 
 from db import database, models
-from dependencies import get_db, get_current_user_optional
+from dependencies import get_db, get_current_user_optional, get_current_active_user, get_anonymous_id
 from repository import daily_challenge_repo
 from schemas import daily_challenge_schema
 
@@ -18,60 +21,141 @@ router = APIRouter(
 from config import settings
 from fastapi import Request
 from utils.limiter import limiter
+from utils import share_card
+
+# Misma URL, distinta imagen según el nivel del jugador: el navegador revalida con el ETag
+FLAG_CACHE_CONTROL = "private, no-cache"
+# El estado de un reto del archivo depende del jugador y cambia con cada intento
+ARCHIVE_STATUS_CACHE_CONTROL = "private, no-cache"
+ARCHIVE_LIST_CACHE_CONTROL = "public, max-age=300"
+# La card de un día pasado no cambia más; la de hoy todavía no muestra la bandera (no spoilear)
+SHARE_CARD_PAST_CACHE_CONTROL = "public, max-age=31536000, immutable"
+SHARE_CARD_TODAY_CACHE_CONTROL = "public, max-age=3600"
+# Las URLs firmadas de /flags/ de días pasados son direccionadas por contenido: nunca cambian.
+# Las de hoy vencen a la medianoche UTC y sólo las guarda el navegador del jugador
+SIGNED_FLAG_CACHE_CONTROL = "public, max-age=31536000, immutable"
+SIGNED_FLAG_TODAY_CACHE_CONTROL = "private, max-age={max_age}"
+
+
+def _require_identity(user: Optional[models.User], x_anonymous_id: Optional[str]) -> Optional[int]:
+    user_id = user.id if user else None
+    if not user_id and not x_anonymous_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Must provide Authorization token or X-Anonymous-Id header"
+        )
+    return user_id
+
+
+def _get_archive_challenge(db: Session, challenge_date: date) -> models.DailyChallenge:
+    challenge = daily_challenge_repo.get_playable_challenge(db, challenge_date, daily_challenge_repo.utc_today())
+    if not challenge:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Challenge not found")
+    return challenge
+
+
+def _not_modified(request: Request, etag: str, headers: dict) -> Optional[Response]:
+    if daily_challenge_repo.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return None
+
+
+def _flag_response(
+    request: Request,
+    db: Session,
+    challenge: models.DailyChallenge,
+    attempt: models.DailyAttempt,
+) -> Response:
+    max_attempts = settings.DAILY_MAX_ATTEMPTS
+    effective_level = daily_challenge_repo.reveal_level_for(attempt, max_attempts)
+    etag = daily_challenge_repo.flag_etag(challenge, effective_level, max_attempts)
+    headers = {"ETag": etag, "Cache-Control": FLAG_CACHE_CONTROL}
+
+    not_modified = _not_modified(request, etag, headers)
+    if not_modified:
+        return not_modified
+
+    processed_image_bytes = daily_challenge_repo.get_flag_render(db, challenge, effective_level, max_attempts)
+    return Response(content=processed_image_bytes, media_type="image/png", headers=headers)
 
 
 @router.get("/today", response_model=daily_challenge_schema.DailyChallengeStatus)
 def get_daily_challenge(
     db: Annotated[Session, Depends(get_db)],
     user: Optional[models.User] = Depends(get_current_user_optional),
-    x_anonymous_id: Optional[str] = Header(None, alias="X-Anonymous-Id")
+    x_anonymous_id: Optional[str] = Depends(get_anonymous_id)
 ):
-    today = date.today()
+    today = daily_challenge_repo.utc_today()
     challenge = daily_challenge_repo.ensure_today_challenge(db, today)
-    
-    user_id = user.id if user else None
-    
-    # Validation
-    if x_anonymous_id:
-        if len(x_anonymous_id) > 64 or not re.match(r"^[a-zA-Z0-9-]+$", x_anonymous_id):
-            raise HTTPException(status_code=400, detail="Invalid anonymous ID format")
 
-    if not user_id and not x_anonymous_id:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Must provide Authorization token or X-Anonymous-Id header"
-        )
-        
+    user_id = _require_identity(user, x_anonymous_id)
+
     # Per requirement: "Si hay user válido -> usar user.id. Si no hay user válido -> usar X-Anonymous-Id"
     # We pass BOTH to repo, and repo logic (query filters) will handle prioritization.
     attempt = daily_challenge_repo.get_or_create_attempt(db, challenge, user_id, x_anonymous_id)
-    
+    streak = daily_challenge_repo.get_streak(db, user_id, x_anonymous_id, daily_challenge_repo.utc_today())
+
+    return daily_challenge_repo.build_status(attempt, challenge, settings.DAILY_MAX_ATTEMPTS, streak)
+
+
+@router.get("/today/bootstrap", response_model=daily_challenge_schema.DailyChallengeBootstrap)
+def get_daily_bootstrap(
+    db: Annotated[Session, Depends(get_db)],
+    inline: bool = Query(default=False, description="Incluir la bandera como data URL base64"),
+    user: Optional[models.User] = Depends(get_current_user_optional),
+    x_anonymous_id: Optional[str] = Depends(get_anonymous_id)
+):
+    """
+    Todo lo necesario para pintar la página del día en un solo request: el estado de /today
+    y la bandera al nivel correcto (inline, o como URL firmada cacheable).
+    Identidad, reto e intento se resuelven una sola vez.
+    """
+    user_id = _require_identity(user, x_anonymous_id)
+
+    today = daily_challenge_repo.utc_today()
+    challenge = daily_challenge_repo.ensure_today_challenge(db, today)
+    attempt = daily_challenge_repo.get_or_create_attempt(db, challenge, user_id, x_anonymous_id)
+    streak = daily_challenge_repo.get_streak(db, user_id, x_anonymous_id, today)
+
+    return daily_challenge_repo.build_bootstrap(
+        db, attempt, challenge, settings.DAILY_MAX_ATTEMPTS, streak, inline_flag=inline
+    )
+
+
+@router.get("/flags/{challenge_date}/{reveal_level}/{signature}.png")
+@limiter.limit("120/minute")
+def get_signed_flag(
+    request: Request,
+    challenge_date: date,
+    reveal_level: int,
+    signature: str,
+    db: Annotated[Session, Depends(get_db)],
+    expires: Optional[int] = None,
+):
+    """Render de bandera referenciado por /today/bootstrap (URL firmada; la de hoy vence al cambiar el día)."""
     max_attempts = settings.DAILY_MAX_ATTEMPTS
-    status_str = "solved" if attempt.solved else ("failed" if attempt.failed else "in_progress")
-    
-    hints_unlocked = daily_challenge_repo.build_hints(challenge, attempt.attempts_used, max_attempts)
-    share_text, share_url = daily_challenge_repo.build_share_payload(attempt, challenge, max_attempts, settings.BASE_URL)
-    
-    correct_answer = None
-    if attempt.solved or attempt.failed:
-        correct_answer = daily_challenge_schema.GuessAnswer(
-            name=challenge.country_name,
-            code=challenge.country_code
-        )
+    if not daily_challenge_repo.verify_flag_signature(
+        challenge_date, reveal_level, max_attempts, signature, expires
+    ):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Flag not found")
 
-    return {
-        "date": challenge.date,
-        "max_attempts": max_attempts,
-        "attempts_used": attempt.attempts_used,
-        "status": status_str,
-        "reveal_level": max_attempts if (attempt.solved or attempt.failed) else min(attempt.attempts_used, max_attempts),
-        "can_play": not (attempt.solved or attempt.failed),
-        "hints_unlocked": hints_unlocked,
-        "hints_total": 3 if max_attempts >= 4 else 2,
-        "share_text": share_text,
-        "share_url": share_url,
-        "correct_answer": correct_answer
-    }
+    challenge = daily_challenge_repo.get_challenge_by_date(db, challenge_date)
+    if not challenge:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Challenge not found")
+
+    etag = daily_challenge_repo.flag_etag(challenge, reveal_level, max_attempts)
+    if expires is None:
+        cache_control = SIGNED_FLAG_CACHE_CONTROL
+    else:
+        max_age = max(0, expires - int(datetime.now(timezone.utc).timestamp()))
+        cache_control = SIGNED_FLAG_TODAY_CACHE_CONTROL.format(max_age=max_age)
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    not_modified = _not_modified(request, etag, headers)
+    if not_modified:
+        return not_modified
+
+    image_bytes = daily_challenge_repo.get_flag_render(db, challenge, reveal_level, max_attempts)
+    return Response(content=image_bytes, media_type="image/png", headers=headers)
 
 
 @router.get("/today/flag")
@@ -80,36 +164,15 @@ def get_daily_flag(
     request: Request,
     db: Annotated[Session, Depends(get_db)],
     user: Optional[models.User] = Depends(get_current_user_optional),
-    x_anonymous_id: Optional[str] = Header(None, alias="X-Anonymous-Id")
+    x_anonymous_id: Optional[str] = Depends(get_anonymous_id)
 ):
-    # Validation
-    user_id = user.id if user else None
-    if x_anonymous_id:
-        if len(x_anonymous_id) > 64 or not re.match(r"^[a-zA-Z0-9-]+$", x_anonymous_id):
-            raise HTTPException(status_code=400, detail="Invalid anonymous ID format")
+    user_id = _require_identity(user, x_anonymous_id)
 
-    if not user_id and not x_anonymous_id:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Must provide Authorization token or X-Anonymous-Id header"
-        )
-
-    today = date.today()
+    today = daily_challenge_repo.utc_today()
     challenge = daily_challenge_repo.ensure_today_challenge(db, today)
     attempt = daily_challenge_repo.get_or_create_attempt(db, challenge, user_id, x_anonymous_id)
 
-    max_attempts = settings.DAILY_MAX_ATTEMPTS
-    effective_level = max_attempts if (attempt.solved or attempt.failed) else min(attempt.attempts_used, max_attempts)
-    
-    from utils.image_processing import pixelate_image
-    processed_image_bytes = pixelate_image(
-    challenge.flag_image_bytes,
-    effective_level,
-    seed_date=challenge.date,
-    max_level=max_attempts,
-)
-    
-    return Response(content=processed_image_bytes, media_type="image/png")
+    return _flag_response(request, db, challenge, attempt)
 
 
 @router.post("/today/guess", response_model=daily_challenge_schema.GuessResponse)
@@ -119,26 +182,218 @@ def guess_daily_challenge(
     guess: daily_challenge_schema.GuessRequest,
     db: Annotated[Session, Depends(get_db)],
     user: Optional[models.User] = Depends(get_current_user_optional),
-    x_anonymous_id: Optional[str] = Header(None, alias="X-Anonymous-Id")
+    x_anonymous_id: Optional[str] = Depends(get_anonymous_id)
 ):
-    today = date.today()
+    today = daily_challenge_repo.utc_today()
     challenge = daily_challenge_repo.ensure_today_challenge(db, today)
-    
-    user_id = user.id if user else None
-    
-    if x_anonymous_id:
-        if len(x_anonymous_id) > 64 or not re.match(r"^[a-zA-Z0-9-]+$", x_anonymous_id):
-            raise HTTPException(status_code=400, detail="Invalid anonymous ID format")
 
-    if not user_id and not x_anonymous_id:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Must provide Authorization token or X-Anonymous-Id header"
-        )
+    user_id = _require_identity(user, x_anonymous_id)
 
     attempt = daily_challenge_repo.get_or_create_attempt(db, challenge, user_id, x_anonymous_id)
-    
-    # Optional: Cooling check "last_guess_at" - skipped for now as not in critical path 
+
+    # Optional: Cooling check "last_guess_at" - skipped for now as not in critical path
     # unless requested (it was "Optional" in requirements)
 
     return daily_challenge_repo.submit_guess(db, attempt, guess.guess)
+
+
+@router.post("/merge-anonymous", response_model=daily_challenge_schema.MergeAnonymousResponse)
+def merge_anonymous_progress(
+    db: Annotated[Session, Depends(get_db)],
+    user: Annotated[models.User, Depends(get_current_active_user)],
+    x_anonymous_id: Optional[str] = Depends(get_anonymous_id)
+):
+    """
+    Pasa al usuario logueado el progreso jugado con X-Anonymous-Id.
+    /login y /token ya lo hacen si reciben el header; esto cubre sesiones ya iniciadas.
+    """
+    if not x_anonymous_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="X-Anonymous-Id header required")
+    return daily_challenge_repo.merge_anonymous_attempts(db, user.id, x_anonymous_id)
+
+
+@router.get("/archive", response_model=daily_challenge_schema.DailyChallengeArchivePage)
+def list_daily_challenge_archive(
+    response: Response,
+    db: Annotated[Session, Depends(get_db)],
+    before: Optional[date] = Query(default=None),
+    limit: int = Query(default=30, ge=1, le=100),
+):
+    """
+    Retos anteriores, del más reciente al más antiguo.
+    Paginación por cursor: pasar `next_before` de la respuesta como `before`.
+    """
+    today = daily_challenge_repo.utc_today()
+    before = min(before, today) if before else today
+    dates, next_before = daily_challenge_repo.list_archive(db, before, limit)
+
+    response.headers["Cache-Control"] = ARCHIVE_LIST_CACHE_CONTROL
+    return {
+        "items": [{"date": d} for d in dates],
+        "next_before": next_before,
+    }
+
+
+@router.get("/{challenge_date}", response_model=daily_challenge_schema.DailyChallengeStatus)
+def get_archive_challenge(
+    request: Request,
+    response: Response,
+    challenge_date: date,
+    db: Annotated[Session, Depends(get_db)],
+    user: Optional[models.User] = Depends(get_current_user_optional),
+    x_anonymous_id: Optional[str] = Depends(get_anonymous_id)
+):
+    """
+    Estado del jugador en un reto del archivo. Lleva un ETag del contenido:
+    mientras no juegue, revalidar cuesta un 304 sin cuerpo.
+    Mirar no es jugar: el intento (y el "started") recién se crea con la primera guess.
+    """
+    user_id = _require_identity(user, x_anonymous_id)
+    challenge = _get_archive_challenge(db, challenge_date)
+    attempt = (
+        daily_challenge_repo.get_attempt(db, challenge, user_id, x_anonymous_id)
+        or daily_challenge_repo.unsaved_attempt(challenge, user_id, x_anonymous_id)
+    )
+    streak = daily_challenge_repo.get_streak(db, user_id, x_anonymous_id, daily_challenge_repo.utc_today())
+
+    payload = daily_challenge_repo.build_status(attempt, challenge, settings.DAILY_MAX_ATTEMPTS, streak)
+    body = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    etag = f'"status-{hashlib.sha256(body.encode()).hexdigest()[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": ARCHIVE_STATUS_CACHE_CONTROL}
+    not_modified = _not_modified(request, etag, headers)
+    if not_modified:
+        return not_modified
+
+    response.headers.update(headers)
+    return payload
+
+
+@router.get("/{challenge_date}/flag")
+@limiter.limit("60/minute")
+def get_archive_flag(
+    request: Request,
+    challenge_date: date,
+    db: Annotated[Session, Depends(get_db)],
+    user: Optional[models.User] = Depends(get_current_user_optional),
+    x_anonymous_id: Optional[str] = Depends(get_anonymous_id)
+):
+    user_id = _require_identity(user, x_anonymous_id)
+    challenge = _get_archive_challenge(db, challenge_date)
+    attempt = (
+        daily_challenge_repo.get_attempt(db, challenge, user_id, x_anonymous_id)
+        or daily_challenge_repo.unsaved_attempt(challenge, user_id, x_anonymous_id)
+    )
+
+    if challenge.date < daily_challenge_repo.utc_today():
+        # Días pasados: redirigir al render firmado del nivel del jugador, que se cachea para
+        # siempre (public, immutable); sólo la redirección se revalida en cada intento
+        max_attempts = settings.DAILY_MAX_ATTEMPTS
+        level = daily_challenge_repo.reveal_level_for(attempt, max_attempts)
+        return RedirectResponse(
+            daily_challenge_repo.signed_flag_path(challenge, level, max_attempts),
+            status_code=status.HTTP_302_FOUND,
+            headers={"Cache-Control": FLAG_CACHE_CONTROL},
+        )
+    return _flag_response(request, db, challenge, attempt)
+
+
+@router.post("/{challenge_date}/guess", response_model=daily_challenge_schema.GuessResponse)
+@limiter.limit("10/minute")
+def guess_archive_challenge(
+    request: Request,
+    challenge_date: date,
+    guess: daily_challenge_schema.GuessRequest,
+    db: Annotated[Session, Depends(get_db)],
+    user: Optional[models.User] = Depends(get_current_user_optional),
+    x_anonymous_id: Optional[str] = Depends(get_anonymous_id)
+):
+    user_id = _require_identity(user, x_anonymous_id)
+    challenge = _get_archive_challenge(db, challenge_date)
+    attempt = daily_challenge_repo.get_or_create_attempt(db, challenge, user_id, x_anonymous_id)
+
+    return daily_challenge_repo.submit_guess(db, attempt, guess.guess)
+
+
+@router.get("/{challenge_date}/share-card/{pattern}.png")
+@limiter.limit("60/minute")
+def get_share_card(
+    request: Request,
+    challenge_date: date,
+    pattern: str,
+    db: Annotated[Session, Depends(get_db)],
+):
+    """
+    Imagen para compartir (Open Graph): fecha, puntaje y grilla del resultado.
+    `pattern` es una letra por intento: "g" acierto, "r" fallo (p. ej. "rrg", "rrrr").
+    """
+    max_attempts = settings.DAILY_MAX_ATTEMPTS
+    if not share_card.is_valid_pattern(pattern, max_attempts):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Share card not found")
+
+    today = daily_challenge_repo.utc_today()
+    challenge = daily_challenge_repo.get_challenge_by_date(db, challenge_date) if challenge_date <= today else None
+    if not challenge:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Challenge not found")
+
+    with_flag = challenge_date < today
+    etag = daily_challenge_repo.share_card_etag(challenge, pattern, with_flag)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": SHARE_CARD_PAST_CACHE_CONTROL if with_flag else SHARE_CARD_TODAY_CACHE_CONTROL,
+    }
+    not_modified = _not_modified(request, etag, headers)
+    if not_modified:
+        return not_modified
+
+    image_bytes = daily_challenge_repo.get_share_card(challenge, pattern, max_attempts, with_flag)
+    return Response(content=image_bytes, media_type="image/png", headers=headers)
+
+
+@router.get("/{challenge_date}/stats", response_model=daily_challenge_schema.DailyChallengeStats)
+def get_daily_challenge_stats(
+    challenge_date: date,
+    response: Response,
+    db: Annotated[Session, Depends(get_db)],
+):
+    """
+    Resultados agregados del día (tasa de acierto, distribución de intentos, tasa de fallo).
+    Se leen de los contadores por reto, no de daily_attempts.
+    """
+    today = daily_challenge_repo.utc_today()
+    challenge = daily_challenge_repo.get_challenge_by_date(db, challenge_date) if challenge_date <= today else None
+    if not challenge:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Challenge not found")
+
+    # Hoy los números se mueven con cada partida; los días anteriores casi no cambian
+    max_age = 60 if challenge_date == today else 3600
+    response.headers["Cache-Control"] = f"public, max-age={max_age}"
+    return daily_challenge_repo.get_challenge_stats(db, challenge, settings.DAILY_MAX_ATTEMPTS)
+
+
+@router.get("/{challenge_date}/leaderboard", response_model=daily_challenge_schema.DailyChallengeLeaderboard)
+def get_daily_challenge_leaderboard(
+    challenge_date: date,
+    response: Response,
+    db: Annotated[Session, Depends(get_db)],
+    limit: int = Query(default=10, ge=1, le=settings.DAILY_LEADERBOARD_SIZE),
+    user: Optional[models.User] = Depends(get_current_user_optional),
+):
+    """
+    Ranking del día entre usuarios registrados: menos intentos, después menos tiempo.
+    Con token incluye también la posición del usuario (`me`).
+    """
+    today = daily_challenge_repo.utc_today()
+    challenge = daily_challenge_repo.get_challenge_by_date(db, challenge_date) if challenge_date <= today else None
+    if not challenge:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Challenge not found")
+
+    page = daily_challenge_repo.get_leaderboard_top(db, challenge)
+    me = daily_challenge_repo.get_leaderboard_rank(db, challenge, user) if user else None
+
+    response.headers["Cache-Control"] = f"{'private' if user else 'public'}, max-age={settings.DAILY_LEADERBOARD_CACHE_TTL}"
+    return {
+        "date": challenge.date,
+        "total": page["total"],
+        "entries": page["entries"][:limit],
+        "me": me,
+    }
@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import text
 from dependencies import get_db
 from utils.limiter import limiter
+from utils import cache
 import logging
 
 logger = logging.getLogger(__name__)
@@ -41,3 +42,12 @@ async def health_ready(request: Request, db: Session = Depends(get_db)):
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail={"status": "fail", "db": "down"}
         )
+
+
+@router.get("/caches", status_code=status.HTTP_200_OK)
+@limiter.exempt
+async def health_caches(request: Request):
+    """
+    Size and hit rate of the in-process caches.
+    """
+    return {"caches": cache.all_stats()}
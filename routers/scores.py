@@ -1,9 +1,12 @@
-from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi import APIRouter, Depends, Query, HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from typing import Annotated, Optional
 
+from config import settings
 from schemas import user_schema, score
-from schemas.score import RegionEnum, ScoreScope
+from schemas.score import CountryOrder, RegionEnum, ScoreScope
 from repository import scores_repo
 from dependencies import get_current_active_user, get_db  # <-- Cambio aquí
 
@@ -51,14 +54,23 @@ async def save_score(
     
     # 1. Fetch user history for validation (for this specific region)
     user_history = scores_repo.get_user_best_score(db, current_user.id, region_key)
+    # En write-behind lo encolado todavía no está en la tabla: se valida contra el récord provisional
+    validation_history = (
+        scores_repo.provisional_history(user_history, current_user.id, region_key)
+        if settings.SCORE_WRITE_BEHIND else user_history
+    )
     
     # 2. Validate score
     from utils.score_validator import validate_score_legitimacy
     # Note: Validator warns/raises but returns True if valid
-    validate_score_legitimacy(score_data.score, score_data, user_history)
+    validate_score_legitimacy(score_data.score, score_data, validation_history)
     
     # 3. Save score
     # Use user's country from profile as the country_code for the score
+    if settings.SCORE_WRITE_BEHIND:
+        # Se escribe en el próximo lote; el récord devuelto es provisional
+        return scores_repo.queue_score(score_data.score, current_user, region_key, current_user.country, user_history)
+
     result = scores_repo.save_score(
         db=db, 
         score=score_data.score, 
@@ -76,10 +88,8 @@ async def get_my_best_score(
 ):
     """Obtiene la mejor puntuación histórica del usuario actual (Career)"""
     # Default to career for backward compatibility
-    record = scores_repo.get_user_best_score(db, current_user.id, "career")
-    if not record:
-        return {"max_score": 0}
-    return {"max_score": record.max_score}
+    best = scores_repo.get_provisional_best(db, current_user.id, "career")
+    return {"max_score": best or 0}
 
 
 @router.get("/me/position")
@@ -121,6 +131,128 @@ async def get_my_position(
     return rank_data
 
 
+@router.post("/ranks")
+async def get_users_ranks(
+    _: Annotated[user_schema.User, Depends(get_current_active_user)],
+    request: score.RankBatchRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Posición de varios usuarios a la vez (lista de amigos) en un scope, en una sola consulta.
+    Devuelve una entrada por user_id, en el mismo orden; rank None si no tiene puntaje ahí.
+    """
+    if not request.user_ids:
+        return []
+    if len(request.user_ids) > settings.RANK_BATCH_MAX_USERS:
+        raise HTTPException(400, f"At most {settings.RANK_BATCH_MAX_USERS} user_ids per request")
+
+    scope_value = None
+    if request.scope == ScoreScope.region:
+        scope_value = normalize_region(request.region)
+    elif request.scope == ScoreScope.country:
+        if not request.country_code:
+            raise HTTPException(400, "country_code required for country scope")
+        scope_value = request.country_code
+    elif request.scope == ScoreScope.user:
+        raise HTTPException(400, "scope must be global, country or region")
+
+    return scores_repo.get_users_ranks(db, request.user_ids, request.scope, scope_value)
+
+
+@router.get("/me/around")
+async def get_my_neighbours(
+    current_user: Annotated[user_schema.User, Depends(get_current_active_user)],
+    scope: ScoreScope = Query(default=ScoreScope.global_scope),
+    region: Optional[str] = None, # For 'region' scope
+    k: int = Query(default=5, ge=1, le=25),
+    db: Session = Depends(get_db)
+):
+    """
+    Posición del usuario y los k jugadores inmediatamente arriba y abajo en el scope.
+    Cada fila trae `position` (fila en el orden del ranking, offset + 1).
+    """
+    scope_value = None
+
+    if scope == ScoreScope.region:
+        scope_value = normalize_region(region)
+    elif scope == ScoreScope.country:
+        if not current_user.country:
+            return {"scope": scope, "rank": None, "max_score": 0, "total_players": 0, "above": [], "below": [], "message": "User has no country set"}
+        scope_value = current_user.country
+    elif scope == ScoreScope.user:
+        raise HTTPException(400, "scope must be global, country or region")
+
+    around = scores_repo.get_user_neighbours(db, current_user.id, scope, scope_value, k)
+    if not around:
+        return {"scope": scope, "rank": None, "max_score": 0, "total_players": 0, "above": [], "below": []}
+
+    return around
+
+
+@router.get("/me/percentile")
+async def get_my_percentile(
+    current_user: Annotated[user_schema.User, Depends(get_current_active_user)],
+    scope: ScoreScope = Query(default=ScoreScope.global_scope),
+    region: Optional[str] = None, # For 'region' scope
+    db: Session = Depends(get_db)
+):
+    """
+    Percentil del usuario en el scope: `top_percent` es el "top 3%" que muestra la UI.
+    Empates de puntaje cuentan juntos (a diferencia de /me/position).
+    """
+    scope_value = None
+
+    if scope == ScoreScope.region:
+        scope_value = normalize_region(region)
+    elif scope == ScoreScope.country:
+        if not current_user.country:
+            return {"scope": scope, "percentile": None, "top_percent": None, "max_score": 0, "total_players": 0, "message": "User has no country set"}
+        scope_value = current_user.country
+    elif scope == ScoreScope.user:
+        raise HTTPException(400, "scope must be global, country or region")
+
+    standing = scores_repo.get_user_percentile(db, current_user.id, scope, scope_value)
+    if not standing:
+        return {"scope": scope, "percentile": None, "top_percent": None, "max_score": 0, "total_players": 0}
+    return standing
+
+
+@router.get("/distribution")
+async def get_score_distribution(
+    scope: ScoreScope = Query(default=ScoreScope.global_scope),
+    region: Optional[str] = None,
+    country_code: Optional[str] = None,
+    buckets: int = Query(default=20, ge=1, le=200),
+    db: Session = Depends(get_db)
+):
+    """Histograma de mejores puntajes del scope en `buckets` rangos iguales."""
+    scope_value = None
+
+    if scope == ScoreScope.region:
+        scope_value = normalize_region(region)
+    elif scope == ScoreScope.country:
+        if not country_code:
+            raise HTTPException(400, "country_code required for country scope")
+        scope_value = country_code
+    elif scope == ScoreScope.user:
+        raise HTTPException(400, "scope must be global, country or region")
+
+    return scores_repo.get_score_distribution(db, scope, scope_value, buckets)
+
+
+@router.get("/countries")
+async def get_country_leaderboard(
+    order: CountryOrder = Query(default=CountryOrder.top),
+    limit: int = Query(default=50, ge=1, le=300),
+    db: Session = Depends(get_db)
+):
+    """
+    Ranking de países (career): jugadores, promedio de mejores puntajes y suma del top-k.
+    Sale de la tabla agregada, cacheada COUNTRY_LEADERBOARD_CACHE_TTL segundos.
+    """
+    return scores_repo.get_country_leaderboard(db, order, limit)
+
+
 @router.get("/summary")
 async def get_scores_summary(
     current_user: Annotated[user_schema.User, Depends(get_current_active_user)],
@@ -134,34 +266,76 @@ async def get_scores_summary(
     - User Positions
     - User Best
     """
-    return scores_repo.get_summary(db, current_user)
+    return scores_repo.get_summary(db, current_user, limit)
+
+
+def render_json(data) -> bytes:
+    """Same bytes FastAPI would send for `data`."""
+    return JSONResponse(content=jsonable_encoder(data)).body
+
+
+def ranking_response(
+    db: Session,
+    region_key: str,
+    country_code: str | None,
+    limit: int,
+    offset: int,
+    cursor: str | None,
+    render=render_json,
+    view: str = "scores",
+) -> Response:
+    """
+    Ranking page from the serialized-page cache. The body stays a plain list; the
+    X-Next-Cursor header carries the cursor for the next page.
+    """
+    body, next_page = scores_repo.get_ranking_page(db, region_key, country_code, limit, offset, cursor, render, view)
+    response = Response(content=body, media_type="application/json")
+    if next_page:
+        response.headers["X-Next-Cursor"] = next_page
+    return response
+
+
+def paginated(response: Response, rows: list[dict], limit: int) -> list[dict]:
+    """Adds the X-Next-Cursor header for uncached ranking pages; the body stays a plain list."""
+    cursor = scores_repo.next_cursor(rows, limit)
+    if cursor:
+        response.headers["X-Next-Cursor"] = cursor
+    return rows
 
 
 @router.get("/")
 async def get_scores(
+    response: Response,
     scope: score.ScoreScope = Query(default=score.ScoreScope.global_scope),
     limit: int = Query(default=10, ge=1, le=100),
     offset: int = Query(default=0, ge=0),
+    cursor: Optional[str] = Query(default=None, description="X-Next-Cursor de la página anterior; ignora offset"),
+    window: Optional[score.ScoreWindow] = Query(default=None, description="Ranking del día / semana / mes en curso (UTC)"),
     user_id: Optional[int] = None,
     country_code: Optional[str] = None,
     region: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
     """Obtiene rankings según el scope especificado"""
-    if scope == score.ScoreScope.global_scope:
-        return scores_repo.get_public_ranking(db, limit, offset)
-    
-    elif scope == score.ScoreScope.user:
+    if scope == score.ScoreScope.user:
         if not user_id:
             raise HTTPException(400, "user_id required for user scope")
         return scores_repo.get_user_scores_history(db, user_id, limit, offset)
-    
-    elif scope == score.ScoreScope.country:
+
+    target_region, target_country = "career", None
+    if scope == score.ScoreScope.country:
         if not country_code:
             raise HTTPException(400, "country_code required for country scope")
-        return scores_repo.get_country_scores(db, country_code, limit, offset)
-    
+        target_country = country_code
     elif scope == score.ScoreScope.region:
         # Normalize region
         target_region = normalize_region(region)
-        return scores_repo.get_region_scores(db, target_region, limit, offset)
\ No newline at end of file
+
+    try:
+        if window:
+            # Agregado chico por período; no pasa por el cache de páginas
+            rows = scores_repo.get_window_scores(db, window, target_region, target_country, limit, offset, cursor)
+            return paginated(response, rows, limit)
+        return ranking_response(db, target_region, target_country, limit, offset, cursor)
+    except ValueError:
+        raise HTTPException(400, "Invalid cursor")
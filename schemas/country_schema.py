@@ -0,0 +1,7 @@
+from pydantic import BaseModel
+
+
+class CountrySuggestion(BaseModel):
+    code: str   # cca3
+    name: str   # nombre común (lo que se envía como guess)
+    label: str  # nombre a mostrar en el idioma pedido
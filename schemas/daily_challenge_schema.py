@@ -14,6 +14,19 @@ class Hint(BaseModel):
     value: str
 
 
+class GuessFeedback(BaseModel):
+    guess: str
+    code: Optional[str] = None
+    distance_km: Optional[int] = None
+    bearing: Optional[int] = None     # grados desde el norte, de la guess hacia la respuesta
+    direction: Optional[str] = None   # N, NE, E, SE, S, SW, W, NW
+
+
+class Streak(BaseModel):
+    current: int = 0
+    best: int = 0
+
+
 class DailyChallengeStatus(BaseModel):
     date: date
     max_attempts: int
@@ -25,7 +38,20 @@ class DailyChallengeStatus(BaseModel):
     hints_total: int = 0
     share_text: Optional[str] = None
     share_url: Optional[str] = None
+    share_image_url: Optional[str] = None  # relativa a la API, para og:image
     correct_answer: Optional[GuessAnswer] = None
+    guesses: list[GuessFeedback] = []
+    streak: Streak = Streak()
+
+
+class FlagImage(BaseModel):
+    url: str                        # direccionada por contenido, cacheable indefinidamente
+    etag: str
+    data_url: Optional[str] = None  # sólo con ?inline=true
+
+
+class DailyChallengeBootstrap(DailyChallengeStatus):
+    flag: FlagImage
 
 
 class GuessRequest(BaseModel):
@@ -42,4 +68,50 @@ class GuessResponse(BaseModel):
     hints_unlocked: list[Hint] = []
     share_text: Optional[str] = None
     share_url: Optional[str] = None
+    share_image_url: Optional[str] = None
     correct_answer: Optional[GuessAnswer] = None
+    feedback: Optional[GuessFeedback] = None  # distancia y rumbo de la guess recién enviada
+    streak: Optional[Streak] = None  # sólo cuando la guess termina el reto de hoy
+
+
+class AttemptsBucket(BaseModel):
+    attempts: int
+    count: int
+
+
+class DailyChallengeStats(BaseModel):
+    date: date
+    players: int
+    solved: int
+    failed: int
+    solve_rate: float
+    failure_rate: float
+    attempts_distribution: list[AttemptsBucket] = []
+
+
+class DailyChallengeArchiveItem(BaseModel):
+    date: date
+
+
+class DailyChallengeArchivePage(BaseModel):
+    items: list[DailyChallengeArchiveItem] = []
+    next_before: Optional[date] = None
+
+
+class MergeAnonymousResponse(BaseModel):
+    reassigned: int  # días jugados sólo como anónimo, ahora del usuario
+    merged: int      # días jugados de las dos formas, resueltos por conflicto
+
+
+class LeaderboardEntry(BaseModel):
+    rank: int
+    username: str
+    attempts_used: int
+    solve_seconds: Optional[int] = None
+
+
+class DailyChallengeLeaderboard(BaseModel):
+    date: date
+    total: int  # usuarios registrados que resolvieron el reto
+    entries: list[LeaderboardEntry] = []
+    me: Optional[LeaderboardEntry] = None
@@ -17,12 +17,32 @@ class RegionEnum(str, Enum):
     africa = "africa"
     oceania = "oceania"
 
+class ScoreWindow(str, Enum):
+    day = "day"
+    week = "week"
+    month = "month"
+
+class CountryOrder(str, Enum):
+    top = "top"  # suma de los mejores COUNTRY_TOP_K
+    average = "average"
+    players = "players"
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
 class ScoreRequest(BaseModel):
     score: int
     game_duration_seconds: Optional[int] = None
     game_mode: Optional[str] = None
     game_region: Optional[str] = None # Input from frontend (URL or key)
 
+class RankBatchRequest(BaseModel):
+    user_ids: list[int]
+    scope: ScoreScope = ScoreScope.global_scope
+    region: Optional[str] = None # For 'region' scope
+    country_code: Optional[str] = None # For 'country' scope
+
 class ScoreResponse(BaseModel):
     id: int
     user_id: int
@@ -0,0 +1,57 @@
+import unittest
+
+from utils.country_catalog import CountryCatalog, fold
+
+
+def _country(cca3, common, spa=None, official=None):
+    return {
+        "cca3": cca3,
+        "name": {"common": common, "official": official or common},
+        "flags": {"png": f"https://flags/{cca3}.png"},
+        "translations": {"spa": {"common": spa or common, "official": spa or common}},
+        "altSpellings": [],
+    }
+
+
+CATALOG = CountryCatalog(sorted([
+    _country("PER", "Peru", "Perú"),
+    _country("POL", "Poland", "Polonia"),
+    _country("PRT", "Portugal"),
+    _country("CZE", "Czechia", "Chequia", official="Czech Republic"),
+    _country("DOM", "Dominican Republic", "República Dominicana"),
+    _country("URY", "Uruguay"),
+], key=lambda c: c["cca3"]))
+
+
+class TestCountryCatalog(unittest.TestCase):
+    def test_fold_strips_accents_and_case(self):
+        self.assertEqual(fold("  PERÚ "), "peru")
+        self.assertEqual(fold("República   Dominicana"), "republica dominicana")
+
+    def test_accent_insensitive_prefix(self):
+        codes = [s["code"] for s in CATALOG.suggest("peru")]
+        self.assertEqual(codes, ["PER"])
+        codes = [s["code"] for s in CATALOG.suggest("Perú")]
+        self.assertEqual(codes, ["PER"])
+
+    def test_translated_names_and_label(self):
+        result = CATALOG.suggest("polo", lang="spa")
+        self.assertEqual(result, [{"code": "POL", "name": "Poland", "label": "Polonia"}])
+
+    def test_word_prefix_ranks_after_full_prefix(self):
+        codes = [s["code"] for s in CATALOG.suggest("rep")]
+        # "República Dominicana" empieza por "rep"; "Czech Republic" sólo en la segunda palabra
+        self.assertEqual(codes, ["DOM", "CZE"])
+
+    def test_limit_and_empty_query(self):
+        self.assertEqual(len(CATALOG.suggest("p", limit=2)), 2)
+        self.assertEqual(CATALOG.suggest("   "), [])
+        self.assertEqual(CATALOG.suggest("zz"), [])
+
+    def test_position_lookup(self):
+        self.assertEqual(CATALOG.countries[CATALOG.position("URY")]["cca3"], "URY")
+        self.assertIsNone(CATALOG.position("XXX"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,593 @@
+import io
+import unittest
+from unittest import mock
+from datetime import date, datetime, timedelta, timezone
+
+import requests
+from fastapi import Request, Response
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from config import settings
+from db import database, models
+from repository import daily_challenge_repo, retention_repo
+from routers import daily_challenge
+from utils import country_catalog, share_card
+
+
+def make_session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    database.Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+
+def make_challenge(db, challenge_date=date(2026, 1, 10), name="Uruguay", code="URY"):
+    challenge = models.DailyChallenge(
+        date=challenge_date,
+        country_name=name,
+        country_code=code,
+        flag_image_bytes=b"png",
+        region="Americas",
+        subregion="South America",
+        latitude=-33.0,
+        longitude=-56.0,
+    )
+    db.add(challenge)
+    db.commit()
+    return challenge
+
+
+class TestDailyChallengeStats(unittest.TestCase):
+    def setUp(self):
+        self.db = make_session()
+        self.challenge = make_challenge(self.db)
+
+    def tearDown(self):
+        self.db.close()
+
+    def play(self, anonymous_id, guesses):
+        attempt = daily_challenge_repo.get_or_create_attempt(self.db, self.challenge, None, anonymous_id)
+        for guess in guesses:
+            daily_challenge_repo.submit_guess(self.db, attempt, guess)
+        return attempt
+
+    def test_counters_follow_outcomes(self):
+        self.play("a-1", ["uruguay"])
+        self.play("a-2", ["chile", "Uruguay"])
+        self.play("a-3", ["chile", "peru", "brasil", "argentina"])
+        self.play("a-4", ["chile"])
+
+        stats = daily_challenge_repo.get_challenge_stats(self.db, self.challenge, 4)
+        self.assertEqual(stats.players, 4)
+        self.assertEqual(stats.solved, 2)
+        self.assertEqual(stats.failed, 1)
+        self.assertEqual(stats.solve_rate, 0.5)
+        self.assertEqual(stats.failure_rate, 0.25)
+        self.assertEqual(
+            [(b.attempts, b.count) for b in stats.attempts_distribution],
+            [(1, 1), (2, 1), (3, 0), (4, 0)],
+        )
+
+    def test_finished_attempt_is_not_counted_twice(self):
+        attempt = self.play("a-1", ["uruguay"])
+        daily_challenge_repo.submit_guess(self.db, attempt, "uruguay")
+        stats = daily_challenge_repo.get_challenge_stats(self.db, self.challenge, 4)
+        self.assertEqual(stats.solved, 1)
+
+
+class TestMergeAnonymousAttempts(unittest.TestCase):
+    def setUp(self):
+        self.db = make_session()
+        self.user = models.User(username="ana", email="ana@example.com", is_verified=True)
+        self.db.add(self.user)
+        self.db.commit()
+        self.day1 = make_challenge(self.db, date(2026, 1, 10))
+        self.day2 = make_challenge(self.db, date(2026, 1, 11), name="Chile", code="CHL")
+        self.day3 = make_challenge(self.db, date(2026, 1, 12), name="Peru", code="PER")
+
+    def tearDown(self):
+        self.db.close()
+
+    def play(self, challenge, guesses, user_id=None, anonymous_id=None):
+        attempt = daily_challenge_repo.get_or_create_attempt(self.db, challenge, user_id, anonymous_id)
+        for guess in guesses:
+            daily_challenge_repo.submit_guess(self.db, attempt, guess)
+        return attempt
+
+    def user_attempt(self, challenge):
+        return (
+            self.db.query(models.DailyAttempt)
+            .filter_by(challenge_id=challenge.id, user_id=self.user.id)
+            .one()
+        )
+
+    def test_merge_rules(self):
+        # day1: sólo anónimo -> se reasigna
+        self.play(self.day1, ["uruguay"], anonymous_id="anon-1")
+        # day2: anónimo resolvió, usuario a medias -> gana el anónimo
+        self.play(self.day2, ["peru"], user_id=self.user.id)
+        self.play(self.day2, ["bolivia", "chile"], anonymous_id="anon-1")
+        # day3: usuario terminó -> se conserva el del usuario
+        self.play(self.day3, ["a", "b", "c", "d"], user_id=self.user.id)
+        self.play(self.day3, ["peru"], anonymous_id="anon-1")
+
+        result = daily_challenge_repo.merge_anonymous_attempts(self.db, self.user.id, "anon-1")
+        self.assertEqual(result, {"reassigned": 1, "merged": 2})
+        self.db.expire_all()
+
+        self.assertTrue(self.user_attempt(self.day1).solved)
+
+        day2 = self.user_attempt(self.day2)
+        self.assertTrue(day2.solved)
+        self.assertEqual(day2.attempts_used, 2)
+        self.assertEqual([g.guess_text for g in sorted(day2.guesses, key=lambda g: g.attempt_number)], ["bolivia", "chile"])
+
+        day3 = self.user_attempt(self.day3)
+        self.assertTrue(day3.failed)
+        self.assertEqual(len(day3.guesses), 4)
+
+        self.assertEqual(self.db.query(models.DailyAttempt).filter(models.DailyAttempt.user_id.is_(None)).count(), 0)
+        self.assertEqual(self.db.query(models.DailyGuess).count(), 1 + 2 + 4)
+
+        stats3 = daily_challenge_repo.get_challenge_stats(self.db, self.day3, 4)
+        self.assertEqual((stats3.players, stats3.solved, stats3.failed), (1, 0, 1))
+        stats2 = daily_challenge_repo.get_challenge_stats(self.db, self.day2, 4)
+        self.assertEqual((stats2.players, stats2.solved, stats2.failed), (1, 1, 0))
+
+    def test_merge_without_anonymous_progress(self):
+        result = daily_challenge_repo.merge_anonymous_attempts(self.db, self.user.id, "nobody")
+        self.assertEqual(result, {"reassigned": 0, "merged": 0})
+
+
+class TestGuessFeedback(unittest.TestCase):
+    def setUp(self):
+        self.db = make_session()
+        self.challenge = make_challenge(self.db)
+        countries = [
+            {"cca3": code, "name": {"common": name}, "flags": {"png": "x"}, "latlng": latlng}
+            for code, name, latlng in [("BRA", "Brazil", [-10.0, -55.0]), ("URY", "Uruguay", [-33.0, -56.0])]
+        ]
+        self._previous = country_catalog._catalog
+        country_catalog._catalog = country_catalog.CountryCatalog(countries)
+
+    def tearDown(self):
+        country_catalog._catalog = self._previous
+        self.db.close()
+
+    def test_wrong_guess_stores_distance_and_direction(self):
+        attempt = daily_challenge_repo.get_or_create_attempt(self.db, self.challenge, None, "a-1")
+        response = daily_challenge_repo.submit_guess(self.db, attempt, "Brazil")
+        self.assertEqual((response.feedback.code, response.feedback.direction), ("BRA", "S"))
+
+        daily_challenge_repo.submit_guess(self.db, attempt, "nowhere")
+        status = daily_challenge_repo.build_status(attempt, self.challenge, 4)
+        self.assertEqual([g["distance_km"] for g in status["guesses"]], [response.feedback.distance_km, None])
+
+
+class TestShareCard(unittest.TestCase):
+    def test_valid_patterns(self):
+        self.assertEqual(share_card.share_pattern([False, False, True]), "rrg")
+        for pattern in ("g", "rrrg", "rrrr"):
+            self.assertTrue(share_card.is_valid_pattern(pattern, 4))
+        for pattern in ("", "gg", "rrrrg", "rrr", "x"):
+            self.assertFalse(share_card.is_valid_pattern(pattern, 4))
+
+    def test_renders_are_cached_per_pattern(self):
+        db = make_session()
+        challenge = make_challenge(db)
+        attempt = daily_challenge_repo.get_or_create_attempt(db, challenge, None, "a-1")
+        daily_challenge_repo.submit_guess(db, attempt, "chile")
+        response = daily_challenge_repo.submit_guess(db, attempt, "uruguay")
+        self.assertEqual(response.share_image_url, "/daily-challenge/2026-01-10/share-card/rg.png")
+
+        first = daily_challenge_repo.get_share_card(challenge, "rg", 4, with_flag=False)
+        hits = daily_challenge_repo._share_cards.hits
+        self.assertEqual(daily_challenge_repo.get_share_card(challenge, "rg", 4, with_flag=False), first)
+        self.assertEqual(daily_challenge_repo._share_cards.hits, hits + 1)
+        self.assertTrue(first.startswith(b"\x89PNG"))
+        db.close()
+
+
+class TestPregenerate(unittest.TestCase):
+    def setUp(self):
+        self.db = make_session()
+        buffer = io.BytesIO()
+        Image.new("RGB", (32, 20), (0, 56, 168)).save(buffer, format="PNG")
+        self.flag = buffer.getvalue()
+        countries = [
+            {"cca3": code, "name": {"common": name}, "flags": {"png": f"https://flags.test/{code}.png"}, "latlng": latlng}
+            for code, name, latlng in [("BRA", "Brazil", [-10.0, -55.0]), ("URY", "Uruguay", [-33.0, -56.0])]
+        ]
+        self._previous = country_catalog._catalog
+        country_catalog._catalog = country_catalog.CountryCatalog(countries)
+
+    def tearDown(self):
+        country_catalog._catalog = self._previous
+        self.db.close()
+
+    def test_is_idempotent_over_days(self):
+        start = date(2026, 3, 1)
+        make_challenge(self.db, start + timedelta(days=2))
+
+        with mock.patch.object(daily_challenge_repo, "download_flag", return_value=self.flag) as download:
+            created = daily_challenge_repo.pregenerate_challenges(self.db, start, 5, max_level=4)
+            self.assertEqual(created, [start + timedelta(days=i) for i in (0, 1, 3, 4)])
+            self.assertEqual(download.call_count, 4)
+
+            self.assertEqual(daily_challenge_repo.pregenerate_challenges(self.db, start, 5, max_level=4), [])
+            self.assertEqual(download.call_count, 4)
+
+        self.assertEqual(self.db.query(models.DailyChallenge).count(), 5)
+        # Todos los niveles (0..4) de cada reto creado, y ninguno del que ya existía
+        self.assertEqual(self.db.query(models.DailyChallengeRender).count(), 4 * 5)
+        existing = daily_challenge_repo.get_challenge_by_date(self.db, start + timedelta(days=2))
+        self.assertEqual(
+            self.db.query(models.DailyChallengeRender).filter_by(challenge_id=existing.id).count(), 0
+        )
+
+    def test_download_failure_is_logged(self):
+        http = mock.Mock()
+        http.get.side_effect = requests.ConnectionError("offline")
+        with self.assertLogs("repository.daily_challenge_repo", "WARNING"):
+            with self.assertRaises(ValueError):
+                daily_challenge_repo.download_flag("https://flags.test/URY.png", http)
+
+
+class TestBootstrap(unittest.TestCase):
+    def setUp(self):
+        self.db = make_session()
+        self.challenge = make_challenge(self.db)
+        self.today = mock.patch.object(daily_challenge_repo, "utc_today", return_value=self.challenge.date)
+        self.today.start()
+
+    def tearDown(self):
+        mock.patch.stopall()
+        self.db.close()
+
+    def signed_parts(self, url):
+        path, _, query = url.partition("?expires=")
+        _, _, _, day, level, filename = path.split("/")
+        return day, level, filename.removesuffix(".png"), int(query) if query else None
+
+    def test_flag_reference_matches_reveal_level(self):
+        attempt = daily_challenge_repo.get_or_create_attempt(self.db, self.challenge, None, "a-1")
+        daily_challenge_repo.submit_guess(self.db, attempt, "chile")
+
+        payload = daily_challenge_repo.build_bootstrap(self.db, attempt, self.challenge, 4)
+        self.assertEqual(payload["reveal_level"], 1)
+        self.assertIsNone(payload["flag"]["data_url"])
+
+        day, level, signature, expires = self.signed_parts(payload["flag"]["url"])
+        self.assertEqual((day, level), ("2026-01-10", "1"))
+        with mock.patch.object(daily_challenge_repo, "datetime", wraps=datetime) as clock:
+            clock.now.return_value = datetime(2026, 1, 10, 12, tzinfo=timezone.utc)
+            self.assertTrue(daily_challenge_repo.verify_flag_signature(self.challenge.date, 1, 4, signature, expires))
+            # La misma firma no sirve para un nivel más revelado
+            self.assertFalse(daily_challenge_repo.verify_flag_signature(self.challenge.date, 4, 4, signature, expires))
+
+    def test_todays_url_expires_at_the_next_utc_day(self):
+        url = daily_challenge_repo.signed_flag_path(self.challenge, 4, 4)
+        _, _, signature, expires = self.signed_parts(url)
+        self.assertEqual(expires, int(datetime(2026, 1, 11, tzinfo=timezone.utc).timestamp()))
+        # Sin el vencimiento (o con otro) la firma no vale
+        self.assertFalse(daily_challenge_repo.verify_flag_signature(self.challenge.date, 4, 4, signature))
+        self.assertFalse(daily_challenge_repo.verify_flag_signature(self.challenge.date, 4, 4, signature, expires + 86400))
+        # Pasada la medianoche, la URL compartida ya no sirve
+        self.assertFalse(daily_challenge_repo.verify_flag_signature(self.challenge.date, 4, 4, signature, expires))
+
+        # Ya en el archivo, la URL no vence y puede ser inmutable
+        self.today.stop()
+        url = daily_challenge_repo.signed_flag_path(self.challenge, 4, 4)
+        _, _, signature, expires = self.signed_parts(url)
+        self.assertIsNone(expires)
+        self.assertTrue(daily_challenge_repo.verify_flag_signature(self.challenge.date, 4, 4, signature))
+
+    def test_todays_render_is_private(self):
+        max_attempts = settings.DAILY_MAX_ATTEMPTS
+        _, _, signature, expires = self.signed_parts(
+            daily_challenge_repo.signed_flag_path(self.challenge, 1, max_attempts)
+        )
+        etag = daily_challenge_repo.flag_etag(self.challenge, 1, max_attempts)
+        request = Request({
+            "type": "http", "method": "GET", "path": "/", "query_string": b"",
+            "headers": [(b"if-none-match", etag.encode())],
+        })
+        noon = datetime(2026, 1, 10, 12, tzinfo=timezone.utc)
+        with mock.patch.object(daily_challenge_repo, "datetime", wraps=datetime) as repo_clock, \
+                mock.patch.object(daily_challenge, "datetime", wraps=datetime) as router_clock:
+            repo_clock.now.return_value = router_clock.now.return_value = noon
+            response = daily_challenge.get_signed_flag(
+                request, self.challenge.date, 1, signature, self.db, expires
+            )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["cache-control"], "private, max-age=43200")
+
+
+class TestArchive(unittest.TestCase):
+    def setUp(self):
+        self.db = make_session()
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_list_archive_pages_by_cursor(self):
+        for day in range(1, 6):
+            make_challenge(self.db, date(2026, 1, day))
+
+        dates, next_before = daily_challenge_repo.list_archive(self.db, date(2026, 1, 5), 2)
+        self.assertEqual(dates, [date(2026, 1, 4), date(2026, 1, 3)])
+        self.assertEqual(next_before, date(2026, 1, 3))
+
+        dates, next_before = daily_challenge_repo.list_archive(self.db, next_before, 2)
+        self.assertEqual(dates, [date(2026, 1, 2), date(2026, 1, 1)])
+        self.assertIsNone(next_before)
+
+    def test_flag_render_is_cached_per_level(self):
+        buffer = io.BytesIO()
+        Image.new("RGB", (32, 20), (0, 56, 168)).save(buffer, format="PNG")
+        challenge = make_challenge(self.db)
+        challenge.flag_image_bytes = buffer.getvalue()
+        self.db.commit()
+        daily_challenge_repo._flag_renders.clear()
+
+        first = daily_challenge_repo.get_flag_render(self.db, challenge, 1, 4)
+        self.assertTrue(first.startswith(b"\x89PNG"))
+        self.assertEqual(self.db.query(models.DailyChallengeRender).count(), 1)
+
+        # Otro worker (caché de proceso vacía) lo lee de la tabla en vez de renderizar
+        daily_challenge_repo._flag_renders.clear()
+        self.assertEqual(daily_challenge_repo.get_flag_render(self.db, challenge, 1, 4), first)
+        hits = daily_challenge_repo._flag_renders.hits
+        self.assertEqual(daily_challenge_repo.get_flag_render(self.db, challenge, 1, 4), first)
+        self.assertEqual(daily_challenge_repo._flag_renders.hits, hits + 1)
+
+        daily_challenge_repo.get_flag_render(self.db, challenge, 2, 4)
+        self.assertEqual(self.db.query(models.DailyChallengeRender).count(), 2)
+
+    def test_past_challenge_is_playable(self):
+        today = date.today()
+        past = make_challenge(self.db, today - timedelta(days=3))
+        self.assertIsNone(daily_challenge_repo.get_playable_challenge(self.db, today + timedelta(days=1), today))
+        self.assertIsNone(daily_challenge_repo.get_playable_challenge(self.db, today - timedelta(days=4), today))
+
+        challenge = daily_challenge_repo.get_playable_challenge(self.db, past.date, today)
+        self.assertEqual(challenge.id, past.id)
+        attempt = daily_challenge_repo.get_or_create_attempt(self.db, challenge, None, "a-1")
+        daily_challenge_repo.submit_guess(self.db, attempt, "chile")
+        response = daily_challenge_repo.submit_guess(self.db, attempt, "uruguay")
+        self.assertEqual(response.status, "solved")
+
+        payload = daily_challenge_repo.build_status(attempt, challenge, 4)
+        self.assertEqual((payload["date"], payload["attempts_used"], payload["can_play"]), (past.date, 2, False))
+
+    def test_viewing_an_archive_day_does_not_start_it(self):
+        past = make_challenge(self.db, date.today() - timedelta(days=3))
+        request = Request({"type": "http", "method": "GET", "path": "/", "headers": [], "query_string": b""})
+
+        payload = daily_challenge.get_archive_challenge(request, Response(), past.date, self.db, None, "a-1")
+        self.assertEqual((payload["status"], payload["attempts_used"], payload["can_play"]), ("in_progress", 0, True))
+        self.assertEqual(self.db.query(models.DailyAttempt).count(), 0)
+        self.assertEqual(daily_challenge_repo.get_challenge_stats(self.db, past, 4).players, 0)
+
+        # La primera guess crea el intento y cuenta el "started"
+        attempt = daily_challenge_repo.get_or_create_attempt(self.db, past, None, "a-1")
+        daily_challenge_repo.submit_guess(self.db, attempt, "chile")
+        payload = daily_challenge.get_archive_challenge(request, Response(), past.date, self.db, None, "a-1")
+        self.assertEqual(payload["attempts_used"], 1)
+        self.assertEqual(daily_challenge_repo.get_challenge_stats(self.db, past, 4).players, 1)
+
+    def test_etag_matching(self):
+        etag = '"flag-2026-01-10-1-4-v1"'
+        self.assertTrue(daily_challenge_repo.etag_matches(etag, etag))
+        self.assertTrue(daily_challenge_repo.etag_matches(f"W/{etag}", etag))
+        self.assertTrue(daily_challenge_repo.etag_matches(f'"other", W/{etag}', etag))
+        self.assertTrue(daily_challenge_repo.etag_matches("*", etag))
+        self.assertFalse(daily_challenge_repo.etag_matches('"flag-2026-01-10-2-4-v1"', etag))
+        self.assertFalse(daily_challenge_repo.etag_matches(None, etag))
+
+
+class TestDailyStreaks(unittest.TestCase):
+    def setUp(self):
+        self.db = make_session()
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_consecutive_days_and_reset(self):
+        streak = models.DailyStreak(anonymous_id="a-1", current_streak=0, best_streak=0)
+        daily_challenge_repo.apply_streak_result(streak, date(2026, 1, 10), True)
+        daily_challenge_repo.apply_streak_result(streak, date(2026, 1, 11), True)
+        daily_challenge_repo.apply_streak_result(streak, date(2026, 1, 11), True)
+        self.assertEqual((streak.current_streak, streak.best_streak), (2, 2))
+
+        daily_challenge_repo.apply_streak_result(streak, date(2026, 1, 12), False)
+        daily_challenge_repo.apply_streak_result(streak, date(2026, 1, 14), True)
+        self.assertEqual((streak.current_streak, streak.best_streak), (1, 2))
+
+        # Si pasa más de un día sin resolver, la racha actual se muestra en 0
+        self.assertEqual(daily_challenge_repo.streak_payload(streak, date(2026, 1, 15)), {"current": 1, "best": 2})
+        self.assertEqual(daily_challenge_repo.streak_payload(streak, date(2026, 1, 16)), {"current": 0, "best": 2})
+
+    def test_only_today_counts(self):
+        # "Hoy" es el día UTC, no el del reloj local del servidor
+        utc_day = date(2026, 1, 10)
+        self.addCleanup(mock.patch.stopall)
+        mock.patch.object(daily_challenge_repo, "utc_today", return_value=utc_day).start()
+        today = make_challenge(self.db, utc_day)
+        old = make_challenge(self.db, utc_day - timedelta(days=3), name="Chile", code="CHL")
+
+        attempt = daily_challenge_repo.get_or_create_attempt(self.db, old, None, "a-1")
+        response = daily_challenge_repo.submit_guess(self.db, attempt, "chile")
+        self.assertIsNone(response.streak)
+
+        attempt = daily_challenge_repo.get_or_create_attempt(self.db, today, None, "a-1")
+        response = daily_challenge_repo.submit_guess(self.db, attempt, "uruguay")
+        self.assertEqual((response.streak.current, response.streak.best), (1, 1))
+        self.assertEqual(daily_challenge_repo.get_streak(self.db, None, "a-1", utc_day), {"current": 1, "best": 1})
+
+    def test_merge_keeps_best(self):
+        user = models.User(username="ana", email="ana@example.com", is_verified=True)
+        self.db.add_all([
+            user,
+            models.DailyStreak(
+                anonymous_id="anon-1", current_streak=3, best_streak=3,
+                last_solved_date=date(2026, 1, 12), last_played_date=date(2026, 1, 12),
+            ),
+        ])
+        self.db.commit()
+        self.db.add(models.DailyStreak(
+            user_id=user.id, current_streak=0, best_streak=5,
+            last_solved_date=date(2026, 1, 1), last_played_date=date(2026, 1, 2),
+        ))
+        self.db.commit()
+
+        daily_challenge_repo.merge_anonymous_attempts(self.db, user.id, "anon-1")
+
+        self.assertEqual(daily_challenge_repo.get_streak(self.db, user.id, None, date(2026, 1, 13)), {"current": 3, "best": 5})
+        self.assertEqual(self.db.query(models.DailyStreak).count(), 1)
+
+    def test_merge_does_not_revive_broken_streak(self):
+        user = models.User(username="ana", email="ana@example.com", is_verified=True)
+        self.db.add_all([
+            user,
+            models.DailyStreak(
+                anonymous_id="anon-1", current_streak=3, best_streak=3,
+                last_solved_date=date(2026, 1, 12), last_played_date=date(2026, 1, 12),
+            ),
+        ])
+        self.db.commit()
+        # Con la cuenta falló el día siguiente: la racha anónima ya estaba cortada
+        self.db.add(models.DailyStreak(
+            user_id=user.id, current_streak=0, best_streak=2,
+            last_solved_date=date(2026, 1, 5), last_played_date=date(2026, 1, 13),
+        ))
+        self.db.commit()
+
+        daily_challenge_repo.merge_anonymous_attempts(self.db, user.id, "anon-1")
+
+        self.assertEqual(daily_challenge_repo.get_streak(self.db, user.id, None, date(2026, 1, 13)), {"current": 0, "best": 3})
+
+
+class TestDailyLeaderboard(unittest.TestCase):
+    def setUp(self):
+        self.db = make_session()
+        self.challenge = make_challenge(self.db)
+        daily_challenge_repo._leaderboard_top.clear()
+
+    def tearDown(self):
+        self.db.close()
+
+    def solve(self, username, guesses, seconds):
+        user = models.User(username=username, email=f"{username}@example.com", is_verified=True)
+        self.db.add(user)
+        self.db.commit()
+        attempt = daily_challenge_repo.get_or_create_attempt(self.db, self.challenge, user.id, None)
+        attempt.created_at = datetime.utcnow() - timedelta(seconds=seconds)
+        self.db.commit()
+        for guess in guesses:
+            daily_challenge_repo.submit_guess(self.db, attempt, guess)
+        return user
+
+    def test_order_and_rank(self):
+        self.solve("lento", ["uruguay"], 90)
+        self.solve("rapido", ["uruguay"], 10)
+        third = self.solve("dos", ["chile", "uruguay"], 5)
+        self.solve("nada", ["a", "b", "c", "d"], 5)
+        daily_challenge_repo.get_or_create_attempt(self.db, self.challenge, None, "anon")
+
+        page = daily_challenge_repo.get_leaderboard_top(self.db, self.challenge)
+        self.assertEqual(page["total"], 3)
+        self.assertEqual([e["username"] for e in page["entries"]], ["rapido", "lento", "dos"])
+        self.assertEqual(daily_challenge_repo.get_leaderboard_rank(self.db, self.challenge, third)["rank"], 3)
+
+    def test_new_solve_invalidates_top(self):
+        self.solve("primero", ["uruguay"], 30)
+        self.assertEqual(daily_challenge_repo.get_leaderboard_top(self.db, self.challenge)["total"], 1)
+        self.solve("segundo", ["uruguay"], 3)
+        page = daily_challenge_repo.get_leaderboard_top(self.db, self.challenge)
+        self.assertEqual([e["username"] for e in page["entries"]], ["segundo", "primero"])
+
+    def test_merge_won_by_anonymous_solve_invalidates_top(self):
+        user = models.User(username="ana", email="ana@example.com", is_verified=True)
+        self.db.add(user)
+        self.db.commit()
+        mine = daily_challenge_repo.get_or_create_attempt(self.db, self.challenge, user.id, None)
+        daily_challenge_repo.submit_guess(self.db, mine, "chile")
+        anon = daily_challenge_repo.get_or_create_attempt(self.db, self.challenge, None, "anon-1")
+        for guess in ["peru", "bolivia", "uruguay"]:
+            daily_challenge_repo.submit_guess(self.db, anon, guess)
+        self.assertEqual(daily_challenge_repo.get_leaderboard_top(self.db, self.challenge)["total"], 0)
+
+        daily_challenge_repo.merge_anonymous_attempts(self.db, user.id, "anon-1")
+
+        page = daily_challenge_repo.get_leaderboard_top(self.db, self.challenge)
+        self.assertEqual([(e["username"], e["attempts_used"]) for e in page["entries"]], [("ana", 3)])
+
+
+class TestRetention(unittest.TestCase):
+    def setUp(self):
+        self.db = make_session()
+        self.challenge = make_challenge(self.db)
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_purge_in_batches_keeps_recent_finished_and_stats(self):
+        for i in range(5):
+            attempt = daily_challenge_repo.get_or_create_attempt(self.db, self.challenge, None, f"old-{i}")
+            daily_challenge_repo.submit_guess(self.db, attempt, "chile")
+        solved = daily_challenge_repo.get_or_create_attempt(self.db, self.challenge, None, "old-solved")
+        daily_challenge_repo.submit_guess(self.db, solved, "uruguay")
+        self.db.query(models.DailyAttempt).update({"updated_at": datetime(2025, 1, 1)})
+        self.db.commit()
+        daily_challenge_repo.get_or_create_attempt(self.db, self.challenge, None, "recent")
+
+        purged = retention_repo.purge_anonymous_attempts(self.db, datetime.utcnow() - timedelta(days=30), batch_size=2)
+
+        self.assertEqual(purged, 5)
+        kept = {a.anonymous_id for a in self.db.query(models.DailyAttempt)}
+        self.assertEqual(kept, {"old-solved", "recent"})
+        self.assertEqual(self.db.query(models.DailyGuess).count(), 1)
+        stats = daily_challenge_repo.get_challenge_stats(self.db, self.challenge, 4)
+        self.assertEqual((stats.players, stats.solved), (7, 1))
+
+        # Reabrir el día resuelto no crea otro intento ni vuelve a contar "started"
+        again = daily_challenge_repo.get_or_create_attempt(self.db, self.challenge, None, "old-solved")
+        self.assertEqual((again.id, again.solved), (solved.id, True))
+        self.assertEqual(daily_challenge_repo.get_challenge_stats(self.db, self.challenge, 4).players, 7)
+
+    def test_compaction_folds_shards(self):
+        for i in range(20):
+            attempt = daily_challenge_repo.get_or_create_attempt(self.db, self.challenge, None, f"p-{i}")
+            daily_challenge_repo.submit_guess(self.db, attempt, "uruguay")
+        before = daily_challenge_repo.get_challenge_stats(self.db, self.challenge, 4)
+
+        self.assertEqual(retention_repo.compact_daily_stats(self.db, date(2026, 1, 11)), 1)
+
+        shards = {s.shard for s in self.db.query(models.DailyChallengeStat)}
+        self.assertEqual(shards, {0})
+        self.assertEqual(daily_challenge_repo.get_challenge_stats(self.db, self.challenge, 4), before)
+        self.assertEqual(retention_repo.compact_daily_stats(self.db, date(2026, 1, 11)), 0)
+
+    def test_compaction_adds_to_shard_zero(self):
+        for i in range(10):
+            attempt = daily_challenge_repo.get_or_create_attempt(self.db, self.challenge, None, f"p-{i}")
+            daily_challenge_repo.submit_guess(self.db, attempt, "uruguay")
+        retention_repo.compact_daily_stats(self.db, date(2026, 1, 11))
+
+        # Jugado desde el archivo después de compactar: cae en otro shard y se suma en la próxima pasada
+        for i in range(10, 15):
+            attempt = daily_challenge_repo.get_or_create_attempt(self.db, self.challenge, None, f"p-{i}")
+            daily_challenge_repo.submit_guess(self.db, attempt, "uruguay")
+        before = daily_challenge_repo.get_challenge_stats(self.db, self.challenge, 4)
+        retention_repo.compact_daily_stats(self.db, date(2026, 1, 11))
+
+        stats = daily_challenge_repo.get_challenge_stats(self.db, self.challenge, 4)
+        self.assertEqual(stats, before)
+        self.assertEqual((stats.players, stats.solved), (15, 15))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+import numpy as np
+
+from utils.country_catalog import CountryCatalog
+from utils.geo import DistanceMatrix, compass_point, haversine_matrix
+
+
+def _country(cca3, common, latlng, spa=None):
+    return {
+        "cca3": cca3,
+        "name": {"common": common, "official": common},
+        "flags": {"png": f"https://flags/{cca3}.png"},
+        "translations": {"spa": {"common": spa or common, "official": spa or common}},
+        "altSpellings": [],
+        "latlng": latlng,
+    }
+
+
+class TestGeo(unittest.TestCase):
+    def test_haversine_matrix(self):
+        # Madrid -> Buenos Aires, ~10.000 km hacia el suroeste
+        distances, bearings = haversine_matrix(np.array([40.4168, -34.6037]), np.array([-3.7038, -58.3816]))
+        self.assertAlmostEqual(float(distances[0, 1]), 10040, delta=30)
+        self.assertEqual(float(distances[0, 0]), 0.0)
+        self.assertEqual(float(distances[0, 1]), float(distances[1, 0]))
+        self.assertEqual(compass_point(float(bearings[0, 1])), "SW")
+
+    def test_compass_points(self):
+        self.assertEqual([compass_point(b) for b in (0, 44, 46, 180, 300, 350)], ["N", "NE", "NE", "S", "NW", "N"])
+
+    def test_missing_coordinates(self):
+        matrix = DistanceMatrix.from_latlng([[0, 0], [], [0, 10]])
+        self.assertIsNone(matrix.feedback(0, 1))
+        self.assertEqual(matrix.feedback(0, 2)["direction"], "E")
+
+    def test_catalog_feedback_by_any_name(self):
+        catalog = CountryCatalog([
+            _country("ARG", "Argentina", [-34.0, -64.0]),
+            _country("BRA", "Brazil", [-10.0, -55.0], spa="Brasil"),
+            _country("URY", "Uruguay", [-33.0, -56.0]),
+        ])
+        feedback = catalog.feedback("brasil", "URY")
+        self.assertEqual(feedback["code"], "BRA")
+        self.assertEqual(feedback["direction"], "S")
+        self.assertGreater(feedback["distance_km"], 2000)
+        self.assertEqual(catalog.feedback("Uruguay", "URY")["distance_km"], 0)
+        self.assertIsNone(catalog.feedback("atlantis", "URY"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+import random
+import unittest
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from db import database, models
+from repository import scores_repo
+from schemas.score import ScoreScope
+from utils import rank_index
+from utils.rank_index import RankIndex
+from utils.score_histogram import ScoreHistogram
+
+
+class TestRankIndex(unittest.TestCase):
+    def test_rank_counts_strictly_better(self):
+        index = RankIndex()
+        t0 = datetime(2026, 1, 1)
+        index.load([
+            (1, "ana", "career", "URY", 100, t0),
+            (2, "beto", "career", "URY", 100, t0 + timedelta(days=1)),
+            (3, "caro", "career", "ARG", 300, t0),
+            (4, "dani", "career", "URY", 100, t0),
+        ])
+        self.assertEqual(index.rank(1, "career"), {"rank": 2, "max_score": 100, "total_players": 4})
+        self.assertEqual(index.rank(4, "career")["rank"], 2)
+        self.assertEqual(index.rank(2, "career")["rank"], 4)
+        self.assertEqual(index.rank(2, "career", "URY"), {"rank": 3, "max_score": 100, "total_players": 3})
+        self.assertIsNone(index.rank(1, "europe"))
+
+        index.update(2, "beto", "career", "ARG", 500, t0 + timedelta(days=2))
+        self.assertEqual(index.rank(2, "career")["rank"], 1)
+        self.assertEqual(index.rank(2, "career", "ARG")["total_players"], 2)
+        self.assertEqual(index.rank(1, "career", "URY")["total_players"], 2)
+
+    def test_updates_during_load_are_replayed(self):
+        index = RankIndex()
+
+        def rows():
+            yield (1, "ana", "career", None, 10, datetime(2026, 1, 1))
+            index.update(2, "beto", "career", None, 50, datetime(2026, 1, 2))
+
+        index.load(rows())
+        self.assertEqual(index.rank(2, "career")["rank"], 1)
+        self.assertEqual(index.rank(1, "career")["total_players"], 2)
+
+    def test_cold_after_max_age(self):
+        index = RankIndex(max_age=60)
+        self.assertFalse(index.ready)
+        index.load([])
+        self.assertTrue(index.ready)
+        index.loaded_at -= 61
+        self.assertFalse(index.ready)
+
+
+class TestScoreHistogram(unittest.TestCase):
+    def test_counts_match_brute_force(self):
+        rng = random.Random(3)
+        scores = [rng.randint(-5, 130) for _ in range(300)]
+        hist = ScoreHistogram.from_scores(scores[:200], max_score=100)
+        for score in scores[200:]:
+            hist.add(score)
+        for score in scores[:50]:
+            hist.add(score, -1)
+        live = scores[50:]
+
+        self.assertEqual(hist.total, len(live))
+        for s in range(-1, 101):
+            self.assertEqual(hist.count_at_most(s), sum(1 for x in live if max(x, 0) <= s), s)
+        buckets = hist.buckets(30)
+        self.assertEqual([(b["from"], b["to"]) for b in buckets], [(0, 29), (30, 59), (60, 89), (90, 100)])
+        self.assertEqual(sum(b["count"] for b in buckets), len(live))
+        self.assertEqual(buckets[-1]["count"], sum(1 for x in live if x >= 90))
+
+
+class TestRankIndexMatchesSql(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        database.Base.metadata.create_all(bind=engine)
+        self.Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        self.db = self.Session()
+        self.previous = rank_index._index
+        rank_index._index = RankIndex()
+
+    def tearDown(self):
+        rank_index._index = self.previous
+        self.db.close()
+
+    def test_same_ranks_as_sql(self):
+        rng = random.Random(7)
+        users = []
+        for i in range(40):
+            user = models.User(username=f"u{i:02d}", email=f"u{i}@example.com", country=rng.choice(["URY", "ARG"]))
+            self.db.add(user)
+            users.append(user)
+        self.db.commit()
+        for user in users:
+            for _ in range(3):
+                scores_repo.save_score(self.db, rng.randint(0, 20) * 10, user, "career", user.country)
+
+        expected = {
+            (u.id, scope): scores_repo.get_user_rank(self.db, u.id, scope, u.country if scope == ScoreScope.country else None)
+            for u in users for scope in (ScoreScope.global_scope, ScoreScope.country)
+        }
+
+        rank_index.rebuild(self.Session)
+        self.assertTrue(rank_index.get_index().ready)
+        for (user_id, scope), sql_rank in expected.items():
+            user = self.db.get(models.User, user_id)
+            value = user.country if scope == ScoreScope.country else None
+            self.assertEqual(scores_repo.get_user_rank(self.db, user_id, scope, value), sql_rank)
+
+    def test_null_date_and_other_country_same_as_sql(self):
+        users = []
+        for name, country in (("ana", "URY"), ("beto", "URY"), ("caro", "ARG")):
+            user = models.User(username=name, email=f"{name}@example.com", country=country)
+            self.db.add(user)
+            users.append(user)
+        self.db.commit()
+        for user in users:
+            scores_repo.save_score(self.db, 500, user, "career", user.country)
+        # Filas viejas sin fecha de récord: en SQL `date < NULL` nunca es "mejor"
+        self.db.query(models.OverallScoreTable).filter(
+            models.OverallScoreTable.user_id.in_([users[0].id, users[2].id])
+        ).update({"date_max_score": None}, synchronize_session=False)
+        self.db.commit()
+
+        cases = [(u.id, ScoreScope.global_scope, None) for u in users] + [
+            (u.id, ScoreScope.country, "URY") for u in users
+        ]
+        expected = {case: scores_repo.get_user_rank(self.db, *case) for case in cases}
+        expected_pct = {case: scores_repo.get_user_percentile(self.db, *case) for case in cases}
+        self.assertEqual(expected[(users[0].id, ScoreScope.global_scope, None)]["rank"], 1)
+        self.assertIsNone(expected[(users[2].id, ScoreScope.country, "URY")])
+
+        rank_index.rebuild(self.Session)
+        for case in cases:
+            self.assertEqual(rank_index.get_index().rank(case[0], "career", case[2]), (
+                {k: v for k, v in expected[case].items() if k not in ("region", "scope")} if expected[case] else None
+            ))
+            self.assertEqual(scores_repo.get_user_rank(self.db, *case), expected[case])
+            self.assertEqual(scores_repo.get_user_percentile(self.db, *case), expected_pct[case])
+
+    def test_same_distribution_and_percentiles_as_sql(self):
+        rng = random.Random(11)
+        users = []
+        for i in range(60):
+            user = models.User(username=f"u{i:02d}", email=f"u{i}@example.com", country=rng.choice(["URY", "ARG"]))
+            self.db.add(user)
+            users.append(user)
+        self.db.commit()
+        for user in users:
+            # Algunos por encima del tope del histograma
+            scores_repo.save_score(self.db, rng.choice([rng.randint(0, 2000), rng.randint(2001, 2600)]), user, "career", user.country)
+
+        scopes = [(ScoreScope.global_scope, None), (ScoreScope.country, "URY")]
+        expected_dist = [scores_repo.get_score_distribution(self.db, scope, value, 7) for scope, value in scopes]
+        expected_pct = {
+            (u.id, scope): scores_repo.get_user_percentile(self.db, u.id, scope, value)
+            for u in users for scope, value in scopes
+        }
+
+        rank_index.rebuild(self.Session)
+        self.assertEqual([scores_repo.get_score_distribution(self.db, scope, value, 7) for scope, value in scopes], expected_dist)
+        for (user_id, scope), sql_pct in expected_pct.items():
+            value = "URY" if scope == ScoreScope.country else None
+            self.assertEqual(scores_repo.get_user_percentile(self.db, user_id, scope, value), sql_pct)
+        self.assertEqual(expected_dist[0]["total_players"], 60)
+
+
+if __name__ == "__main__":
+    unittest.main()
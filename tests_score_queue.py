@@ -0,0 +1,198 @@
+import os
+import tempfile
+import unittest
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import event
+
+from db import models
+from repository import scores_repo
+from tests_scores import add_player, make_session
+from utils import rank_index
+from utils.rank_index import RankIndex
+from utils.score_queue import PendingScore, ScoreQueue
+
+T0 = datetime(2026, 3, 1, 12, 0)
+
+
+def pending(user_id, score, minutes=0, region_key="career", country="URY"):
+    return PendingScore(
+        user_id=user_id,
+        username=f"u{user_id}",
+        region_key=region_key,
+        country_code=country,
+        max_score=score,
+        date_max_score=T0 + timedelta(minutes=minutes),
+        last_score=score,
+        date_last_score=date(2026, 3, 1),
+    )
+
+
+class TestScoreQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.spool = os.path.join(self.tmp.name, "spool.jsonl")
+        self.batches = []
+        self.queue = ScoreQueue(self.batches.append, interval=60, batch_size=2, spool_path=self.spool)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def claimed(self):
+        return [name for name in os.listdir(self.tmp.name) if name != "spool.jsonl"]
+
+    def test_merge_keeps_max_and_latest(self):
+        self.queue.submit(pending(1, 300, minutes=0))
+        self.queue.submit(pending(1, 100, minutes=1, country=None))
+        merged = self.queue.submit(pending(1, 300, minutes=2))
+
+        self.assertEqual((merged.max_score, merged.date_max_score), (300, T0))
+        self.assertEqual(merged.last_score, 300)
+        self.assertEqual(merged.country_code, "URY")
+        self.assertEqual(len(self.queue), 1)
+
+        merged = self.queue.submit(pending(1, 400, minutes=3))
+        self.assertEqual((merged.max_score, merged.date_max_score), (400, T0 + timedelta(minutes=3)))
+
+    def test_flush_in_batches(self):
+        for user_id in range(5):
+            self.queue.submit(pending(user_id, 10))
+        self.assertEqual(self.queue.flush(), 5)
+        self.assertEqual([len(b) for b in self.batches], [2, 2, 1])
+        self.assertEqual(len(self.queue), 0)
+
+    def test_failed_flush_puts_entries_back(self):
+        def fail(entries):
+            self.queue.submit(pending(1, 50, minutes=5))  # llega durante el flush
+            raise RuntimeError("db down")
+
+        self.queue.flush_fn = fail
+        self.queue.submit(pending(1, 200))
+        with self.assertRaises(RuntimeError):
+            self.queue.flush()
+
+        entry = self.queue.pending(1, "career")
+        self.assertEqual((entry.max_score, entry.last_score), (200, 50))
+
+    def test_stop_spools_and_start_replays(self):
+        def fail(entries):
+            raise RuntimeError("db down")
+
+        self.queue.flush_fn = fail
+        self.queue.submit(pending(1, 200))
+        self.queue.submit(pending(2, 70, region_key="europe"))
+        self.queue.stop()
+        self.assertTrue(os.path.exists(self.spool))
+
+        restarted = ScoreQueue(self.batches.append, interval=60, batch_size=10, spool_path=self.spool)
+        self.assertEqual(restarted.replay_spool(), 2)
+        self.assertEqual(restarted.pending(1, "career"), pending(1, 200))
+        self.assertEqual(restarted.pending(2, "europe").max_score, 70)
+        # El spool queda tomado por este proceso y se borra recién cuando un flush lo escribió
+        self.assertFalse(os.path.exists(self.spool))
+        self.assertEqual(len(self.claimed()), 1)
+        self.assertEqual(restarted.flush(), 2)
+        self.assertEqual(self.claimed(), [])
+
+    def test_spool_survives_failed_replay_flush(self):
+        def fail(entries):
+            raise RuntimeError("db down")
+
+        self.queue.spool([pending(1, 200), pending(2, 70)])
+        restarted = ScoreQueue(fail, interval=60, batch_size=10, spool_path=self.spool)
+        restarted.replay_spool()
+        restarted.submit(pending(3, 10))
+        with self.assertRaises(RuntimeError):
+            restarted.flush()
+        self.assertEqual(len(self.claimed()), 1)
+
+        # Al apagar sin base se reescribe el spool con lo pendiente, sin duplicar lo reproducido
+        restarted.stop()
+        again = ScoreQueue(self.batches.append, interval=60, batch_size=10, spool_path=self.spool)
+        self.assertEqual(again.replay_spool(), 3)
+        self.assertEqual(len(self.claimed()), 1)
+
+    def test_workers_sharing_a_spool_replay_it_once(self):
+        self.queue.spool([pending(1, 200), pending(2, 70)])
+        first = ScoreQueue(self.batches.append, interval=60, batch_size=10, spool_path=self.spool)
+        second = ScoreQueue(self.batches.append, interval=60, batch_size=10, spool_path=self.spool)
+        self.assertEqual(first.replay_spool(), 2)
+        self.assertEqual(second.replay_spool(), 0)
+
+        # Lo que el segundo vuelca mientras el primero no escribió no se pierde ni se pisa
+        second.spool([pending(3, 40)])
+        self.assertEqual(first.flush(), 2)
+        self.assertTrue(os.path.exists(self.spool))
+        third = ScoreQueue(self.batches.append, interval=60, batch_size=10, spool_path=self.spool)
+        self.assertEqual(third.replay_spool(), 1)
+        self.assertEqual(third.pending(3, "career").max_score, 40)
+
+    def test_claim_of_a_dead_worker_is_replayed(self):
+        # Un pid que no existe: el worker murió con el spool tomado
+        with open(f"{self.spool}.999999999.0", "w", encoding="utf-8") as f:
+            f.write(pending(1, 200).to_json() + "\n")
+        self.assertEqual(self.queue.replay_spool(), 1)
+        self.assertEqual(self.queue.pending(1, "career").max_score, 200)
+
+
+class TestWriteBehindFlush(unittest.TestCase):
+    def setUp(self):
+        self.db = make_session()
+        self.previous = rank_index._index
+        rank_index._index = RankIndex()
+        self.ana = add_player(self.db, "ana", 500, T0 - timedelta(days=1))
+        self.beto = models.User(username="beto", email="beto@example.com", country="ARG")
+        self.db.add(self.beto)
+        self.db.commit()
+        self.db.refresh(self.ana)
+        self.db.refresh(self.beto)
+
+    def tearDown(self):
+        rank_index._index = self.previous
+        self.db.close()
+
+    def test_batch_upsert_keeps_stored_max(self):
+        queue = ScoreQueue(lambda entries: None, interval=60, batch_size=100, spool_path=os.devnull)
+        for user, score, minutes in ((self.ana, 200, 0), (self.beto, 90, 1), (self.beto, 40, 2)):
+            queue.submit(PendingScore(
+                user.id, user.username, "career", user.country, score,
+                T0 + timedelta(minutes=minutes), score, date(2026, 3, 1),
+            ))
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(self.db.get_bind(), "before_cursor_execute", listener)
+        rows = scores_repo.save_scores_batch(self.db, queue._take())
+        event.remove(self.db.get_bind(), "before_cursor_execute", listener)
+
+        self.assertEqual(len([sql for sql in statements if sql.startswith("INSERT INTO overall_score_table")]), 1)
+        by_user = {r.user_id: r for r in rows}
+        self.assertEqual((by_user[self.ana.id].max_score, by_user[self.ana.id].last_score), (500, 200))
+        self.assertEqual(by_user[self.ana.id].date_max_score, T0 - timedelta(days=1))
+        self.assertEqual((by_user[self.beto.id].max_score, by_user[self.beto.id].last_score), (90, 40))
+        self.assertEqual(by_user[self.beto.id].date_max_score, T0 + timedelta(minutes=1))
+
+    def test_provisional_best(self):
+        previous = scores_repo.score_queue
+        scores_repo.score_queue = ScoreQueue(lambda entries: None, interval=60, batch_size=100, spool_path=os.devnull)
+        try:
+            stored = scores_repo.get_user_best_score(self.db, self.ana.id)
+            result = scores_repo.queue_score(300, self.ana, "career", "URY", stored)
+            self.assertEqual((result["max_score"], result["last_score"], result["provisional"]), (500, 300, True))
+
+            result = scores_repo.queue_score(800, self.beto, "career", "ARG", None)
+            self.assertEqual(result["max_score"], 800)
+            self.assertEqual(scores_repo.get_provisional_best(self.db, self.beto.id), 800)
+            self.assertEqual(scores_repo.get_provisional_best(self.db, self.ana.id), 500)
+
+            # Lo que valida el router: récord guardado más lo encolado
+            history = scores_repo.provisional_history(stored, self.ana.id)
+            self.assertEqual((history.max_score, history.last_score), (500, 300))
+            self.assertNotIn(history, self.db)
+            self.assertEqual(scores_repo.provisional_history(None, self.beto.id).max_score, 800)
+        finally:
+            scores_repo.score_queue = previous
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,758 @@
+import csv
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+import unittest
+from datetime import date, datetime, timedelta
+
+from fastapi import HTTPException
+from pydantic import SecretStr
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from config import settings
+from db import database, models
+from repository import scores_repo
+from schemas.score import CountryOrder, ExportFormat, ScoreScope, ScoreWindow
+from utils import rank_index
+from utils.rank_index import RankIndex
+from utils.score_queue import PendingScore
+
+
+def make_session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    database.Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+
+def add_player(db, username, max_score, date_max_score, region_key="career", country="URY"):
+    user = models.User(username=username, email=f"{username}@example.com", country=country)
+    db.add(user)
+    db.flush()
+    row = models.OverallScoreTable(
+        user_id=user.id,
+        max_score=max_score,
+        last_score=max_score,
+        date_max_score=date_max_score,
+        region_key=region_key,
+        country_code=country,
+    )
+    db.add(row)
+    db.flush()
+    scores_repo.rebuild_player_counts(db)  # deja region_player_counts como lo dejaría save_score
+    return user
+
+
+class TestKeysetPagination(unittest.TestCase):
+    def setUp(self):
+        self.db = make_session()
+        t0 = datetime(2026, 1, 1)
+        # Empates de puntaje y de fecha, y filas viejas sin fecha
+        for i in range(23):
+            add_player(self.db, f"p{i:02d}", (i % 4) * 100, None if i % 7 == 0 else t0 + timedelta(days=i % 3))
+
+    def tearDown(self):
+        self.db.close()
+
+    def walk(self, fetch, limit):
+        rows, cursor = [], None
+        while True:
+            page = fetch(cursor)
+            rows.extend(page)
+            cursor = scores_repo.next_cursor(page, limit)
+            if not cursor:
+                return rows
+
+    def test_cursor_pages_match_offset_order(self):
+        expected = scores_repo.get_public_ranking(self.db, limit=100)
+        self.assertEqual(len(expected), 23)
+        for limit in (1, 5, 23):
+            rows = self.walk(lambda c: scores_repo.get_public_ranking(self.db, limit, cursor=c), limit)
+            self.assertEqual([r["username"] for r in rows], [r["username"] for r in expected])
+
+    def test_country_scope_and_bad_cursor(self):
+        add_player(self.db, "arg", 999, datetime(2026, 1, 1), country="ARG")
+        rows = self.walk(lambda c: scores_repo.get_country_scores(self.db, "URY", 4, cursor=c), 4)
+        self.assertEqual(len(rows), 23)
+        with self.assertRaises(ValueError):
+            scores_repo.get_public_ranking(self.db, 10, cursor="not-a-cursor")
+
+
+class TestNeighbours(unittest.TestCase):
+    def setUp(self):
+        self.db = make_session()
+        self.previous = rank_index._index
+        rank_index._index = RankIndex()
+        t0 = datetime(2026, 1, 1)
+        self.users = [
+            add_player(self.db, f"p{i:02d}", 1000 - (i // 2) * 10, t0, country="URY" if i % 2 else "ARG")
+            for i in range(15)
+        ]
+
+    def tearDown(self):
+        rank_index._index = self.previous
+        self.db.close()
+
+    def check(self, scope, scope_value=None):
+        ranking = (
+            scores_repo.get_ranking_query(self.db, "career", scope_value if scope == ScoreScope.country else None)
+            .all()
+        )
+        names = [r[1] for r in ranking]
+        for user in self.users:
+            if scope == ScoreScope.country and user.country != scope_value:
+                continue
+            around = scores_repo.get_user_neighbours(self.db, user.id, scope, scope_value, k=3)
+            i = names.index(user.username)
+            self.assertEqual(around["position"], i + 1)
+            self.assertEqual([r["username"] for r in around["above"]], names[max(0, i - 3):i])
+            self.assertEqual([r["username"] for r in around["below"]], names[i + 1:i + 4])
+            self.assertEqual([r["position"] for r in around["below"]], list(range(i + 2, i + 2 + len(around["below"]))))
+
+    def test_sql_and_index_agree(self):
+        for use_index in (False, True):
+            if use_index:
+                rank_index.get_index().load(
+                    (u.id, u.username, "career", u.country, s.max_score, s.date_max_score)
+                    for u in self.users for s in u.overall_score
+                )
+            with self.subTest(use_index=use_index):
+                self.check(ScoreScope.global_scope)
+                self.check(ScoreScope.country, "URY")
+
+    def test_neighbours_outside_country(self):
+        arg = next(u for u in self.users if u.country == "ARG")
+        for use_index in (False, True):
+            if use_index:
+                rank_index.get_index().load(
+                    (u.id, u.username, "career", u.country, s.max_score, s.date_max_score)
+                    for u in self.users for s in u.overall_score
+                )
+            with self.subTest(use_index=use_index):
+                self.assertIsNone(scores_repo.get_user_neighbours(self.db, arg.id, ScoreScope.country, "URY"))
+        self.assertIsNone(rank_index.get_index().neighbours(arg.id, "career", "URY", 3))
+
+    def test_batch_ranks(self):
+        ids = [u.id for u in self.users[::-3]] + [9999]
+        for use_index in (False, True):
+            if use_index:
+                rank_index.get_index().load(
+                    (u.id, u.username, "career", u.country, s.max_score, s.date_max_score)
+                    for u in self.users for s in u.overall_score
+                )
+            for scope, value in ((ScoreScope.global_scope, None), (ScoreScope.country, "URY")):
+                with self.subTest(use_index=use_index, scope=scope):
+                    statements = []
+                    listener = lambda *args: statements.append(args[2])
+                    event.listen(self.db.get_bind(), "before_cursor_execute", listener)
+                    batch = scores_repo.get_users_ranks(self.db, ids, scope, value)
+                    event.remove(self.db.get_bind(), "before_cursor_execute", listener)
+                    # En caliente, la única consulta es por los ids sin entrada en el índice (9999)
+                    self.assertEqual(len(statements), 1)
+
+                    self.assertEqual([r["user_id"] for r in batch], ids)
+                    self.assertIsNone(batch[-1]["rank"])
+                    for user, row in zip(self.users[::-3], batch):
+                        if scope == ScoreScope.country and user.country != value:
+                            self.assertIsNone(row["rank"])
+                            continue
+                        single = scores_repo.get_user_rank(self.db, user.id, scope, value)
+                        self.assertEqual(
+                            (row["rank"], row["max_score"], row["total_players"]),
+                            (single["rank"], single["max_score"], single["total_players"]),
+                        )
+
+    def test_index_miss_falls_back_to_sql(self):
+        rank_index.get_index().load(
+            (u.id, u.username, "career", u.country, s.max_score, s.date_max_score)
+            for u in self.users for s in u.overall_score
+        )
+        # Escrito por otro worker después de cargar el índice: este proceso no lo vio
+        late = add_player(self.db, "tarde", 975, datetime(2026, 1, 2), country="URY")
+        self.assertIsNone(rank_index.get_index().rank(late.id, "career"))
+
+        ranked = scores_repo.get_user_rank(self.db, late.id, ScoreScope.global_scope)
+        self.assertEqual((ranked["rank"], ranked["max_score"], ranked["total_players"]), (7, 975, 16))
+        batch = scores_repo.get_users_ranks(self.db, [late.id, self.users[0].id], ScoreScope.country, "URY")
+        self.assertEqual([(r["username"], r["rank"]) for r in batch], [("tarde", 4), (None, None)])
+        self.assertEqual(scores_repo.get_user_percentile(self.db, late.id, ScoreScope.global_scope)["max_score"], 975)
+
+        around = scores_repo.get_user_neighbours(self.db, late.id, ScoreScope.global_scope, k=1)
+        self.assertEqual(
+            ([r["username"] for r in around["above"]], around["position"], [r["username"] for r in around["below"]]),
+            (["p05"], 7, ["p06"]),
+        )
+
+        summary = scores_repo.get_summary(self.db, late)
+        self.assertEqual(summary["user_positions"]["global"], ranked)
+        self.assertEqual(summary["user_positions"]["country"]["rank"], 4)
+
+
+class TestSummary(unittest.TestCase):
+    def setUp(self):
+        self.db = make_session()
+        self.previous = rank_index._index
+        rank_index._index = RankIndex()
+        t0 = datetime(2026, 1, 1)
+        for i in range(30):
+            add_player(self.db, f"p{i:02d}", (i * 37) % 500, t0 + timedelta(hours=i), country="URY" if i % 3 else "ARG")
+        self.me = self.db.query(models.User).filter_by(username="p10").one()
+
+    def tearDown(self):
+        rank_index._index = self.previous
+        self.db.close()
+
+    def count_queries(self, fn):
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        engine = self.db.get_bind()
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            return fn(), len(statements)
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+
+    def test_single_query_same_result(self):
+        summary, queries = self.count_queries(lambda: scores_repo.get_summary(self.db, self.me))
+        self.assertEqual(queries, 1)
+
+        self.assertEqual(summary["global_top"], scores_repo.get_region_scores(self.db, "career", 10))
+        self.assertEqual(summary["country_top"], scores_repo.get_country_scores(self.db, "URY", 10))
+        self.assertEqual(summary["user_positions"]["global"], scores_repo.get_user_rank(self.db, self.me.id, ScoreScope.global_scope))
+        self.assertEqual(
+            summary["user_positions"]["country"],
+            scores_repo.get_user_rank(self.db, self.me.id, ScoreScope.country, "URY"),
+        )
+        self.assertEqual(summary["user_best"]["rank"], summary["user_positions"]["global"]["rank"])
+
+    def test_user_without_scores(self):
+        user = models.User(username="nuevo", email="nuevo@example.com")
+        self.db.add(user)
+        self.db.commit()
+        summary = scores_repo.get_summary(self.db, user)
+        self.assertEqual(summary["user_positions"], {"global": None, "country": None})
+        self.assertEqual(summary["user_best"], {"max_score": 0, "rank": None})
+        self.assertEqual(len(summary["global_top"]), 10)
+
+
+class TestRankingPageCache(unittest.TestCase):
+    def setUp(self):
+        self.db = make_session()
+        self.previous = rank_index._index
+        rank_index._index = RankIndex()
+        scores_repo.ranking_pages.clear()
+        t0 = datetime(2026, 1, 1)
+        for i in range(30):
+            add_player(self.db, f"p{i:02d}", 1000 + i * 10, t0 + timedelta(hours=i), country="URY" if i % 2 else "ARG")
+
+    def tearDown(self):
+        rank_index._index = self.previous
+        scores_repo.ranking_pages.clear()
+        self.db.close()
+
+    def page(self, country=None, limit=10):
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        engine = self.db.get_bind()
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            body, _ = scores_repo.get_ranking_page(self.db, "career", country, limit, 0, None, lambda rows: repr(rows).encode())
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        return body, len(statements)
+
+    def play(self, username, score, country="URY"):
+        user = self.db.query(models.User).filter_by(username=username).one_or_none()
+        if user is None:
+            user = models.User(username=username, email=f"{username}@example.com", country=country)
+            self.db.add(user)
+            self.db.commit()
+        scores_repo.save_score(self.db, score, user, "career", country)
+
+    def test_write_below_window_keeps_page(self):
+        bumps = scores_repo.ranking_pages.bumps
+        body, queries = self.page()
+        self.assertEqual(queries, 1)
+        self.assertEqual(self.page(), (body, 0))
+
+        self.play("low", 5)
+        self.play("p00", 900)  # peor que su récord: sólo cambia last_score
+        self.assertEqual(self.page(), (body, 0))
+        self.assertEqual(scores_repo.ranking_pages.bumps, bumps)
+
+    def test_write_into_window_bumps_scope(self):
+        top, _ = self.page()
+        country_top, _ = self.page("ARG")
+        self.play("p01", 5000, "URY")
+
+        body, queries = self.page()
+        self.assertEqual(queries, 1)
+        self.assertNotEqual(body, top)
+        self.assertIn(b"'p01'", body)
+        # ARG no se toca: p01 es de URY
+        self.assertEqual(self.page("ARG"), (country_top, 0))
+
+    def test_country_change_bumps_old_country(self):
+        # El país anterior sale del índice en memoria
+        rank_index.rebuild(sessionmaker(bind=self.db.get_bind()))
+        self.page("ARG")
+        self.play("p28", 1280, "URY")  # mismo récord, pasa de ARG a URY
+        body, queries = self.page("ARG")
+        self.assertEqual(queries, 1)
+        self.assertNotIn(b"'p28'", body)
+
+    def test_short_page_is_open_window(self):
+        self.page(limit=50)
+        self.play("low", 5)
+        body, queries = self.page(limit=50)
+        self.assertEqual(queries, 1)
+        self.assertIn(b"'low'", body)
+
+    def test_hit_rate_metrics(self):
+        before = scores_repo.ranking_pages.stats()
+        self.page()
+        self.page()
+        self.page()
+        stats = scores_repo.ranking_pages.stats()
+        self.assertEqual((stats["hits"] - before["hits"], stats["misses"] - before["misses"]), (2, 1))
+        self.assertEqual(stats["scopes"], 1)
+
+
+class TestSaveScoreUpsert(unittest.TestCase):
+    def setUp(self):
+        self.db = make_session()
+        self.previous = rank_index._index
+        rank_index._index = RankIndex()
+        self.user = models.User(username="ana", email="ana@example.com", country="URY")
+        self.db.add(self.user)
+        self.db.commit()
+        self.db.refresh(self.user)
+
+    def tearDown(self):
+        rank_index._index = self.previous
+        self.db.close()
+
+    @staticmethod
+    def target(sql):
+        verb, rest = sql.split(None, 1)
+        if verb == "SELECT":
+            rest = rest.split("FROM", 1)[1]
+        elif verb == "INSERT":
+            rest = rest.split(None, 1)[1]
+        return verb, rest.split()[0]
+
+    def test_max_only_goes_up(self):
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(self.db.get_bind(), "before_cursor_execute", listener)
+        first = scores_repo.save_score(self.db, 300, self.user, "career", "URY")
+        event.remove(self.db.get_bind(), "before_cursor_execute", listener)
+        # Primer puntaje: paga todo. En SQLite los valores previos se leen aparte y score_events
+        # va en su propio INSERT (en Postgres ambos viajan con el upsert y el de window bests)
+        self.assertEqual([self.target(sql) for sql in statements], [
+            ("SELECT", "overall_score_table"),
+            ("INSERT", "overall_score_table"),
+            ("INSERT", "score_events"),
+            ("INSERT", "score_window_bests"),
+            ("INSERT", "country_score_aggregates"),  # delta
+            ("INSERT", "country_score_aggregates"),  # lock del shard 0: el top no está lleno
+            ("UPDATE", "country_score_aggregates"),  # relectura del top
+            ("INSERT", "region_player_counts"),
+        ])
+        self.assertEqual((first.max_score, first.last_score, first.country_code), (300, 300, "URY"))
+
+        statements.clear()
+        self.db.refresh(self.user)  # el commit anterior lo expiró
+        event.listen(self.db.get_bind(), "before_cursor_execute", listener)
+        lower = scores_repo.save_score(self.db, 100, self.user, "career", None)
+        event.remove(self.db.get_bind(), "before_cursor_execute", listener)
+        # Sin récord nuevo ni cambio de país no se toca ningún agregado
+        self.assertEqual([self.target(sql) for sql in statements], [
+            ("SELECT", "overall_score_table"),
+            ("INSERT", "overall_score_table"),
+            ("INSERT", "score_events"),
+            ("INSERT", "score_window_bests"),
+        ])
+        self.assertEqual((lower.max_score, lower.last_score), (300, 100))
+        self.assertEqual(lower.date_max_score, first.date_max_score)
+        self.assertEqual(lower.country_code, "URY")
+
+        higher = scores_repo.save_score(self.db, 500, self.user, "career", "ARG")
+        self.assertEqual((higher.max_score, higher.last_score, higher.country_code), (500, 500, "ARG"))
+        self.assertGreater(higher.date_max_score, first.date_max_score)
+        self.assertEqual(self.db.query(models.OverallScoreTable).count(), 1)
+
+
+class TestSaveScoreConcurrency(unittest.TestCase):
+    """
+    Concurrent submits for the same players must leave max_score = max of everything sent.
+    Uses a temporary SQLite file; set STRESS_DATABASE_URL to run it against a throwaway Postgres.
+    """
+    THREADS = 8
+    SUBMITS = 40
+    PLAYERS = 3
+
+    def setUp(self):
+        self.previous = rank_index._index
+        rank_index._index = RankIndex()
+        url = os.getenv("STRESS_DATABASE_URL")
+        if url:
+            self.engine = create_engine(url, pool_size=self.THREADS)
+        else:
+            self.tmp = tempfile.TemporaryDirectory()
+            self.engine = create_engine(f"sqlite:///{self.tmp.name}/stress.db", connect_args={"timeout": 30})
+        database.Base.metadata.drop_all(bind=self.engine)
+        database.Base.metadata.create_all(bind=self.engine)
+        self.Session = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+
+    def tearDown(self):
+        rank_index._index = self.previous
+        database.Base.metadata.drop_all(bind=self.engine)
+        self.engine.dispose()
+        if not os.getenv("STRESS_DATABASE_URL"):
+            self.tmp.cleanup()
+
+    def test_concurrent_submits_keep_max(self):
+        with self.Session() as db:
+            users = [models.User(username=f"u{i}", email=f"u{i}@example.com", country="URY") for i in range(self.PLAYERS)]
+            db.add_all(users)
+            db.commit()
+            players = [(u.id, u.username) for u in users]
+
+        sent = {user_id: [] for user_id, _ in players}
+        errors = []
+        start = threading.Barrier(self.THREADS)
+
+        def worker(seed):
+            rng = random.Random(seed)
+            db = self.Session()
+            try:
+                start.wait()
+                for _ in range(self.SUBMITS):
+                    user_id, username = rng.choice(players)
+                    score = rng.randint(0, 10000)
+                    sent[user_id].append(score)
+                    scores_repo.save_score(db, score, models.User(id=user_id, username=username), "career", "URY")
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                db.close()
+
+        threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(self.THREADS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+
+        with self.Session() as db:
+            rows = {r.user_id: r for r in db.query(models.OverallScoreTable)}
+        self.assertEqual(len(rows), self.PLAYERS)
+        for user_id, scores in sent.items():
+            self.assertEqual(rows[user_id].max_score, max(scores))
+            self.assertIn(rows[user_id].last_score, scores)
+            self.assertIsNotNone(rows[user_id].date_max_score)
+
+
+@unittest.skipUnless(os.getenv("STRESS_DATABASE_URL"), "STRESS_DATABASE_URL not set")
+class TestUpsertPostgres(unittest.TestCase):
+    """
+    The Postgres branch of the score upsert: previous rows read FOR UPDATE in a CTE, inserts
+    told apart by xmax = 0, and the savepoint retry when a first insert races it.
+    Runs only against the throwaway Postgres in STRESS_DATABASE_URL (tables are created and dropped).
+    """
+
+    def setUp(self):
+        self.previous = rank_index._index
+        rank_index._index = RankIndex()
+        self.engine = create_engine(os.getenv("STRESS_DATABASE_URL"))
+        database.Base.metadata.drop_all(bind=self.engine)
+        database.Base.metadata.create_all(bind=self.engine)
+        self.Session = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        with self.Session() as db:
+            user = models.User(username="ana", email="ana@example.com", country="URY")
+            db.add(user)
+            db.commit()
+            self.user = (user.id, user.username)
+
+    def tearDown(self):
+        rank_index._index = self.previous
+        database.Base.metadata.drop_all(bind=self.engine)
+        self.engine.dispose()
+
+    def test_previous_values_drive_the_counters(self):
+        with self.Session() as db:
+            scores_repo.save_score(db, 300, models.User(id=self.user[0], username=self.user[1]), "career", "URY")
+            self.assertEqual(scores_repo.get_player_count(db, "career", "URY"), 1)
+            row = scores_repo.save_score(db, 500, models.User(id=self.user[0], username=self.user[1]), "career", "ARG")
+            self.assertEqual((row.max_score, row.country_code), (500, "ARG"))
+            self.assertEqual(scores_repo.get_player_count(db, "career", "URY"), 0)
+            self.assertEqual(scores_repo.get_player_count(db, "career", "ARG"), 1)
+            self.assertEqual(scores_repo.get_player_count(db, "career"), 1)
+
+    def test_racing_first_insert_retries_only_the_savepoint(self):
+        user_id, username = self.user
+        statements, errors = [], []
+        worker = None
+
+        def listener(conn, cursor, statement, *args):
+            if threading.current_thread() is worker and "overall_score_table" in statement:
+                statements.append(statement)
+
+        def submit():
+            with self.Session() as db:
+                try:
+                    # Trabajo previo del caller en la misma transacción: tiene que sobrevivir al reintento
+                    db.add(models.User(username="beto", email="beto@example.com"))
+                    db.flush()
+                    scores_repo.save_score(db, 500, models.User(id=user_id, username=username), "career", "URY")
+                except Exception as exc:
+                    errors.append(exc)
+
+        event.listen(self.engine, "before_cursor_execute", listener)
+        self.addCleanup(event.remove, self.engine, "before_cursor_execute", listener)
+        with self.engine.connect() as blocker:
+            # Primer insert concurrente sin commit: el upsert no lo ve en `old` y espera por la clave
+            blocker.execute(models.OverallScoreTable.__table__.insert().values(
+                user_id=user_id, region_key="career", max_score=800, last_score=800, country_code="ARG",
+            ))
+            worker = threading.Thread(target=submit)
+            worker.start()
+            worker.join(timeout=1)
+            self.assertTrue(worker.is_alive())
+            blocker.commit()
+        worker.join(timeout=10)
+
+        self.assertEqual(errors, [])
+        upserts = [sql for sql in statements if sql.lstrip().startswith("WITH")]
+        self.assertEqual(len(upserts), 2)
+        with self.Session() as db:
+            row = db.query(models.OverallScoreTable).one()
+            self.assertEqual((row.max_score, row.last_score, row.country_code), (800, 500, "URY"))
+            self.assertEqual(db.query(models.User).filter_by(username="beto").count(), 1)
+
+
+class TestWindowLeaderboards(unittest.TestCase):
+    def setUp(self):
+        self.db = make_session()
+        self.previous = rank_index._index
+        rank_index._index = RankIndex()
+        self.users = {}
+        for name, country in (("ana", "URY"), ("beto", "ARG"), ("caro", "URY")):
+            user = models.User(username=name, email=f"{name}@example.com", country=country)
+            self.db.add(user)
+            self.db.commit()
+            self.db.refresh(user)
+            self.users[name] = user
+
+    def tearDown(self):
+        rank_index._index = self.previous
+        self.db.close()
+
+    def play(self, name, score, when):
+        user = self.users[name]
+        scores_repo._record_events(self.db, [{
+            "user_id": user.id, "region_key": "career", "country_code": user.country,
+            "score": score, "created_at": when,
+        }])
+        self.db.commit()
+
+    def ranking(self, period, today, country=None):
+        rows = scores_repo.get_window_scores(self.db, period, "career", country, today=today)
+        return [(r["username"], r["max_score"]) for r in rows]
+
+    def test_periods(self):
+        monday = datetime(2026, 3, 2, 10)
+        self.play("ana", 900, monday - timedelta(days=3))  # semana y mes anteriores (27 de febrero)
+        self.play("ana", 300, monday)
+        self.play("beto", 500, monday + timedelta(days=2))
+        self.play("caro", 700, monday + timedelta(days=2, hours=1))
+        self.play("caro", 200, monday + timedelta(days=2, hours=2))
+
+        wednesday = (monday + timedelta(days=2)).date()
+        self.assertEqual(self.ranking(ScoreWindow.day, wednesday), [("caro", 700), ("beto", 500)])
+        self.assertEqual(self.ranking(ScoreWindow.week, wednesday), [("caro", 700), ("beto", 500), ("ana", 300)])
+        self.assertEqual(self.ranking(ScoreWindow.month, wednesday, "URY"), [("caro", 700), ("ana", 300)])
+        self.assertEqual(self.ranking(ScoreWindow.month, date(2026, 2, 27)), [("ana", 900)])
+
+    def test_save_score_appends_events(self):
+        scores_repo.save_score(self.db, 100, self.users["ana"], "career", "URY")
+        scores_repo.save_score(self.db, 50, self.users["ana"], "career", "URY")
+        events = self.db.query(models.ScoreEvent).order_by(models.ScoreEvent.id).all()
+        self.assertEqual([e.score for e in events], [100, 50])
+
+        best = self.db.query(models.ScoreWindowBest).filter_by(period="day").one()
+        self.assertEqual((best.best_score, best.date_best), (100, events[0].created_at))
+
+    def test_window_cursor(self):
+        now = datetime.utcnow()
+        for name, score in (("ana", 10), ("beto", 30), ("caro", 20)):
+            self.play(name, score, now)
+        first = scores_repo.get_window_scores(self.db, ScoreWindow.week, "career", limit=2)
+        rest = scores_repo.get_window_scores(
+            self.db, ScoreWindow.week, "career", limit=2, cursor=scores_repo.next_cursor(first, 2)
+        )
+        self.assertEqual([r["username"] for r in first + rest], ["beto", "caro", "ana"])
+
+
+class TestCountryAggregates(unittest.TestCase):
+    def setUp(self):
+        self.db = make_session()
+        self.previous = rank_index._index
+        rank_index._index = RankIndex()
+        scores_repo.country_leaderboard.clear()
+
+    def tearDown(self):
+        rank_index._index = self.previous
+        scores_repo.country_leaderboard.clear()
+        self.db.close()
+
+    def aggregates(self):
+        totals = {}
+        for a in self.db.query(models.CountryScoreAggregate):
+            players, score_sum, top_sum, top_count, top_min = totals.get(a.country_code, (0, 0, 0, 0, None))
+            totals[a.country_code] = (
+                players + a.player_count, score_sum + a.score_sum, top_sum + a.top_k_sum, top_count + a.top_k_count,
+                a.top_k_min if a.shard == 0 else top_min,
+            )
+        return {country: total for country, total in totals.items() if total[0] > 0}
+
+    def test_deltas_match_rebuild(self):
+        # Top chico para que muchas escrituras no lleguen al top y se salteen el refresh
+        previous_k = settings.COUNTRY_TOP_K
+        settings.COUNTRY_TOP_K = 3
+        self.addCleanup(setattr, settings, "COUNTRY_TOP_K", previous_k)
+        rnd = random.Random(7)
+        users = []
+        for i in range(30):
+            user = models.User(username=f"p{i}", email=f"p{i}@example.com")
+            self.db.add(user)
+            users.append(user)
+        self.db.commit()
+        user_ids = {user.username: user.id for user in users}
+
+        for _ in range(300):
+            user = rnd.choice(users)
+            # A veces sin país (conserva el suyo) o mudándose de país
+            country = rnd.choice(["URY", "ARG", "BRA", None])
+            region = rnd.choice(["career", "career", "europe"])
+            if rnd.random() < 0.3:
+                entries = [
+                    PendingScore(user_ids[u.username], u.username, region, country, s, datetime.utcnow(), s, date.today())
+                    for u, s in {u.username: (u, rnd.randint(0, 400)) for u in rnd.sample(users, 4)}.values()
+                ]
+                scores_repo.save_scores_batch(self.db, entries)
+            else:
+                scores_repo.save_score(self.db, rnd.randint(0, 400), user, region, country)
+
+        incremental = self.aggregates()
+        self.assertTrue(incremental)
+        scores_repo.rebuild_country_aggregates(self.db)
+        self.assertEqual(incremental, self.aggregates())
+
+        counts = lambda: {(c.region_key, c.country_code): c.player_count for c in self.db.query(models.RegionPlayerCount) if c.player_count}
+        incremental = counts()
+        scores_repo.rebuild_player_counts(self.db)
+        self.assertEqual(incremental, counts())
+        self.assertEqual(scores_repo.get_player_count(self.db, "career"), self.db.query(models.OverallScoreTable).filter_by(region_key="career").count())
+
+    def test_leaderboard_orders_and_caches(self):
+        for name, score, country in (("ana", 900, "URY"), ("beto", 500, "ARG"), ("caro", 100, "URY"), ("dani", 450, "ARG")):
+            user = models.User(username=name, email=f"{name}@example.com")
+            self.db.add(user)
+            self.db.commit()
+            scores_repo.save_score(self.db, score, user, "career", country)
+
+        board = scores_repo.get_country_leaderboard(self.db, CountryOrder.top)
+        self.assertEqual([(r["country_code"], r["top_k_sum"], r["players"]) for r in board], [("URY", 1000, 2), ("ARG", 950, 2)])
+        by_average = scores_repo.get_country_leaderboard(self.db, CountryOrder.average)
+        self.assertEqual([(r["country_code"], r["average_score"]) for r in by_average], [("URY", 500.0), ("ARG", 475.0)])
+
+        # Servido del cache hasta que vence el TTL
+        user = models.User(username="eva", email="eva@example.com")
+        self.db.add(user)
+        self.db.commit()
+        scores_repo.save_score(self.db, 2000, user, "career", "ARG")
+        self.assertEqual(scores_repo.get_country_leaderboard(self.db, CountryOrder.top), board)
+        scores_repo.country_leaderboard.clear()
+        self.assertEqual(scores_repo.get_country_leaderboard(self.db, CountryOrder.top)[0]["country_code"], "ARG")
+
+    def test_top_refresh_only_when_best_can_enter(self):
+        previous_k = settings.COUNTRY_TOP_K
+        settings.COUNTRY_TOP_K = 2
+        self.addCleanup(setattr, settings, "COUNTRY_TOP_K", previous_k)
+        users = []
+        for name in ("ana", "beto", "caro"):
+            user = models.User(username=name, email=f"{name}@example.com")
+            self.db.add(user)
+            self.db.commit()
+            users.append(user)
+        scores_repo.save_score(self.db, 900, users[0], "career", "URY")
+        scores_repo.save_score(self.db, 500, users[1], "career", "URY")
+
+        def country_statements(score, user):
+            statements = []
+            listener = lambda *args: statements.append(args[2])
+            event.listen(self.db.get_bind(), "before_cursor_execute", listener)
+            scores_repo.save_score(self.db, score, user, "career", "URY")
+            event.remove(self.db.get_bind(), "before_cursor_execute", listener)
+            return [sql for sql in statements if "country_score_aggregates" in sql]
+
+        # Top lleno (900, 500): 100 no entra, sólo el delta
+        self.assertEqual(len(country_statements(100, users[2])), 1)
+        # 600 desplaza a 500: delta, lock del shard 0 y relectura del top
+        self.assertEqual(len(country_statements(600, users[2])), 3)
+        self.assertEqual(self.aggregates()["URY"], (3, 2000, 1500, 2, 600))
+
+
+class TestRankingExport(unittest.TestCase):
+    def setUp(self):
+        self.db = make_session()
+        t0 = datetime(2026, 1, 1)
+        for name, score, when, country in (
+            ("ana", 500, t0, "URY"), ("beto", 700, t0, "ARG"), ("caro", 500, t0, "URY"),
+            ("dani", 500, t0 + timedelta(days=1), "ARG"), ("eva", 100, t0, "URY"),
+        ):
+            add_player(self.db, name, score, when, country=country)
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_ndjson_in_batches(self):
+        chunks = list(scores_repo.export_ranking(self.db, "career", batch_size=2))
+        self.assertEqual(len(chunks), 3)
+        rows = [json.loads(line) for chunk in chunks for line in chunk.splitlines()]
+        # Empate de puntaje y fecha: misma posición, como get_user_rank
+        self.assertEqual(
+            [(r["rank"], r["username"]) for r in rows],
+            [(1, "beto"), (2, "ana"), (2, "caro"), (4, "dani"), (5, "eva")],
+        )
+        self.assertEqual(rows[0]["date_max_score"], "2026-01-01T00:00:00")
+
+    def test_csv_country(self):
+        text = "".join(scores_repo.export_ranking(self.db, "career", "URY", ExportFormat.csv, batch_size=2))
+        rows = list(csv.DictReader(io.StringIO(text)))
+        self.assertEqual([(r["rank"], r["username"], r["max_score"]) for r in rows], [("1", "ana", "500"), ("1", "caro", "500"), ("3", "eva", "100")])
+
+    def test_admin_key(self):
+        from dependencies import require_admin
+
+        previous = settings.ADMIN_API_KEY
+        try:
+            settings.ADMIN_API_KEY = None
+            with self.assertRaises(HTTPException):
+                require_admin("anything")
+            settings.ADMIN_API_KEY = SecretStr("s3cret")
+            with self.assertRaises(HTTPException):
+                require_admin("wrong")
+            require_admin("s3cret")
+        finally:
+            settings.ADMIN_API_KEY = previous
+
+
+if __name__ == "__main__":
+    unittest.main()
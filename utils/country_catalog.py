@@ -0,0 +1,209 @@
+import bisect
+import logging
+import threading
+import unicodedata
+from dataclasses import dataclass, field
+
+import requests
+
+from utils.geo import DistanceMatrix
+
+logger = logging.getLogger(__name__)
+
+REST_COUNTRIES_URL = "https://restcountries.com/v3.1/all?fields=name,flags,cca2,cca3,region,subregion,capital,latlng,population,languages"
+# REST Countries limita /all a 10 campos por request, los nombres traducidos van aparte.
+REST_COUNTRIES_NAMES_URL = "https://restcountries.com/v3.1/all?fields=cca3,translations,altSpellings"
+
+REQUEST_TIMEOUT_SECONDS = 10
+
+# Tiers used to rank suggestions: full label match first, then any full name, then word starts.
+TIER_LABEL = 0
+TIER_NAME = 1
+TIER_WORD = 2
+
+
+def fold(text: str) -> str:
+    """Lowercases and strips accents so "Perú", "PERU" and "peru" share a key."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(stripped.casefold().split())
+
+
+def _country_names(country: dict) -> set[str]:
+    """All the names a player could type for a country (common, official, native, translations)."""
+    names = set()
+    name = country.get("name", {})
+    for key in ("common", "official"):
+        if name.get(key):
+            names.add(name[key])
+    for native in (name.get("nativeName") or {}).values():
+        for key in ("common", "official"):
+            if native.get(key):
+                names.add(native[key])
+    for translation in (country.get("translations") or {}).values():
+        for key in ("common", "official"):
+            if translation.get(key):
+                names.add(translation[key])
+    for alt in country.get("altSpellings") or []:
+        # altSpellings mezcla códigos ("UY") con nombres; los códigos cortos no aportan al typeahead
+        if len(alt) > 3:
+            names.add(alt)
+    return names
+
+
+@dataclass
+class CountryCatalog:
+    """
+    In-memory copy of the REST Countries dataset, sorted by cca3.
+    Holds a sorted array of (folded_name, tier, position) used for prefix lookups with bisect,
+    and the distance/bearing matrix between countries, indexed by position.
+    """
+    countries: list[dict]
+    distances: DistanceMatrix | None = field(default=None, repr=False)
+    _keys: list[str] = field(default_factory=list, repr=False)
+    _entries: list[tuple[int, str]] = field(default_factory=list, repr=False)
+    _by_code: dict[str, int] = field(default_factory=dict, repr=False)
+    _by_name: dict[str, int] = field(default_factory=dict, repr=False)
+
+    def __post_init__(self):
+        self._by_code = {c["cca3"]: pos for pos, c in enumerate(self.countries)}
+        self.distances = DistanceMatrix.from_latlng([c.get("latlng") for c in self.countries])
+        rows = set()
+        for pos, country in enumerate(self.countries):
+            for name in _country_names(country):
+                folded = fold(name)
+                if not folded:
+                    continue
+                self._by_name.setdefault(folded, pos)
+                rows.add((folded, TIER_NAME, pos, name))
+                words = folded.split(" ")
+                for i in range(1, len(words)):
+                    rows.add((" ".join(words[i:]), TIER_WORD, pos, name))
+        ordered = sorted(rows)
+        self._keys = [r[0] for r in ordered]
+        self._entries = [(r[2], r[1]) for r in ordered]
+
+    def __len__(self):
+        return len(self.countries)
+
+    def position(self, cca3: str) -> int | None:
+        return self._by_code.get(cca3)
+
+    def resolve(self, text: str) -> int | None:
+        """Position of the country whose name (any language) matches `text` exactly, ignoring accents/case."""
+        return self._by_name.get(fold(text))
+
+    def feedback(self, guess_text: str, answer_cca3: str) -> dict | None:
+        """
+        Distance and bearing from the guessed country to the answer, read from the precomputed matrix.
+        None when the guess is not a known country or coordinates are missing.
+        """
+        guess_pos = self.resolve(guess_text)
+        answer_pos = self.position(answer_cca3)
+        if guess_pos is None or answer_pos is None:
+            return None
+        result = self.distances.feedback(guess_pos, answer_pos)
+        if result is None:
+            return None
+        return {"code": self.countries[guess_pos]["cca3"], **result}
+
+    def label(self, country: dict, lang: str) -> str:
+        translation = (country.get("translations") or {}).get(lang) or {}
+        return translation.get("common") or country["name"]["common"]
+
+    def suggest(self, query: str, limit: int = 8, lang: str = "spa") -> list[dict]:
+        """
+        Returns up to `limit` countries whose names start with `query` (accent/case insensitive).
+        Runs a bisect over the precomputed keys, so cost depends on the matches, not the dataset.
+        """
+        prefix = fold(query)
+        if not prefix:
+            return []
+
+        best: dict[int, int] = {}
+        start = bisect.bisect_left(self._keys, prefix)
+        for i in range(start, len(self._keys)):
+            if not self._keys[i].startswith(prefix):
+                break
+            pos, tier = self._entries[i]
+            if tier < best.get(pos, TIER_WORD + 1):
+                best[pos] = tier
+
+        results = []
+        for pos, tier in best.items():
+            country = self.countries[pos]
+            label = self.label(country, lang)
+            if tier == TIER_NAME and fold(label).startswith(prefix):
+                tier = TIER_LABEL
+            results.append((tier, fold(label), pos, label))
+        results.sort()
+
+        return [
+            {
+                "code": self.countries[pos]["cca3"],
+                "name": self.countries[pos]["name"]["common"],
+                "label": label,
+            }
+            for _, _, pos, label in results[:limit]
+        ]
+
+
+def fetch_countries() -> list[dict]:
+    """
+    Fetches REST Countries and returns the valid ones sorted stably by cca3.
+    Translations are merged in when available; the catalog still works without them.
+    """
+    try:
+        response = requests.get(REST_COUNTRIES_URL, timeout=REQUEST_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        data = response.json()
+    except requests.RequestException as e:
+        logger.error(f"Error fetching countries: {e}")
+        raise ValueError("Could not fetch countries")
+
+    valid_countries = [
+        c for c in data
+        if c.get("flags", {}).get("png") and c.get("cca3") and c.get("name", {}).get("common")
+    ]
+    if not valid_countries:
+        raise ValueError("No valid countries found")
+
+    try:
+        response = requests.get(REST_COUNTRIES_NAMES_URL, timeout=REQUEST_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        names_by_code = {c["cca3"]: c for c in response.json() if c.get("cca3")}
+    except requests.RequestException as e:
+        logger.warning(f"Could not fetch country translations, indexing base names only: {e}")
+        names_by_code = {}
+
+    for country in valid_countries:
+        extra = names_by_code.get(country["cca3"], {})
+        country["translations"] = extra.get("translations", {})
+        country["altSpellings"] = extra.get("altSpellings", [])
+
+    valid_countries.sort(key=lambda x: x["cca3"])
+    return valid_countries
+
+
+_catalog: CountryCatalog | None = None
+_catalog_lock = threading.Lock()
+
+
+def peek_catalog() -> CountryCatalog | None:
+    """The catalog if it's already loaded; never hits the network (for best-effort callers)."""
+    return _catalog
+
+
+def get_catalog() -> CountryCatalog:
+    """
+    Returns the process-wide catalog, loading it on first use.
+    A failed load is not cached, so the next call retries.
+    """
+    global _catalog
+    if _catalog is not None:
+        return _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = CountryCatalog(fetch_countries())
+            logger.info(f"Country catalog loaded: {len(_catalog)} countries")
+    return _catalog
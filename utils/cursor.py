@@ -0,0 +1,23 @@
+import base64
+import json
+from datetime import datetime
+
+
+def encode_cursor(max_score: int, date_max_score: datetime | None, username: str) -> str:
+    """Opaque keyset cursor pointing at the last row of a ranking page."""
+    payload = {"s": max_score, "d": date_max_score.isoformat() if date_max_score else None, "u": username}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[int, datetime | None, str]:
+    """Inverse of encode_cursor. Raises ValueError on anything malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        max_score = int(payload["s"])
+        date_max_score = datetime.fromisoformat(payload["d"]) if payload["d"] else None
+        username = str(payload["u"])
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError("Invalid cursor") from e
+    return max_score, date_max_score, username
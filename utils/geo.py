@@ -0,0 +1,59 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+COMPASS_POINTS = ("N", "NE", "E", "SE", "S", "SW", "W", "NW")
+
+
+def haversine_matrix(lat: np.ndarray, lng: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Pairwise great-circle distance (km) and initial bearing (degrees, 0 = north)
+    from point i (row) to point j (column), computed in one vectorized pass.
+    Missing coordinates (NaN) propagate as NaN.
+    """
+    phi1 = np.radians(lat)[:, None]
+    phi2 = np.radians(lat)[None, :]
+    dlambda = np.radians(lng)[None, :] - np.radians(lng)[:, None]
+
+    a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+    y = np.sin(dlambda) * np.cos(phi2)
+    x = np.cos(phi1) * np.sin(phi2) - np.sin(phi1) * np.cos(phi2) * np.cos(dlambda)
+    bearings = np.mod(np.degrees(np.arctan2(y, x)), 360.0)
+
+    return distances.astype(np.float32), bearings.astype(np.float32)
+
+
+def compass_point(bearing: float) -> str:
+    return COMPASS_POINTS[int((bearing + 22.5) // 45) % len(COMPASS_POINTS)]
+
+
+@dataclass
+class DistanceMatrix:
+    """Distances and bearings between every pair of catalog positions."""
+    distances_km: np.ndarray
+    bearings: np.ndarray
+
+    @classmethod
+    def from_latlng(cls, latlng: list) -> "DistanceMatrix":
+        coords = np.array(
+            [(p[0], p[1]) if p and len(p) >= 2 else (np.nan, np.nan) for p in latlng],
+            dtype=np.float64,
+        ).reshape(-1, 2)
+        return cls(*haversine_matrix(coords[:, 0], coords[:, 1]))
+
+    def feedback(self, from_pos: int, to_pos: int) -> dict | None:
+        """Distance/bearing from one country to another, or None if either has no coordinates."""
+        distance = self.distances_km[from_pos, to_pos]
+        if np.isnan(distance):
+            return None
+        if from_pos == to_pos:
+            return {"distance_km": 0, "bearing": None, "direction": None}
+        bearing = float(self.bearings[from_pos, to_pos])
+        return {
+            "distance_km": int(round(float(distance))),
+            "bearing": int(round(bearing)) % 360,
+            "direction": compass_point(bearing),
+        }
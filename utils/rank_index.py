@@ -0,0 +1,257 @@
+import bisect
+import logging
+import threading
+import time
+from datetime import datetime
+
+from utils.score_histogram import ScoreHistogram
+
+logger = logging.getLogger(__name__)
+
+# Sin fecha de récord se ordena al final de su puntaje (en SQL esas filas nunca son "mejores")
+_NO_DATE = datetime.max
+
+
+def rank_key(max_score: int, date_max_score: datetime | None, username: str) -> tuple:
+    """Leaderboard order: higher score first, then earliest best score, then username."""
+    return (-max_score, date_max_score or _NO_DATE, username)
+
+
+def _better(keys: list[tuple], key: tuple) -> int:
+    """Entries strictly better than `key`, as SQL counts them: without a date of its own
+    only higher scores count (`date < NULL` is never true)."""
+    return bisect.bisect_left(keys, key[:1] if key[1] == _NO_DATE else key[:2])
+
+
+class RankIndex:
+    """
+    In-memory order statistics over overall_score_table, one sorted key list per scope:
+    (region_key, None) for the region ranking and (region_key, country_code) for countries.
+    rank = 1 + bisect_left on (-score, date), i.e. the number of strictly better entries,
+    the same definition as the SQL fallback.
+
+    Each scope also keeps a ScoreHistogram of best scores (0..histogram_max) for the
+    distribution and percentile queries.
+
+    The index is per process. `save_score` keeps it current for its own writes and a
+    periodic rebuild (see `start_refresher`) picks up everyone else's; past
+    `max_age` seconds without a rebuild it reports itself cold and callers use SQL.
+    """
+
+    def __init__(self, max_age: float | None = None, histogram_max: int = 2000):
+        self.max_age = max_age
+        self.histogram_max = histogram_max
+        self.loaded_at: float | None = None
+        self._scopes: dict[tuple, list[tuple]] = {}
+        self._histograms: dict[tuple, ScoreHistogram] = {}
+        self._entries: dict[tuple[int, str], tuple[tuple, str | None]] = {}
+        self._pending: list[tuple] | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        if self.loaded_at is None:
+            return False
+        return self.max_age is None or time.monotonic() - self.loaded_at <= self.max_age
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self, rows):
+        """
+        Rebuilds from (user_id, username, region_key, country_code, max_score, date_max_score) rows.
+        Updates that arrive while the rows are read are replayed on top of the new snapshot.
+        """
+        with self._lock:
+            self._pending = []
+
+        scopes: dict[tuple, list[tuple]] = {}
+        entries: dict[tuple[int, str], tuple[tuple, str | None]] = {}
+        for user_id, username, region_key, country_code, max_score, date_max_score in rows:
+            if max_score is None:
+                continue
+            key = rank_key(max_score, date_max_score, username)
+            entries[(user_id, region_key)] = (key, country_code)
+            scopes.setdefault((region_key, None), []).append(key)
+            if country_code:
+                scopes.setdefault((region_key, country_code), []).append(key)
+        histograms = {}
+        for scope, keys in scopes.items():
+            keys.sort()
+            histograms[scope] = ScoreHistogram.from_scores((-key[0] for key in keys), self.histogram_max)
+
+        with self._lock:
+            self._scopes, self._entries, self._histograms = scopes, entries, histograms
+            pending, self._pending = self._pending, None
+            for args in pending:
+                self._apply(*args)
+            self.loaded_at = time.monotonic()
+
+    def update(self, user_id: int, username: str, region_key: str, country_code: str | None,
+               max_score: int | None, date_max_score: datetime | None):
+        """Moves a player's entry after their row changed (new best score or new country)."""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((user_id, username, region_key, country_code, max_score, date_max_score))
+            self._apply(user_id, username, region_key, country_code, max_score, date_max_score)
+
+    def _apply(self, user_id, username, region_key, country_code, max_score, date_max_score):
+        old = self._entries.pop((user_id, region_key), None)
+        if old:
+            old_key, old_country = old
+            self._discard((region_key, None), old_key)
+            if old_country:
+                self._discard((region_key, old_country), old_key)
+        if max_score is None:
+            return
+
+        key = rank_key(max_score, date_max_score, username)
+        self._entries[(user_id, region_key)] = (key, country_code)
+        self._insert((region_key, None), key)
+        if country_code:
+            self._insert((region_key, country_code), key)
+
+    def _insert(self, scope: tuple, key: tuple):
+        bisect.insort(self._scopes.setdefault(scope, []), key)
+        if scope not in self._histograms:
+            self._histograms[scope] = ScoreHistogram(self.histogram_max)
+        self._histograms[scope].add(-key[0])
+
+    def _discard(self, scope: tuple, key: tuple):
+        keys = self._scopes.get(scope)
+        if not keys:
+            return
+        i = bisect.bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            del keys[i]
+            self._histograms[scope].add(-key[0], -1)
+
+    def rank(self, user_id: int, region_key: str, country_code: str | None = None) -> dict | None:
+        """
+        {"rank", "max_score", "total_players"} for the user in the scope, or None if they
+        have no score in that region (or it isn't filed under `country_code`, if given).
+        Call only when `ready`.
+        """
+        with self._lock:
+            entry = self._entries.get((user_id, region_key))
+            if entry is None or (country_code and entry[1] != country_code):
+                return None
+            key, _ = entry
+            keys = self._scopes.get((region_key, country_code), [])
+            return {"rank": _better(keys, key) + 1, "max_score": -key[0], "total_players": len(keys)}
+
+    def ranks(self, user_ids, region_key: str, country_code: str | None = None) -> dict[int, dict]:
+        """
+        rank() for many users under one lock: {user_id: {"username", "rank", "max_score",
+        "total_players"}} for those with a score in the scope (filed under `country_code`, if given).
+        """
+        with self._lock:
+            keys = self._scopes.get((region_key, country_code), [])
+            found = {}
+            for user_id in user_ids:
+                entry = self._entries.get((user_id, region_key))
+                if entry is None or (country_code and entry[1] != country_code):
+                    continue
+                key = entry[0]
+                found[user_id] = {
+                    "username": key[2],
+                    "rank": _better(keys, key) + 1,
+                    "max_score": -key[0],
+                    "total_players": len(keys),
+                }
+            return found
+
+    def percentile(self, user_id: int, region_key: str, country_code: str | None = None) -> dict | None:
+        """
+        The user's standing from the scope's histogram, O(log S): `percentile` is the share of
+        players with a lower best score, `top_percent` the share at or above it (ties count
+        together, unlike `rank`). None if they have no score in that region (or it isn't
+        filed under `country_code`, if given).
+        """
+        with self._lock:
+            entry = self._entries.get((user_id, region_key))
+            if entry is None or (country_code and entry[1] != country_code):
+                return None
+            score = -entry[0][0]
+            hist = self._histograms.get((region_key, country_code))
+            if hist is None or not hist.total:
+                return None
+            # Por encima del tope todos comparten el slot de overflow
+            below = hist.count_at_most(min(max(score, 0), hist.max_score + 1) - 1)
+            return {
+                "max_score": score,
+                "total_players": hist.total,
+                "percentile": round(100 * below / hist.total, 1),
+                "top_percent": round(100 * (hist.total - below) / hist.total, 1),
+            }
+
+    def distribution(self, region_key: str, country_code: str | None, bucket_width: int) -> dict:
+        with self._lock:
+            hist = self._histograms.get((region_key, country_code)) or ScoreHistogram(self.histogram_max)
+            return {"total_players": hist.total, "buckets": hist.buckets(bucket_width)}
+
+    def neighbours(self, user_id: int, region_key: str, country_code: str | None, k: int):
+        """
+        (position, above, below): the user's 1-based position in the scope's order and up to
+        k keys on each side, closest last/first. None if they have no score in that region
+        (or it isn't filed under `country_code`, if given).
+        """
+        with self._lock:
+            entry = self._entries.get((user_id, region_key))
+            if entry is None or (country_code and entry[1] != country_code):
+                return None
+            key, _ = entry
+            keys = self._scopes.get((region_key, country_code), [])
+            i = bisect.bisect_left(keys, key)
+            after = i + 1 if i < len(keys) and keys[i] == key else i
+            return i + 1, keys[max(0, i - k):i], keys[after:after + k]
+
+
+_index = RankIndex()
+
+
+def get_index() -> RankIndex:
+    return _index
+
+
+def rebuild(session_factory):
+    """Reloads the process-wide index from the database."""
+    from db.models import OverallScoreTable, User
+
+    db = session_factory()
+    try:
+        rows = (
+            db.query(
+                OverallScoreTable.user_id,
+                User.username,
+                OverallScoreTable.region_key,
+                OverallScoreTable.country_code,
+                OverallScoreTable.max_score,
+                OverallScoreTable.date_max_score,
+            )
+            .join(User, User.id == OverallScoreTable.user_id)
+            .yield_per(5000)
+        )
+        _index.load(rows)
+    finally:
+        db.close()
+    logger.info(f"Rank index loaded: {len(_index)} entries")
+
+
+def start_refresher(session_factory, interval_seconds: float, histogram_max: int | None = None) -> threading.Thread:
+    """Builds the index now and rebuilds it every `interval_seconds` in a daemon thread."""
+    _index.max_age = interval_seconds * 2
+    if histogram_max is not None:
+        _index.histogram_max = histogram_max
+
+    def run():
+        while True:
+            try:
+                rebuild(session_factory)
+            except Exception:
+                logger.exception("Rank index rebuild failed")
+            time.sleep(interval_seconds)
+
+    thread = threading.Thread(target=run, name="rank-index-refresher", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,68 @@
+import threading
+
+from utils.cache import LRUCache
+
+# Ventana abierta: hay una página cacheada que llega al final del ranking, cualquier alta entra
+_OPEN = (float("inf"),)
+
+
+class VersionedPageCache(LRUCache):
+    """
+    Ranking pages (already serialized) keyed by (scope, version, page), where scope is
+    (region_key, country_code). Each scope remembers the worst rank key among its cached
+    pages; a write only bumps the scope's version (orphaning its pages) when the player's
+    old or new key falls inside that window. Writes below every cached page cost nothing.
+    """
+
+    def __init__(self, name: str, maxsize: int = 256, ttl: float | None = None):
+        super().__init__(name, maxsize, ttl)
+        self.bumps = 0
+        self._versions: dict[tuple, int] = {}
+        self._floors: dict[tuple, tuple] = {}
+        self._scope_lock = threading.Lock()
+
+    def version(self, scope: tuple) -> int:
+        with self._scope_lock:
+            return self._versions.get(scope, 0)
+
+    def get_page(self, scope: tuple, page: tuple):
+        return self.get((scope, self.version(scope), page))
+
+    def set_page(self, scope: tuple, page: tuple, version: int, value, last_key: tuple | None):
+        """
+        Stores a page read under `version` (taken before the query, so a page built while a
+        bump happened lands under the old version and is never served).
+        `last_key` is the rank key of its last row, or None if the page reaches the end.
+        """
+        with self._scope_lock:
+            if self._versions.get(scope, 0) != version:
+                return
+            floor = self._floors.get(scope)
+            key = _OPEN if last_key is None else last_key
+            self._floors[scope] = key if floor is None else max(floor, key)
+        self.set((scope, version, page), value)
+
+    def touch(self, scope: tuple, *keys: tuple | None) -> bool:
+        """Bumps the scope if any of the given rank keys sorts within its cached window."""
+        with self._scope_lock:
+            floor = self._floors.get(scope)
+            if floor is None or not any(key is not None and key <= floor for key in keys):
+                return False
+            self._versions[scope] = self._versions.get(scope, 0) + 1
+            del self._floors[scope]
+            self.bumps += 1
+            return True
+
+    def clear(self):
+        with self._scope_lock:
+            for scope in self._floors:
+                self._versions[scope] = self._versions.get(scope, 0) + 1
+            self._floors.clear()
+        super().clear()
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        with self._scope_lock:
+            stats["scopes"] = len(self._floors)
+        stats["version_bumps"] = self.bumps
+        return stats
@@ -0,0 +1,58 @@
+class ScoreHistogram:
+    """
+    Player count per best score over the bounded domain 0..max_score, stored as a Fenwick
+    tree: add, prefix counts and range counts are O(log S). Scores above `max_score` share
+    one overflow slot, so counts are exact up to the cap and approximate beyond it.
+    """
+
+    def __init__(self, max_score: int):
+        self.max_score = max_score
+        self.total = 0
+        self._tree = [0] * (max_score + 3)  # 1-based, + slot de overflow
+
+    @classmethod
+    def from_scores(cls, scores, max_score: int) -> "ScoreHistogram":
+        """Builds the tree in O(n + S) instead of n inserts."""
+        hist = cls(max_score)
+        tree = hist._tree
+        for score in scores:
+            tree[hist._slot(score)] += 1
+            hist.total += 1
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        return hist
+
+    def _slot(self, score: int) -> int:
+        return min(max(score, 0), self.max_score + 1) + 1
+
+    def add(self, score: int, delta: int = 1):
+        self.total += delta
+        i = self._slot(score)
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def count_at_most(self, score: int) -> int:
+        """Players whose best is <= score."""
+        if score < 0:
+            return 0
+        i = self._slot(score)
+        count = 0
+        while i > 0:
+            count += self._tree[i]
+            i -= i & -i
+        return count
+
+    def count_above(self, score: int) -> int:
+        return self.total - self.count_at_most(score)
+
+    def buckets(self, width: int) -> list[dict]:
+        """Counts per [from, to] score range of `width` points, up to the cap (overflow in the last one)."""
+        result = []
+        for start in range(0, self.max_score + 1, width):
+            end = min(start + width - 1, self.max_score)
+            upper = self.total if end == self.max_score else self.count_at_most(end)
+            result.append({"from": start, "to": end, "count": upper - self.count_at_most(start - 1)})
+        return result
@@ -0,0 +1,219 @@
+import glob
+import json
+import logging
+import os
+import threading
+from dataclasses import asdict, dataclass, field, replace
+from datetime import date, datetime
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PendingScore:
+    """A player's not-yet-written results in one region, already merged."""
+    user_id: int
+    username: str
+    region_key: str
+    country_code: str | None
+    max_score: int
+    date_max_score: datetime
+    last_score: int
+    date_last_score: date
+    # Cada partida por separado (score, fecha) para score_events
+    events: list[tuple[int, datetime]] = field(default_factory=list)
+
+    @property
+    def key(self) -> tuple[int, str]:
+        return (self.user_id, self.region_key)
+
+    def merge(self, later: "PendingScore") -> "PendingScore":
+        """Same rules as the upsert: the max only moves on a strictly higher score, the rest is the latest."""
+        best = later if later.max_score > self.max_score else self
+        return replace(
+            later,
+            max_score=best.max_score,
+            date_max_score=best.date_max_score,
+            country_code=later.country_code or self.country_code,
+            events=self.events + later.events,
+        )
+
+    def to_json(self) -> str:
+        data = asdict(self)
+        data["date_max_score"] = self.date_max_score.isoformat()
+        data["date_last_score"] = self.date_last_score.isoformat()
+        data["events"] = [(score, created_at.isoformat()) for score, created_at in self.events]
+        return json.dumps(data)
+
+    @classmethod
+    def from_json(cls, line: str) -> "PendingScore":
+        data = json.loads(line)
+        data["date_max_score"] = datetime.fromisoformat(data["date_max_score"])
+        data["date_last_score"] = date.fromisoformat(data["date_last_score"])
+        data["events"] = [(score, datetime.fromisoformat(created_at)) for score, created_at in data.get("events", [])]
+        return cls(**data)
+
+
+class ScoreQueue:
+    """
+    Write-behind buffer for finished games. Submissions are merged per (user_id, region_key)
+    and handed to `flush` in batches, every `interval` seconds or as soon as `batch_size`
+    players are pending. A failed flush puts its entries back; on shutdown whatever
+    can't be written is appended to the JSONL spool at `spool_path`. Every worker shares
+    that path: on start a worker claims the spool by renaming it to `<spool_path>.<pid>`,
+    so only it replays those entries, and removes its copy once a flush has written them.
+    """
+
+    def __init__(self, flush, interval: float, batch_size: int, spool_path: str):
+        self.flush_fn = flush
+        self.interval = interval
+        self.batch_size = batch_size
+        self.spool_path = spool_path
+        self.submitted = 0
+        self.flushed = 0
+        self._pending: dict[tuple[int, str], PendingScore] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: threading.Thread | None = None
+        # Copias del spool tomadas por este proceso cuyas entradas todavía no llegaron a la base
+        self._claimed: list[str] = []
+
+    def __len__(self):
+        return len(self._pending)
+
+    def submit(self, entry: PendingScore) -> PendingScore:
+        """Queues a result and returns the player's merged pending entry."""
+        with self._lock:
+            current = self._pending.get(entry.key)
+            merged = current.merge(entry) if current else entry
+            self._pending[entry.key] = merged
+            self.submitted += 1
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wake.set()
+        return merged
+
+    def pending(self, user_id: int, region_key: str) -> PendingScore | None:
+        with self._lock:
+            return self._pending.get((user_id, region_key))
+
+    def _take(self) -> list[PendingScore]:
+        with self._lock:
+            entries, self._pending = list(self._pending.values()), {}
+        return entries
+
+    def _put_back(self, entries: list[PendingScore]):
+        # Lo que llegó mientras tanto es más nuevo
+        with self._lock:
+            for entry in entries:
+                newer = self._pending.get(entry.key)
+                self._pending[entry.key] = entry.merge(newer) if newer else entry
+
+    def flush(self) -> int:
+        """Writes everything pending, in chunks of `batch_size`. Returns the number of rows written."""
+        with self._flush_lock:
+            entries = self._take()
+            written = 0
+            try:
+                for i in range(0, len(entries), self.batch_size):
+                    chunk = entries[i:i + self.batch_size]
+                    self.flush_fn(chunk)
+                    written += len(chunk)
+            except Exception:
+                self._put_back(entries[written:])
+                raise
+            finally:
+                self.flushed += written
+            # Todo lo que estaba pendiente, incluido lo del spool, ya está escrito
+            self._release_claimed()
+            return written
+
+    def start(self) -> threading.Thread:
+        self.replay_spool()
+
+        def run():
+            while not self._stopping:
+                self._wake.wait(self.interval)
+                self._wake.clear()
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception("Score flush failed; entries kept for the next round")
+
+        self._stopping = False
+        self._thread = threading.Thread(target=run, name="score-flusher", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        """Stops the flusher and writes what's left; if the database is unreachable, spools it."""
+        self._stopping = True
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 5)
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Final score flush failed; spooling to disk")
+            self.spool(self._take())
+
+    def spool(self, entries: list[PendingScore]):
+        if not entries:
+            return
+        os.makedirs(os.path.dirname(self.spool_path) or ".", exist_ok=True)
+        # Siempre se agrega: otros workers pueden estar volcando al mismo archivo
+        with open(self.spool_path, "a", encoding="utf-8") as f:
+            f.write("".join(entry.to_json() + "\n" for entry in entries))
+            f.flush()
+            os.fsync(f.fileno())
+        # Lo reproducido que no llegó a escribirse ya va en `entries`
+        self._release_claimed()
+        logger.warning(f"Spooled {len(entries)} pending scores to {self.spool_path}")
+
+    def _release_claimed(self):
+        for path in self._claimed:
+            if os.path.exists(path):
+                os.remove(path)
+        self._claimed = []
+
+    def _orphaned_claims(self) -> list[str]:
+        """Copies claimed by workers that died before writing them."""
+        orphaned = []
+        for path in glob.glob(f"{glob.escape(self.spool_path)}.*"):
+            pid = path[len(self.spool_path) + 1:].split(".")[0]
+            if not pid.isdigit() or int(pid) == os.getpid():
+                continue
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                orphaned.append(path)
+            except PermissionError:
+                pass  # vivo, de otro usuario
+        return orphaned
+
+    def replay_spool(self) -> int:
+        """
+        Claims and queues the entries previous processes spooled. The rename is atomic, so
+        of several workers starting together only one gets each file; the claimed copy
+        stays until a flush has written it, so a crash before that doesn't lose them.
+        """
+        entries = []
+        for source in [self.spool_path] + self._orphaned_claims():
+            claimed = f"{self.spool_path}.{os.getpid()}.{len(self._claimed)}"
+            try:
+                os.replace(source, claimed)
+            except FileNotFoundError:
+                continue  # lo tomó otro worker
+            self._claimed.append(claimed)
+            with open(claimed, encoding="utf-8") as f:
+                entries += [PendingScore.from_json(line) for line in f if line.strip()]
+        for entry in entries:
+            self.submit(entry)
+        if entries:
+            logger.info(f"Replayed {len(entries)} spooled scores")
+        return len(entries)
+
+    def stats(self) -> dict:
+        return {"pending": len(self._pending), "submitted": self.submitted, "flushed": self.flushed}
@@ -0,0 +1,73 @@
+import re
+from datetime import date
+from io import BytesIO
+
+from PIL import Image, ImageDraw, ImageFont
+
+# Tamaño recomendado para Open Graph / Twitter cards
+CARD_SIZE = (1200, 630)
+BACKGROUND = (24, 32, 48)
+TEXT_COLOR = (240, 240, 240)
+MUTED_COLOR = (160, 170, 190)
+CELL_COLORS = {
+    "g": (76, 175, 80),   # 🟩 acierto
+    "r": (229, 57, 53),   # 🟥 fallo
+    "-": (60, 70, 90),    # intento no usado
+}
+
+# Subir si cambia el diseño: cambia las claves de cache y el ETag
+CARD_VERSION = 1
+
+
+def share_pattern(guesses_correct: list[bool]) -> str:
+    """Result pattern used in the card URL: one letter per guess, "g" correct / "r" wrong."""
+    return "".join("g" if correct else "r" for correct in guesses_correct)
+
+
+def is_valid_pattern(pattern: str, max_attempts: int) -> bool:
+    """Solved in N (N-1 "r" + "g") or failed (max_attempts "r"). Keeps the set of cards per day small."""
+    return bool(re.fullmatch(rf"r{{0,{max_attempts - 1}}}g|r{{{max_attempts}}}", pattern))
+
+
+def _font(size: int):
+    try:
+        return ImageFont.load_default(size=size)
+    except (TypeError, OSError):
+        # Pillow sin FreeType: fuente bitmap sin escalar
+        return ImageFont.load_default()
+
+
+def render_share_card(challenge_date: date, pattern: str, max_attempts: int, flag_bytes: bytes | None = None) -> bytes:
+    """
+    Renders the share card PNG: title, date, score, the result grid and, if given, the flag.
+    Depends only on its arguments, so callers can cache it by (date, pattern, flag shown).
+    """
+    width, height = CARD_SIZE
+    img = Image.new("RGB", CARD_SIZE, BACKGROUND)
+    draw = ImageDraw.Draw(img)
+
+    solved = pattern.endswith("g")
+    score = f"{len(pattern) if solved else 'X'}/{max_attempts}"
+
+    left = 80
+    draw.text((left, 70), "Bandera Diaria", font=_font(72), fill=TEXT_COLOR)
+    draw.text((left, 165), challenge_date.isoformat(), font=_font(40), fill=MUTED_COLOR)
+    draw.text((left, 240), score, font=_font(120), fill=TEXT_COLOR)
+
+    cell, gap = 90, 20
+    cells = pattern.ljust(max_attempts, "-")
+    y = height - 80 - cell
+    for i, kind in enumerate(cells):
+        x = left + i * (cell + gap)
+        draw.rounded_rectangle((x, y, x + cell, y + cell), radius=14, fill=CELL_COLORS[kind])
+
+    if flag_bytes:
+        flag = Image.open(BytesIO(flag_bytes)).convert("RGBA")
+        flag.thumbnail((460, 320))
+        fx = width - 80 - flag.width
+        fy = (height - flag.height) // 2
+        img.paste(flag, (fx, fy), flag)
+
+    out = BytesIO()
+    img.save(out, format="PNG", optimize=True)
+    return out.getvalue()